@@ -0,0 +1,482 @@
+"""Benchmarks for the psycho commands.
+
+The benchmarks run psycho as a user would, against generated projects with
+10, 100 and 500 dependencies. The dependencies are tiny wheels served from a
+local PEP 503 index, so no network access is needed once the build backend has
+been seeded into the index, and uploads go to a local stand-in for a package
+repository. Each step of a scenario is timed, along with the phases psycho
+records in its trace file, and the results are written as JSON, so runs for
+different releases can be compared. psycho must be importable by the
+interpreter running the benchmarks.
+
+    python benchmarks/bench.py run --output results.json
+    python benchmarks/bench.py compare before.json after.json
+"""
+
+import argparse
+import base64
+from hashlib import sha256
+import http.server
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import zipfile
+
+DEFAULT_SIZES = (10, 100, 500)
+
+# The interpreter which runs psycho.
+PSYCHO = [
+    sys.executable,
+    '-c',
+    'import sys; sys.argv[0] = "psycho"; from psycho import cli; cli()'
+]
+
+
+def _record_hash(data: bytes) -> str:
+    digest = base64.urlsafe_b64encode(sha256(data).digest()).rstrip(b'=')
+    return 'sha256=' + digest.decode('ascii')
+
+
+def _dependency_name(index: int) -> str:
+    return f"bench-dep-{index:04d}"
+
+
+def make_wheel(directory: Path, name: str, requires: Sequence[str]) -> Path:
+    """Write a tiny pure Python wheel."""
+    module = name.replace('-', '_')
+    dist_info = f"{module}-1.0.dist-info"
+    files = {
+        f"{module}/__init__.py": f"NAME = {name!r}\n".encode('utf-8'),
+        f"{dist_info}/METADATA": (
+            "Metadata-Version: 2.1\n"
+            f"Name: {name}\n"
+            "Version: 1.0\n" +
+            ''.join(f"Requires-Dist: {req}\n" for req in requires)
+        ).encode('utf-8'),
+        f"{dist_info}/WHEEL": (
+            "Wheel-Version: 1.0\n"
+            "Generator: psycho-benchmarks\n"
+            "Root-Is-Purelib: true\n"
+            "Tag: py3-none-any\n"
+        ).encode('utf-8'),
+    }
+    record = ''.join(
+        f"{path},{_record_hash(data)},{len(data)}\n"
+        for path, data in files.items()
+    ) + f"{dist_info}/RECORD,,\n"
+    files[f"{dist_info}/RECORD"] = record.encode('utf-8')
+
+    wheel = directory / f"{module}-1.0-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for path, data in files.items():
+            # A fixed timestamp keeps the wheels, and their hashes, the same.
+            info = zipfile.ZipInfo(path, date_time=(2020, 1, 1, 0, 0, 0))
+            info.external_attr = 0o644 << 16
+            archive.writestr(info, data)
+    return wheel
+
+
+def _write_index(files: Path, simple: Path) -> None:
+    projects: Dict[str, List[Path]] = {}
+    for wheel in sorted(files.glob('*.whl')):
+        name = wheel.name.split('-', 1)[0].replace('_', '-').lower()
+        projects.setdefault(name, []).append(wheel)
+
+    simple.mkdir(parents=True, exist_ok=True)
+    with open(simple / 'index.html', 'wt', encoding='utf-8') as fp:
+        fp.write('<!DOCTYPE html>\n<html><body>\n')
+        for name in projects:
+            fp.write(f'<a href="{name}/">{name}</a>\n')
+        fp.write('</body></html>\n')
+    for name, wheels in projects.items():
+        (simple / name).mkdir(exist_ok=True)
+        with open(simple / name / 'index.html', 'wt', encoding='utf-8') as fp:
+            fp.write('<!DOCTYPE html>\n<html><body>\n')
+            for wheel in wheels:
+                digest = sha256(wheel.read_bytes()).hexdigest()
+                fp.write(
+                    f'<a href="../../files/{wheel.name}#sha256={digest}">'
+                    f'{wheel.name}</a>\n'
+                )
+            fp.write('</body></html>\n')
+
+
+def make_index(root: Path, count: int, seed: Path) -> str:
+    """Create a PEP 503 index of generated dependencies, returning its URL.
+
+    Dependency i requires dependency (i - 1) // 2, so the dependencies form a
+    tree which the resolver has to walk. The wheels in the seed directory
+    (the build backend) are added to the index.
+    """
+    files = root / 'files'
+    files.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        requires = [_dependency_name((index - 1) // 2)] if index else []
+        make_wheel(files, _dependency_name(index), requires)
+    for wheel in seed.glob('*.whl'):
+        shutil.copy2(wheel, files / wheel.name)
+    _write_index(files, root / 'simple')
+    return (root / 'simple').as_uri()
+
+
+def seed_build_backend(directory: Path) -> None:
+    """Download the wheels needed to create and build the projects."""
+    directory.mkdir(parents=True, exist_ok=True)
+    if any(directory.glob('setuptools-*.whl')):
+        return
+    subprocess.check_call([
+        sys.executable, '-m', 'pip', 'download',
+        '--quiet',
+        '--only-binary', ':all:',
+        '--no-deps',
+        '--dest', str(directory),
+        'setuptools>=61.0',
+        'pip',
+    ])
+
+
+class _UploadHandler(http.server.BaseHTTPRequestHandler):
+    """Accepts uploads and discards them."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'OK')
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def start_upload_server() -> Tuple[http.server.ThreadingHTTPServer, str]:
+    """Start a local stand-in for a package repository."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _UploadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/legacy/"
+
+
+def _phases(trace: Path) -> Dict[str, float]:
+    # The total seconds of each kind of span in a trace file.
+    with open(trace, 'rt', encoding='utf-8') as fp:
+        events = json.load(fp)['traceEvents']
+    phases: Dict[str, float] = {}
+    for event in events:
+        phases[event['name']] = (
+            phases.get(event['name'], 0.0) + event['dur'] / 1_000_000
+        )
+    return phases
+
+
+def _run(
+        args: Sequence[str],
+        cwd: Path,
+        env: Dict[str, str],
+        log: Path
+) -> Dict[str, Any]:
+    # Run psycho, returning the wall time, the CPU time and peak memory of
+    # psycho and the processes it ran, and the time of each phase it traced.
+    fd, name = tempfile.mkstemp(suffix='.json', dir=log.parent)
+    os.close(fd)
+    trace = Path(name)
+    try:
+        with open(log, 'at', encoding='utf-8') as fp:
+            fp.write(f"$ psycho {' '.join(args)}\n")
+            fp.flush()
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [*PSYCHO, '--trace-file', str(trace), *args],
+                cwd=cwd,
+                env=env,
+                stdout=fp,
+                stderr=subprocess.STDOUT
+            )
+            _, status, usage = os.wait4(process.pid, 0)
+            seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, args)
+        phases = _phases(trace)
+    finally:
+        trace.unlink()
+    # ru_maxrss is in kilobytes on Linux, and bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'seconds': seconds,
+        'user_seconds': usage.ru_utime,
+        'system_seconds': usage.ru_stime,
+        'max_rss_bytes': usage.ru_maxrss * scale,
+        'phases': phases,
+    }
+
+
+def run_scenario(
+        workdir: Path,
+        count: int,
+        index_url: str,
+        upload_url: str,
+        env: Dict[str, str],
+        log: Path
+) -> List[Dict[str, Any]]:
+    """Run the steps for a project with the given number of dependencies."""
+    name = f"bench-{count}"
+    project = workdir / name
+    project.mkdir()
+    env = {**env, 'VIRTUAL_ENV': str(project / '.venv')}
+    dependencies = [_dependency_name(index) for index in range(count)]
+    removed = dependencies[count // 2:]
+
+    steps: List[Tuple[str, List[str]]] = [
+        ('init', [
+            'init',
+            '--name', name,
+            '--version', '0.1.0',
+            '--description', 'A benchmark project',
+            '--author', 'Benchmark',
+            '--email', 'benchmark@example.com',
+            '--create', 'local-venv',
+        ]),
+        ('install packages', ['install', '-i', index_url, *dependencies]),
+        ('install project', ['install', '-i', index_url]),
+        ('sync', ['sync', '-i', index_url]),
+        ('uninstall --prune', ['uninstall', '--prune', *removed]),
+        ('build', ['build']),
+        ('build cached', ['build']),
+        ('publish', [
+            'publish',
+            '--repository-url', upload_url,
+            '--username', 'benchmark',
+            '--password', 'benchmark',
+            '--non-interactive',
+            '--disable-progress-bar',
+        ]),
+    ]
+
+    results: List[Dict[str, Any]] = []
+    for step, args in steps:
+        measurement = _run(args, project, env, log)
+        results.append({'dependencies': count, 'step': step, **measurement})
+        print(
+            f"{count:>5} {step:<20} {measurement['seconds']:8.3f}s",
+            flush=True
+        )
+    return results
+
+
+def _summarize(runs: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # Take the median of each measurement over the repeats.
+    summary: List[Dict[str, Any]] = []
+    for results in zip(*runs):
+        row = {'dependencies': results[0]['dependencies'], 'step': results[0]['step']}
+        for key in ('seconds', 'user_seconds', 'system_seconds'):
+            row[key] = statistics.median(result[key] for result in results)
+        row['max_rss_bytes'] = max(result['max_rss_bytes'] for result in results)
+        row['phases'] = {
+            name: statistics.median(
+                result['phases'][name]
+                for result in results
+                if name in result['phases']
+            )
+            for name in sorted({
+                name for result in results for name in result['phases']
+            })
+        }
+        row['repeats'] = [result['seconds'] for result in results]
+        summary.append(row)
+    return summary
+
+
+def _psycho_version() -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version('psycho')
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def run(
+        sizes: Sequence[int],
+        repeat: int,
+        output: Path,
+        workdir: Optional[Path],
+        seed: Path,
+) -> None:
+    """Run the benchmarks and write the results."""
+    if workdir is not None:
+        workdir.mkdir(parents=True, exist_ok=True)
+    root = Path(tempfile.mkdtemp(prefix='psycho-bench-', dir=workdir))
+    server, upload_url = start_upload_server()
+    try:
+        seed_build_backend(seed)
+        index_url = make_index(root / 'index', max(sizes), seed)
+        log = root / 'bench.log'
+
+        # Isolate psycho and pip from the user's configuration and caches.
+        env = {
+            name: value
+            for name, value in os.environ.items()
+            if not name.startswith(('PIP_', 'PSYCHO_', 'TWINE_')) and
+            name != 'VIRTUAL_ENV'
+        }
+        env.update({
+            'PIP_CONFIG_FILE': os.devnull,
+            'PIP_INDEX_URL': index_url,
+            'PIP_DISABLE_PIP_VERSION_CHECK': '1',
+            'PSYCHO_CACHE_DIR': str(root / 'cache'),
+            'PSYCHO_NO_DAEMON': '1',
+        })
+
+        # Create the template venv, so init is measured with a warm cache.
+        warmup = root / 'warmup'
+        warmup.mkdir()
+        _run(
+            [
+                'init',
+                '--name', 'warmup',
+                '--version', '0.1.0',
+                '--description', 'Warm up',
+                '--author', 'Benchmark',
+                '--email', 'benchmark@example.com',
+                '--create', 'local-venv',
+            ],
+            warmup,
+            {**env, 'VIRTUAL_ENV': str(warmup / '.venv')},
+            log
+        )
+
+        runs: List[List[Dict[str, Any]]] = []
+        for attempt in range(repeat):
+            results: List[Dict[str, Any]] = []
+            for count in sizes:
+                workdir_attempt = root / f"run-{attempt}"
+                workdir_attempt.mkdir(exist_ok=True)
+                results += run_scenario(
+                    workdir_attempt,
+                    count,
+                    index_url,
+                    upload_url,
+                    env,
+                    log
+                )
+            runs.append(results)
+    finally:
+        server.shutdown()
+
+    document = {
+        'psycho': _psycho_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': _summarize(runs),
+    }
+    with open(output, 'wt', encoding='utf-8') as fp:
+        json.dump(document, fp, indent=2)
+    print(f"Wrote {output} (the log is {log})")
+
+
+def compare(before: Path, after: Path, threshold: float) -> int:
+    """Print the change in each measurement, returning 1 on a regression."""
+    with open(before, 'rt', encoding='utf-8') as fp:
+        old = {
+            (row['dependencies'], row['step']): row
+            for row in json.load(fp)['results']
+        }
+    with open(after, 'rt', encoding='utf-8') as fp:
+        new = json.load(fp)['results']
+
+    regressions = 0
+    print(f"{'deps':>5} {'step':<20} {'before':>9} {'after':>9} {'change':>8}")
+    for row in new:
+        previous = old.get((row['dependencies'], row['step']))
+        if previous is None:
+            continue
+        change = row['seconds'] / previous['seconds'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  regression'
+            regressions += 1
+        print(
+            f"{row['dependencies']:>5} {row['step']:<20} "
+            f"{previous['seconds']:8.3f}s {row['seconds']:8.3f}s "
+            f"{change:+8.1%}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark psycho.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks.")
+    run_parser.add_argument(
+        '--sizes',
+        default=','.join(map(str, DEFAULT_SIZES)),
+        help="The numbers of dependencies to benchmark, separated by commas."
+    )
+    run_parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help="The number of times to run each scenario. The median is kept."
+    )
+    run_parser.add_argument(
+        '--output',
+        type=Path,
+        default=Path('bench-results.json'),
+        help="The file to write the results to."
+    )
+    run_parser.add_argument(
+        '--workdir',
+        type=Path,
+        default=None,
+        help="The directory for the generated projects and index."
+    )
+    run_parser.add_argument(
+        '--seed',
+        type=Path,
+        default=Path(tempfile.gettempdir()) / 'psycho-bench-seed',
+        help="The directory the build backend wheels are downloaded to once."
+    )
+
+    compare_parser = commands.add_parser(
+        'compare',
+        help="Compare two sets of results."
+    )
+    compare_parser.add_argument('before', type=Path)
+    compare_parser.add_argument('after', type=Path)
+    compare_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help="The slow down which counts as a regression (default 0.1)."
+    )
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(
+            [int(size) for size in args.sizes.split(',')],
+            args.repeat,
+            args.output,
+            args.workdir,
+            args.seed
+        )
+        return 0
+    return compare(args.before, args.after, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
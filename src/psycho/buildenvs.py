@@ -0,0 +1,266 @@
+"""Code for reusable isolated build environments.
+
+The build package creates a new venv for every isolated build, and installs
+the build requirements into it, which often takes longer than the build. The
+environments here are kept in the user cache, keyed by every requirement
+installed into them and the interpreter of the active environment, and
+requirements are only installed when the versions in the environment do not
+satisfy them. An environment is recreated once it is a day old, so unpinned
+requirements pick up new releases.
+"""
+
+from contextlib import contextmanager
+from hashlib import sha256
+import importlib.metadata
+import json
+import os
+from pathlib import Path
+import shutil
+import sysconfig
+import time
+from typing import Collection, Dict, Iterator, List, Mapping, Optional, Set
+
+from build import ProjectBuilder
+from build.env import DefaultIsolatedEnv, IsolatedEnv
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from . import timings
+from .environment import python_version
+from .paths import make_venv_bin, user_cache_dir
+from .projects import load_pyproject
+from .running import find_python
+from .venvs import create_venv
+from .writing import locked
+
+# How long a build environment is used before it is recreated.
+BUILD_ENV_MAX_AGE = 24 * 60 * 60
+
+# The requirements of a project without a build-system table.
+DEFAULT_REQUIRES = ['setuptools >= 40.8.0']
+
+# Written to an environment when it has been created.
+_MARKER = '.psycho-build-env'
+
+
+def _env_dir(requires: Collection[str]) -> Path:
+    key = {
+        'requires': sorted(str(Requirement(req)) for req in requires),
+        'python': os.path.realpath(find_python()),
+        'version': python_version(),
+    }
+    digest = sha256(json.dumps(key, sort_keys=True).encode('utf-8'))
+    return user_cache_dir() / 'build-envs' / digest.hexdigest()[:32]
+
+
+class CachedIsolatedEnv(IsolatedEnv):
+    """A reusable isolated build environment."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # The environment may be for another interpreter than this one, so
+        # its site-packages is found rather than computed.
+        self.purelib = next(
+            (
+                str(found)
+                for pattern in ('lib/python*/site-packages', 'Lib/site-packages')
+                for found in path.glob(pattern)
+            ),
+            sysconfig.get_path(
+                'purelib',
+                vars={'base': str(path), 'platbase': str(path)}
+            )
+        )
+        self._distributions: Optional[
+            Dict[str, importlib.metadata.Distribution]
+        ] = None
+
+    @property
+    def python_executable(self) -> str:
+        return str(make_venv_bin(self.path) / 'python')
+
+    def make_extra_environ(self) -> Dict[str, str]:
+        scripts = str(make_venv_bin(self.path))
+        path = os.environ.get('PATH')
+        return {
+            'PATH': os.pathsep.join([scripts, path]) if path else scripts,
+            'PYTHONPATH': '',
+        }
+
+    def _installed(self) -> Dict[str, importlib.metadata.Distribution]:
+        if self._distributions is None:
+            self._distributions = {
+                canonicalize_name(dist.metadata['Name']): dist
+                for dist in importlib.metadata.distributions(
+                    path=[self.purelib]
+                )
+            }
+        return self._distributions
+
+    def _satisfied(
+            self,
+            requirement: str,
+            extra: str = '',
+            seen: Optional[Set[str]] = None
+    ) -> bool:
+        try:
+            req = Requirement(requirement)
+        except InvalidRequirement:
+            # A path or URL, which pip must install.
+            return False
+        if (
+                req.marker is not None and
+                not req.marker.evaluate({'extra': extra})
+        ):
+            return True
+        dist = self._installed().get(canonicalize_name(req.name))
+        if dist is None or not req.specifier.contains(
+                dist.version,
+                prereleases=True
+        ):
+            return False
+
+        # The requirements of any extras must be satisfied too.
+        seen = seen if seen is not None else set()
+        for name in req.extras:
+            key = f"{canonicalize_name(req.name)}[{name}]"
+            if key in seen:
+                continue
+            seen.add(key)
+            for dependency in dist.requires or []:
+                if not self._satisfied(dependency, name, seen):
+                    return False
+        return True
+
+    def missing(self, requirements: Collection[str]) -> List[str]:
+        """Return the requirements which the environment does not satisfy."""
+        return [req for req in requirements if not self._satisfied(req)]
+
+    def install(self, requirements: Collection[str]) -> None:
+        """Install the requirements, unless they are already satisfied.
+
+        All the requirements are passed to pip, so it resolves the missing
+        ones against those already installed.
+        """
+        if not self.missing(requirements):
+            return
+        with locked(self.path):
+            # Another build may have installed them while this one waited.
+            self._distributions = None
+            if not self.missing(requirements):
+                return
+            timings.check_call([
+                self.python_executable,
+                '-m', 'pip', 'install',
+                '--no-warn-script-location',
+                *requirements
+            ])
+            self._distributions = None
+
+
+def _generations(env_dir: Path) -> List[Path]:
+    # Complete environments, newest first.
+    if not env_dir.is_dir():
+        return []
+    return sorted(
+        (
+            path
+            for path in env_dir.iterdir()
+            if (path / _MARKER).is_file()
+        ),
+        key=lambda path: path.name,
+        reverse=True
+    )
+
+
+def find_build_env(requires: Collection[str]) -> Path:
+    """Return a build environment for the requirements, creating it if needed.
+
+    Older environments are removed once no build could still be using them.
+    """
+    env_dir = _env_dir(requires)
+    generations = _generations(env_dir)
+    now = time.time()
+    if generations:
+        age = now - os.path.getmtime(generations[0] / _MARKER)
+        if age <= BUILD_ENV_MAX_AGE:
+            return generations[0]
+
+    with locked(env_dir):
+        generations = _generations(env_dir)
+        if (
+                not generations or
+                now - os.path.getmtime(generations[0] / _MARKER) >
+                BUILD_ENV_MAX_AGE
+        ):
+            path = env_dir / f"{time.time_ns()}-{os.getpid()}"
+            with timings.span('create build environment'):
+                create_venv(path, find_python())
+            (path / _MARKER).write_text(str(now), encoding='utf-8')
+            generations.insert(0, path)
+
+        for old in generations[1:]:
+            if now - os.path.getmtime(old / _MARKER) > 2 * BUILD_ENV_MAX_AGE:
+                # Wait for any build still using it.
+                with locked(old):
+                    shutil.rmtree(old, ignore_errors=True)
+        return generations[0]
+
+
+def _build_system_requires(srcdir: str) -> List[str]:
+    pyproject_path = Path(srcdir) / 'pyproject.toml'
+    if not pyproject_path.is_file():
+        return DEFAULT_REQUIRES
+    build_system = load_pyproject(pyproject_path).get('build-system')
+    if build_system is None:
+        return DEFAULT_REQUIRES
+    return build_system.get('requires', [])
+
+
+@contextmanager
+def _cached_env(requires: Collection[str]) -> Iterator[CachedIsolatedEnv]:
+    # The requirements are installed under an exclusive lock, and a shared
+    # lock is held while the environment is used, so no install can change
+    # it during a build.
+    env = CachedIsolatedEnv(find_build_env(requires))
+    with timings.span('install build requirements'):
+        env.install(requires)
+    with locked(env.path, shared=True):
+        yield env
+
+
+@contextmanager
+def isolated_builder(
+        srcdir: str,
+        distribution: str,
+        config_settings: Mapping[str, str],
+        installer: Optional[str]
+) -> Iterator[ProjectBuilder]:
+    """Return a builder for a source tree in an isolated build environment.
+
+    The build requirements of the distribution are installed. The backend is
+    asked for them in the environment for the build system requirements, and
+    if that does not already satisfy them, the build uses the environment for
+    both sets, so an environment only has the requirements it is keyed by.
+    The uv installer makes its own environments, so it gets a new one.
+    """
+    if installer == 'uv':
+        with DefaultIsolatedEnv(installer='uv') as env:
+            builder = ProjectBuilder.from_isolated_env(env, srcdir)
+            with timings.span('install build requirements'):
+                env.install(builder.build_system_requires)
+                env.install(
+                    builder.get_requires_for_build(distribution, config_settings)
+                )
+            yield builder
+        return
+
+    requires = _build_system_requires(srcdir)
+    with _cached_env(requires) as env:
+        builder = ProjectBuilder.from_isolated_env(env, srcdir)
+        dynamic = builder.get_requires_for_build(distribution, config_settings)
+        if not env.missing(dynamic):
+            yield builder
+            return
+    with _cached_env([*requires, *sorted(dynamic)]) as env:
+        yield ProjectBuilder.from_isolated_env(env, srcdir)
@@ -1,17 +1,222 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
 import subprocess
 import sys
-from typing import Dict, Optional
+import tarfile
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import zipfile
+
+import click
+
+from . import running, timings
+from .environment import environment_tag
+from .indexing import file_digest
+from .normalizing import normalize
+from .projects import load_pyproject
+from .writing import make_dir
+
+BUILD_CACHE = Path('.psycho') / 'build-cache'
+BUILD_CACHE_SIZE = 20
+
+# Directories which never contain build inputs, such as the build outputs.
+_IGNORED_DIRS = frozenset((
+    '.git', '.hg', '.psycho', '.venv', 'venv', '.tox', '.nox', 'build', 'dist',
+    '__pycache__', '.mypy_cache', '.pytest_cache', '.ruff_cache'
+))
+
+# Files which are built, so are not in an sdist.
+_COMPILED_SUFFIXES = frozenset(('.so', '.pyd', '.dll', '.dylib', '.pyc'))
 
 
 def _build(
         *args: str
 ) -> None:
-    subprocess.check_call([
-        'python', "-m", "build", *args
+    timings.check_call([
+        running.find_python(), "-m", "build", *args
     ])
 
 
-def build_project(
+def can_build_in_process(
+        version: Optional[bool],
+        skip_dependency_check: Optional[bool],
+        no_isolation: Optional[bool],
+        installer: Optional[str] = None,
+) -> bool:
+    """Return True if the build can use the build API in this process."""
+    if running.get_backend() != 'in-process' or version:
+        return False
+    if running.find_python() == sys.executable:
+        return True
+    # The cached isolated environments are created from the interpreter of the
+    # active environment, but uv's are created from the running one. Without
+    # isolation the dependencies are checked against the running interpreter,
+    # so only an unchecked build can target another.
+    if no_isolation:
+        return bool(skip_dependency_check)
+    return installer != 'uv'
+
+
+@contextmanager
+def source_copy(srcdir: str) -> Iterator[str]:
+    """Copy the source files to a temporary directory.
+
+    A build from the copy cannot collide with a build from the source tree
+    over `build` or `*.egg-info`. The git directory is linked, so tools which
+    take the version from git still work.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        copy = os.path.join(tmpdir, os.path.basename(os.path.abspath(srcdir)))
+        os.makedirs(copy)
+        for name in _source_files(srcdir):
+            source = os.path.join(srcdir, name)
+            if not os.path.isfile(source):
+                continue
+            target = os.path.join(copy, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+        git_dir = os.path.join(srcdir, '.git')
+        if os.path.exists(git_dir):
+            try:
+                os.symlink(os.path.abspath(git_dir), os.path.join(copy, '.git'))
+            except OSError:
+                # Windows without the symlink privilege.
+                pass
+        yield copy
+
+
+def _build_one(
+        distribution: str,
+        outdir: str,
+        config_settings: Dict[str, str],
+        isolation: bool,
+        skip_dependency_check: bool,
+        installer: Optional[str]
+) -> str:
+    # The wheel is built from a copy of the source tree, as the sdist is
+    # being built from the tree at the same time.
+    with source_copy('.') if distribution == 'wheel' else nullcontext('.') \
+            as srcdir:
+        return running.build(
+            srcdir,
+            os.path.abspath(outdir),
+            [distribution],
+            config_settings,
+            isolation,
+            skip_dependency_check,
+            installer
+        )[0]
+
+
+def _sdist_files(sdist: str) -> List[str]:
+    with tarfile.open(sdist) as tar:
+        return [
+            member.name.split('/', 1)[1]
+            for member in tar.getmembers()
+            if member.isfile() and '/' in member.name
+        ]
+
+
+def _wheel_files(wheel: str) -> List[str]:
+    files: List[str] = []
+    with zipfile.ZipFile(wheel) as archive:
+        for name in archive.namelist():
+            top, _, rest = name.partition('/')
+            if top.endswith('.dist-info') or name.endswith('/'):
+                continue
+            if top.endswith('.data'):
+                # Only library files have a known place in the source tree.
+                scheme, _, name = rest.partition('/')
+                if scheme not in ('purelib', 'platlib'):
+                    continue
+            files.append(name)
+    return files
+
+
+def _package_root(sdist_files: Sequence[str], wheel_files: Sequence[str]) -> str:
+    # The directory of the sdist the packages are in, such as "src/", which
+    # is the prefix shared by the most wheel files.
+    counts: Dict[str, int] = {}
+    for path in sdist_files:
+        for name in wheel_files:
+            if path == name or path.endswith('/' + name):
+                root = path[:len(path) - len(name)]
+                counts[root] = counts.get(root, 0) + 1
+    return max(counts, key=lambda root: (counts[root], -len(root)), default='')
+
+
+def check_file_lists(sdist: str, wheel: str) -> None:
+    """Check the sdist and the wheel have the same package files.
+
+    The sdist paths are made relative to the directory the packages are in,
+    and the files under the wheel's top level packages and modules are
+    compared in both directions. Compiled files and caches are ignored. This
+    is guaranteed when the wheel is built from the sdist, but not when both
+    are built from the source tree.
+    """
+    def is_source(name: str) -> bool:
+        return (
+            os.path.splitext(name)[1] not in _COMPILED_SUFFIXES and
+            '__pycache__' not in name.split('/')
+        )
+
+    sdist_files = [name for name in _sdist_files(sdist) if is_source(name)]
+    wheel_files = [name for name in _wheel_files(wheel) if is_source(name)]
+    root = _package_root(sdist_files, wheel_files)
+    tops = {name.split('/', 1)[0] for name in wheel_files}
+    in_sdist = {
+        path[len(root):]
+        for path in sdist_files
+        if path.startswith(root) and path[len(root):].split('/', 1)[0] in tops
+    }
+    in_wheel = set(wheel_files)
+
+    errors = [
+        f"Files in {os.path.basename(first)} are not in "
+        f"{os.path.basename(second)}: {', '.join(sorted(missing))}"
+        for first, second, missing in (
+            (wheel, sdist, in_wheel - in_sdist),
+            (sdist, wheel, in_sdist - in_wheel),
+        )
+        if missing
+    ]
+    if errors:
+        raise ValueError('\n'.join(errors))
+
+
+def _build_in_parallel(
+        outdir: str,
+        config_settings: Dict[str, str],
+        isolation: bool,
+        skip_dependency_check: bool,
+        installer: Optional[str]
+) -> List[str]:
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(
+                timings.recorded,
+                timings.is_enabled(),
+                _build_one,
+                distribution,
+                outdir,
+                config_settings,
+                isolation,
+                skip_dependency_check,
+                installer
+            )
+            for distribution in ('sdist', 'wheel')
+        ]
+        sdist, wheel = [timings.worker_result(future) for future in futures]
+    check_file_lists(sdist, wheel)
+    return [sdist, wheel]
+
+
+def _run_build(
         version: Optional[bool],
         verbose: Optional[bool],
         sdist: Optional[bool],
@@ -20,9 +225,48 @@ def build_project(
         no_isolation: Optional[bool],
         config_settings: Dict[str, str],
         outdir: Optional[str],
-        installer: Optional[str]
+        installer: Optional[str],
+        parallel: Optional[bool] = None,
 ) -> None:
-    """Build the project."""
+    # The parallel build only applies when both distributions are built.
+    parallel = parallel and bool(sdist) == bool(wheel)
+
+    if can_build_in_process(
+            version,
+            skip_dependency_check,
+            no_isolation,
+            installer
+    ):
+        backend_settings = {
+            name: value if value is not None else ''
+            for name, value in config_settings.items()
+        }
+        if parallel:
+            _build_in_parallel(
+                outdir if outdir is not None else 'dist',
+                backend_settings,
+                not no_isolation,
+                bool(skip_dependency_check),
+                installer
+            )
+            return
+
+        distributions: List[str] = []
+        if sdist:
+            distributions.append('sdist')
+        if wheel:
+            distributions.append('wheel')
+        running.build(
+            '.',
+            outdir if outdir is not None else 'dist',
+            distributions,
+            backend_settings,
+            not no_isolation,
+            bool(skip_dependency_check),
+            installer
+        )
+        return
+
     args: list[str] = []
     if version:
         args += ["--version"]
@@ -46,4 +290,356 @@ def build_project(
     if installer is not None:
         args += ["--installer", installer]
 
+    if parallel:
+        # The wheel is built from a copy of the source tree, as the sdist is
+        # being built from the tree at the same time.
+        python = running.find_python()
+        directory = Path(outdir if outdir is not None else 'dist')
+        args = [
+            arg
+            for arg in args
+            if arg not in ("--sdist", "--wheel", "--outdir", outdir)
+        ] + ["--outdir", str(directory.absolute())]
+        with source_copy('.') as copy:
+            processes = [
+                subprocess.Popen([python, "-m", "build", *args, *options])
+                for options in (["--sdist"], ["--wheel", copy])
+            ]
+            codes = [timings.wait(process) for process in processes]
+        for code in codes:
+            if code != 0:
+                raise subprocess.CalledProcessError(
+                    code,
+                    [python, "-m", "build", *args]
+                )
+        check_file_lists(
+            str(max(directory.glob('*.tar.gz'), key=os.path.getmtime)),
+            str(max(directory.glob('*.whl'), key=os.path.getmtime))
+        )
+        return
+
     _build(*args)
+
+
+def _is_ignored_dir(name: str) -> bool:
+    return name in _IGNORED_DIRS or name.endswith('.egg-info')
+
+
+def _source_files(srcdir: str) -> List[str]:
+    try:
+        tracked, untracked = [
+            subprocess.check_output(
+                ['git', 'ls-files', '-z', *args],
+                cwd=srcdir,
+                stderr=subprocess.DEVNULL
+            ).decode('utf-8').split('\0')
+            for args in (['--cached'], ['--others', '--exclude-standard'])
+        ]
+        # Git only skips untracked build outputs when they are ignored.
+        files = [
+            name
+            for name in tracked
+            if name and not name.startswith('.psycho/')
+        ] + [
+            name
+            for name in untracked
+            if name and not any(
+                _is_ignored_dir(part) for part in name.split('/')[:-1]
+            )
+        ]
+    except (OSError, subprocess.CalledProcessError):
+        files = []
+        for root, dirs, names in os.walk(srcdir):
+            dirs[:] = [name for name in dirs if not _is_ignored_dir(name)]
+            files += [
+                os.path.relpath(os.path.join(root, name), srcdir)
+                for name in names
+            ]
+    return sorted(set(files))
+
+
+def fingerprint(srcdir: str, options: Dict[str, Any]) -> str:
+    """Return a digest of the build inputs.
+
+    The inputs are the source files (tracked by git, or untracked but neither
+    ignored nor build outputs), the build system requirements, the interpreter
+    and platform, and the build options.
+    """
+    pyproject = load_pyproject(Path(srcdir) / 'pyproject.toml')
+    requires = [
+        str(req)
+        for req in pyproject.get('build-system', {}).get('requires', [])
+    ]
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        {
+            'options': options,
+            'requires': requires,
+            'environment': environment_tag(),
+        },
+        sort_keys=True
+    ).encode('utf-8'))
+    for name in _source_files(srcdir):
+        path = os.path.join(srcdir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as fp:
+            file_digest = hashlib.sha256(fp.read()).digest()
+        digest.update(name.replace(os.sep, '/').encode('utf-8') + b'\0')
+        digest.update(file_digest)
+    return digest.hexdigest()
+
+
+def build_cache_entry(
+        sdist: Optional[bool],
+        wheel: Optional[bool],
+        no_isolation: Optional[bool],
+        config_settings: Dict[str, str],
+        parallel: Optional[bool],
+        epoch: Optional[int] = None,
+) -> Path:
+    """Return the build cache entry for the project in the current directory.
+
+    The entry is keyed by the fingerprint of the build inputs, and the
+    timestamp of a reproducible build.
+    """
+    options: Dict[str, Any] = {
+        'sdist': bool(sdist),
+        'wheel': bool(wheel),
+        'no_isolation': bool(no_isolation),
+        'config_settings': config_settings,
+        'parallel': bool(parallel),
+    }
+    if epoch is not None:
+        options['source_date_epoch'] = epoch
+    with timings.span('fingerprint sources'):
+        return BUILD_CACHE / fingerprint('.', options)
+
+
+def source_date_epoch(srcdir: str) -> int:
+    """Return the timestamp for a reproducible build.
+
+    This is SOURCE_DATE_EPOCH if it is set, otherwise the time of the last git
+    commit, or of the newest source file outside git.
+    """
+    if os.environ.get('SOURCE_DATE_EPOCH'):
+        return int(os.environ['SOURCE_DATE_EPOCH'])
+    try:
+        output = subprocess.check_output(
+            ['git', 'log', '-1', '--format=%ct'],
+            cwd=srcdir,
+            stderr=subprocess.DEVNULL
+        )
+        return int(output)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        pass
+    return int(max(
+        (
+            os.path.getmtime(os.path.join(srcdir, name))
+            for name in _source_files(srcdir)
+            if os.path.isfile(os.path.join(srcdir, name))
+        ),
+        default=0
+    ))
+
+
+@contextmanager
+def source_date_epoch_set(epoch: Optional[int]) -> Iterator[None]:
+    """Set SOURCE_DATE_EPOCH for the build backends, unless epoch is None."""
+    if epoch is None:
+        yield
+        return
+    previous = os.environ.get('SOURCE_DATE_EPOCH')
+    os.environ['SOURCE_DATE_EPOCH'] = str(epoch)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ['SOURCE_DATE_EPOCH']
+        else:
+            os.environ['SOURCE_DATE_EPOCH'] = previous
+
+
+def _check_reproduced(files: Sequence[Path], again: Sequence[Path]) -> None:
+    digests = {file.name: file_digest(str(file)) for file in files}
+    digests_again = {file.name: file_digest(str(file)) for file in again}
+    different = sorted(
+        name
+        for name in digests.keys() | digests_again.keys()
+        if digests.get(name) != digests_again.get(name)
+    )
+    if different:
+        raise ValueError(
+            f"The build is not reproducible: {', '.join(different)} differ"
+        )
+    for name, digest in sorted(digests.items()):
+        click.echo(f"Reproduced {name} sha256 {digest}")
+
+
+def store_in_cache(entry: Path, files: Sequence[Path]) -> None:
+    """Store the built files in a build cache entry."""
+    make_dir(entry.parent)
+    tmpdir = Path(tempfile.mkdtemp(dir=entry.parent))
+    for file in files:
+        shutil.copy2(file, tmpdir / file.name)
+    shutil.rmtree(entry, ignore_errors=True)
+    try:
+        os.replace(tmpdir, entry)
+    except OSError:
+        # Another build stored the same entry first.
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    entries = sorted(
+        (path for path in entry.parent.iterdir() if path.is_dir()),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True
+    )
+    for stale in entries[BUILD_CACHE_SIZE:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def build_project(
+        version: Optional[bool],
+        verbose: Optional[bool],
+        sdist: Optional[bool],
+        wheel: Optional[bool],
+        skip_dependency_check: Optional[bool],
+        no_isolation: Optional[bool],
+        config_settings: Dict[str, str],
+        outdir: Optional[str],
+        installer: Optional[str],
+        force: Optional[bool] = None,
+        parallel: Optional[bool] = None,
+        reproducible: Optional[bool] = None,
+        verify: Optional[bool] = None,
+) -> None:
+    """Build the project.
+
+    If the build inputs are unchanged since a previous build, its artifacts
+    are copied from the build cache instead, unless the build is forced.
+
+    A parallel build builds the sdist from the source tree and the wheel from
+    a copy of it at the same time, rather than building the wheel from the
+    sdist, and then checks they have the same package files.
+
+    A reproducible build sets SOURCE_DATE_EPOCH, and normalises the archives.
+    Verifying builds the project twice, and checks the artifacts are the same.
+    """
+    if version:
+        _run_build(
+            version,
+            verbose,
+            sdist,
+            wheel,
+            skip_dependency_check,
+            no_isolation,
+            config_settings,
+            outdir,
+            installer
+        )
+        return
+
+    target = Path(outdir if outdir is not None else 'dist')
+    epoch = source_date_epoch('.') if reproducible or verify else None
+    entry = build_cache_entry(
+        sdist,
+        wheel,
+        no_isolation,
+        config_settings,
+        parallel,
+        epoch
+    )
+
+    def build_into(directory: str) -> List[Path]:
+        with source_date_epoch_set(epoch):
+            _run_build(
+                version,
+                verbose,
+                sdist,
+                wheel,
+                skip_dependency_check,
+                no_isolation,
+                config_settings,
+                directory,
+                installer,
+                parallel
+            )
+        built = sorted(Path(directory).iterdir())
+        if epoch is not None:
+            with timings.span('normalize archives'):
+                for file in built:
+                    normalize(str(file), epoch)
+        return built
+
+    if not force and not verify and entry.is_dir():
+        target.mkdir(parents=True, exist_ok=True)
+        for file in sorted(entry.iterdir()):
+            shutil.copy2(file, target / file.name)
+            click.echo(f"Using cached {file.name}")
+        os.utime(entry)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = build_into(tmpdir)
+        if verify:
+            with tempfile.TemporaryDirectory() as again:
+                _check_reproduced(files, build_into(again))
+        store_in_cache(entry, files)
+        target.mkdir(parents=True, exist_ok=True)
+        for file in files:
+            shutil.copy2(file, target / file.name)
+
+
+def _build_wheel_from_sdist(
+        url: str,
+        sha256: str,
+        outdir: str,
+        index_args: Sequence[str]
+) -> str:
+    # pip downloads the sdist with the configured credentials, proxies and
+    # certificates, checks its hash, and builds it in isolation for the
+    # interpreter of the active environment.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        timings.check_call([
+            running.find_python(),
+            '-m', 'pip', 'wheel',
+            '--no-deps',
+            '--quiet',
+            '--wheel-dir', tmpdir,
+            *index_args,
+            f"{url.split('#', 1)[0]}#sha256={sha256}"
+        ])
+        wheel = next(Path(tmpdir).glob('*.whl'))
+        shutil.move(str(wheel), os.path.join(outdir, wheel.name))
+        return os.path.join(outdir, wheel.name)
+
+
+def build_wheels(
+        sdists: Sequence[Tuple[str, str]],
+        outdir: str,
+        index_args: Sequence[str] = ()
+) -> List[str]:
+    """Build wheels for sdists concurrently, with a process for each CPU.
+
+    The sdists are given as URL and sha256 pairs, and are built in isolation
+    with pip, for the interpreter of the active environment. The index
+    arguments are passed to pip, to find the build requirements.
+    """
+    if len(sdists) == 0:
+        return []
+
+    workers = min(len(sdists), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                timings.recorded,
+                timings.is_enabled(),
+                _build_wheel_from_sdist,
+                url,
+                sha256,
+                outdir,
+                list(index_args)
+            )
+            for url, sha256 in sdists
+        ]
+        return [timings.worker_result(future) for future in futures]
@@ -1,41 +1,119 @@
-"""Commands for the Psycho CLI."""
+"""Commands for the Psycho CLI.
+
+The modules which implement the commands are imported when the command runs,
+so the CLI starts quickly whichever command is used.
+"""
 
 import os
 from pathlib import Path
-import platform
-from typing import Literal, Optional, Sequence, Tuple
+import sys
+from typing import Any, List, Literal, Optional, Sequence, Tuple
 
 import click
 from click import Context
 
-from psycho.building import build_project
 from psycho.click_types import NAME_EQ_VALUE
-from psycho.dependencies import add_packages, remove_packages
-from psycho.environment import environment, location
-from psycho.initializing import (
-    initialize,
-    init_get_name,
-    init_get_author,
-    init_get_email
-)
 from psycho.paths import make_venv_bin
-from psycho.publishing import publish_project
-from psycho.uploading import upload_project
 
 
-@click.group()
+def _init_get_name() -> str:
+    from psycho.initializing import init_get_name
+    return init_get_name()
+
+
+def _init_get_author() -> str:
+    from psycho.initializing import init_get_author
+    return init_get_author()
+
+
+def _init_get_email() -> str:
+    from psycho.initializing import init_get_email
+    return init_get_email()
+
+
+def _start_timings(ctx: Context, trace_file: Optional[str]) -> None:
+    from psycho import timings
+
+    def report() -> None:
+        spans = timings.disable()
+        if trace_file is not None:
+            timings.write_trace(Path(trace_file), spans)
+        else:
+            timings.write_summary(sys.stderr, spans)
+
+    timings.enable()
+    # The command span closes before the report is written.
+    ctx.call_on_close(report)
+    ctx.with_resource(timings.span(f"psycho {ctx.invoked_subcommand}"))
+
+
+class _Group(click.Group):
+    """A group which keeps the arguments it was given, to forward them."""
+
+    def make_context(
+            self,
+            info_name: Optional[str],
+            args: List[str],
+            parent: Optional[Context] = None,
+            **extra: Any
+    ) -> Context:
+        argv = list(args)
+        ctx = super().make_context(info_name, args, parent, **extra)
+        ctx.meta['psycho.argv'] = argv
+        return ctx
+
+
+@click.group(cls=_Group)
 @click.option(
     "--project-file",
     default="pyproject.toml",
     help="The path to the project file.",
     type=click.Path()
 )
+@click.option(
+    "--backend",
+    default="in-process",
+    envvar="PSYCHO_BACKEND",
+    type=click.Choice(['in-process', 'subprocess']),
+    help="Run pip, build and twine in-process, or as subprocesses.",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    default=None,
+    envvar="PSYCHO_TIMINGS",
+    help="Print the time spent in each phase of the command, and in the processes it runs.",
+)
+@click.option(
+    "--trace-file",
+    default=None,
+    envvar="PSYCHO_TRACE_FILE",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timings as a Chrome trace to the file.",
+)
 @click.pass_context
-def cli(ctx: Context, project_file: str) -> None:
+def cli(
+        ctx: Context,
+        project_file: str,
+        backend: Literal['in-process', 'subprocess'],
+        timings: Optional[bool],
+        trace_file: Optional[str]
+) -> None:
     """Utilities for manageging pyproject.toml with pip, build and twine."""
 
+    if ctx.invoked_subcommand != 'daemon' and not ctx.resilient_parsing:
+        # Let a running daemon run the command, if there is one.
+        from psycho.daemon import forward
+        code = forward(ctx.meta['psycho.argv'])
+        if code is not None:
+            ctx.exit(code)
+
     ctx.ensure_object(dict)
     ctx.obj["PROJECT_FILE"] = Path(project_file)
+    os.environ['PSYCHO_BACKEND'] = backend
+
+    if (timings or trace_file) and not ctx.resilient_parsing:
+        _start_timings(ctx, trace_file)
 
     if 'VIRTUAL_ENV' in os.environ:
         # Ensure the virtual environment wins.
@@ -85,6 +163,30 @@ def cli(ctx: Context, project_file: str) -> None:
     type=str,
     help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
 )
+@click.option(
+    '--locked',
+    is_flag=True,
+    default=None,
+    help="Install the dependencies pinned in psycho.lock without resolving them, then the project as editable.",
+)
+@click.option(
+    '--prebuild-wheels',
+    is_flag=True,
+    default=None,
+    help="Build wheels for dependencies which only publish sdists in parallel, before installing.",
+)
+@click.option(
+    '--store',
+    is_flag=True,
+    default=None,
+    help="Hard link wheels into the virtual environment from a shared store of unpacked wheels, instead of copying them.",
+)
+@click.option(
+    '--offline',
+    is_flag=True,
+    default=None,
+    help="Only install from the project wheelhouse, without accessing an index.",
+)
 @click.pass_context
 def install(
         ctx: Context,
@@ -95,8 +197,13 @@ def install(
         upgrade: Optional[bool],
         index_url: Optional[str],
         extra_index_url: Optional[str],
+        locked: Optional[bool],
+        prebuild_wheels: Optional[bool],
+        store: Optional[bool],
+        offline: Optional[bool],
 ) -> None:
     """Add a package to the project."""
+    from psycho.dependencies import add_packages
     click.echo(f"Adding {packages}")
     project_file: Path = ctx.obj["PROJECT_FILE"]
     add_packages(
@@ -108,7 +215,108 @@ def install(
         upgrade,
         index_url,
         extra_index_url,
+        locked,
+        prebuild_wheels,
+        store,
+        offline,
+    )
+
+
+@cli.command(help="Lock the project dependencies.")
+@click.option(
+    '--pre',
+    'allow_prerelease',
+    is_flag=True,
+    default=None,
+    help="Include pre-release and development versions. By default, pip only finds stable versions.",
+)
+@click.option(
+    "-i",
+    "--index-url",
+    default=None,
+    type=str,
+    help="Base URL of the Python Package Index (default https://pypi.org/simple). This should point to a repository compliant with PEP 503 (the simple repository API) or a local directory laid out in the same format.",
+)
+@click.option(
+    "--extra-index-url",
+    default=None,
+    type=str,
+    help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
+)
+@click.pass_context
+def lock(
+        ctx: Context,
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+) -> None:
+    """Resolve the dependencies and write the lock file."""
+    from psycho.locking import lock_project
+    project_file: Path = ctx.obj["PROJECT_FILE"]
+    lock_file = lock_project(
+        project_file,
+        allow_prerelease,
+        index_url,
+        extra_index_url,
+    )
+    click.echo(f"Locked {lock_file}")
+
+
+@cli.command(help="Resolve the project dependencies, and cache the result for install.")
+@click.option(
+    "--optional",
+    'group',
+    default=None,
+    type=str,
+    help="Resolve the optional dependency group with the required dependencies.",
+)
+@click.option(
+    '--pre',
+    'allow_prerelease',
+    is_flag=True,
+    default=None,
+    help="Include pre-release and development versions. By default, pip only finds stable versions.",
+)
+@click.option(
+    "-i",
+    "--index-url",
+    default=None,
+    type=str,
+    help="Base URL of the Python Package Index (default https://pypi.org/simple). This should point to a repository compliant with PEP 503 (the simple repository API) or a local directory laid out in the same format.",
+)
+@click.option(
+    "--extra-index-url",
+    default=None,
+    type=str,
+    help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
+)
+@click.option(
+    '--offline',
+    is_flag=True,
+    default=None,
+    help="Only install from the project wheelhouse, without accessing an index.",
+)
+@click.pass_context
+def resolve(
+        ctx: Context,
+        group: Optional[str],
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool],
+) -> None:
+    """Resolve the dependencies and cache the result."""
+    from psycho.dependencies import resolve_project
+    project_file: Path = ctx.obj["PROJECT_FILE"]
+    count = resolve_project(
+        project_file,
+        group,
+        allow_prerelease,
+        index_url,
+        extra_index_url,
+        offline,
     )
+    click.echo(f"Resolved {count} distributions")
 
 
 @cli.command(help="Uninstall a package.")
@@ -119,23 +327,202 @@ def install(
     type=str,
     help="Add the package as an optional dependency (must specify option group name)."
 )
+@click.option(
+    '--prune',
+    is_flag=True,
+    default=None,
+    help="Also uninstall the distributions which were only needed by the removed packages."
+)
 @click.argument("packages", nargs=-1)
 @click.pass_context
 def uninstall(
         ctx: Context,
         group: Optional[str],
+        prune: Optional[bool],
         packages: Sequence[str]
 ) -> None:
     """Remove a package from the project."""
+    from psycho.dependencies import remove_packages
     click.echo(f"Removing {packages}")
     project_file: Path = ctx.obj["PROJECT_FILE"]
     remove_packages(
         project_file,
         group,
-        packages
+        packages,
+        prune
     )
 
 
+@cli.command(help="Download or build wheels for every project requirement.")
+@click.option(
+    '--pre',
+    'allow_prerelease',
+    is_flag=True,
+    default=None,
+    help="Include pre-release and development versions. By default, pip only finds stable versions.",
+)
+@click.option(
+    "-i",
+    "--index-url",
+    default=None,
+    type=str,
+    help="Base URL of the Python Package Index (default https://pypi.org/simple). This should point to a repository compliant with PEP 503 (the simple repository API) or a local directory laid out in the same format.",
+)
+@click.option(
+    "--extra-index-url",
+    default=None,
+    type=str,
+    help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
+)
+@click.pass_context
+def wheelhouse(
+        ctx: Context,
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+) -> None:
+    """Fill the project wheelhouse."""
+    from psycho.wheelhouse import fill_wheelhouse
+    project_file: Path = ctx.obj["PROJECT_FILE"]
+    path = fill_wheelhouse(
+        project_file,
+        allow_prerelease,
+        index_url,
+        extra_index_url,
+    )
+    click.echo(f"Wheelhouse {path}")
+
+
+@cli.command(help="Download the resolved project dependencies into a local package index.")
+@click.argument("directory", default=None, required=False, type=click.Path(file_okay=False))
+@click.option(
+    '--pre',
+    'allow_prerelease',
+    is_flag=True,
+    default=None,
+    help="Include pre-release and development versions. By default, pip only finds stable versions.",
+)
+@click.option(
+    "-i",
+    "--index-url",
+    default=None,
+    type=str,
+    help="Base URL of the Python Package Index (default https://pypi.org/simple). This should point to a repository compliant with PEP 503 (the simple repository API) or a local directory laid out in the same format.",
+)
+@click.option(
+    "--extra-index-url",
+    default=None,
+    type=str,
+    help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
+)
+@click.option(
+    "--serve",
+    is_flag=True,
+    default=None,
+    help="Serve the index over HTTP once it is up to date.",
+)
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    type=str,
+    help="The address to serve the index on. Use 0.0.0.0 to share it with other machines.",
+)
+@click.option(
+    "--port",
+    default=8080,
+    type=int,
+    help="The port to serve the index on.",
+)
+@click.pass_context
+def mirror(
+        ctx: Context,
+        directory: Optional[str],
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        serve: Optional[bool],
+        host: str,
+        port: int,
+) -> None:
+    """Mirror the project dependencies."""
+    from psycho.mirroring import mirror_project, serve_mirror
+    project_file: Path = ctx.obj["PROJECT_FILE"]
+    path = mirror_project(
+        project_file,
+        Path(directory) if directory is not None else None,
+        allow_prerelease,
+        index_url,
+        extra_index_url,
+    )
+    if serve:
+        serve_mirror(path, host, port)
+
+
+@cli.command(help="Synchronize the environment with the project.")
+@click.option(
+    "--optional",
+    'groups',
+    multiple=True,
+    type=str,
+    help="Include an optional dependency group. May be given more than once.",
+)
+@click.option(
+    '--exact',
+    is_flag=True,
+    default=None,
+    help="Uninstall distributions the project dependencies do not need.",
+)
+@click.option(
+    '--dry-run',
+    is_flag=True,
+    default=None,
+    help="Don’t actually install anything, just print what would be.",
+)
+@click.option(
+    "-i",
+    "--index-url",
+    default=None,
+    type=str,
+    help="Base URL of the Python Package Index (default https://pypi.org/simple). This should point to a repository compliant with PEP 503 (the simple repository API) or a local directory laid out in the same format.",
+)
+@click.option(
+    "--extra-index-url",
+    default=None,
+    type=str,
+    help="Extra URLs of package indexes to use in addition to --index-url. Should follow the same rules as --index-url.",
+)
+@click.option(
+    '--offline',
+    is_flag=True,
+    default=None,
+    help="Only install from the project wheelhouse, without accessing an index.",
+)
+@click.pass_context
+def sync(
+        ctx: Context,
+        groups: Sequence[str],
+        exact: Optional[bool],
+        dry_run: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool],
+) -> None:
+    """Synchronize the environment with the project."""
+    from psycho.syncing import sync_project
+    project_file: Path = ctx.obj["PROJECT_FILE"]
+    changed = sync_project(
+        project_file,
+        groups,
+        exact,
+        dry_run,
+        index_url,
+        extra_index_url,
+        offline,
+    )
+    if not changed:
+        click.echo("Environment is in sync")
+
+
 @cli.command(help="Build the project.")
 @click.option(
     '-V', '--version',
@@ -191,6 +578,32 @@ def uninstall(
     type=click.Path(exists=True),
     help="The path to the project file.",
 )
+@click.option(
+    '-f',
+    '--force',
+    is_flag=True,
+    default=None,
+    help="Build even if the build cache has artifacts for unchanged inputs."
+)
+@click.option(
+    '-p',
+    '--parallel',
+    is_flag=True,
+    default=None,
+    help="Build the sdist and the wheel from the source tree in parallel."
+)
+@click.option(
+    '--reproducible',
+    is_flag=True,
+    default=None,
+    help="Set SOURCE_DATE_EPOCH from the last git commit, and normalize the order, timestamps and permissions of the archive members."
+)
+@click.option(
+    '--verify',
+    is_flag=True,
+    default=None,
+    help="Build twice, and check the artifacts have the same digests. Implies --reproducible."
+)
 def build(
     version: Optional[bool],
     verbose: Optional[bool],
@@ -200,9 +613,14 @@ def build(
     no_isolation: Optional[bool],
     config_settings: Sequence[Tuple[str, str]],
     outdir: Optional[str],
-    installer: Optional[str]
+    installer: Optional[str],
+    force: Optional[bool],
+    parallel: Optional[bool],
+    reproducible: Optional[bool],
+    verify: Optional[bool]
 ) -> None:
     """Build the project."""
+    from psycho.building import build_project
     click.echo("Building")
     config_vars = {
         name: value
@@ -217,7 +635,120 @@ def build(
         no_isolation,
         config_vars,
         outdir,
-        installer
+        installer,
+        force,
+        parallel,
+        reproducible,
+        verify
+    )
+
+
+@cli.group(help="Work with every project under a directory.")
+def workspace() -> None:
+    """Work with every project under a directory."""
+
+
+@workspace.command(name="list", help="List the projects in build order.")
+@click.argument("root", default=".", type=click.Path(exists=True, file_okay=False))
+def workspace_list(root: str) -> None:
+    """List the projects in build order."""
+    from psycho.workspaces import build_order, dependency_graph, discover_projects
+    projects = discover_projects(Path(root))
+    graph = dependency_graph(projects)
+    for name in build_order(graph):
+        depends = ', '.join(sorted(graph[name]))
+        suffix = f" (needs {depends})" if depends else ""
+        click.echo(f"{name}: {projects[name]}{suffix}")
+
+
+@workspace.command(name="build", help="Build every project in dependency order.")
+@click.argument("root", default=".", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    '-s', '--sdist',
+    is_flag=True,
+    default=None,
+    help="build a source distribution (disables the default behavior)"
+)
+@click.option(
+    '-w',
+    '--wheel',
+    is_flag=True,
+    default=None
+)
+@click.option(
+    '-x',
+    '--skip-dependency-check',
+    is_flag=True,
+    default=None
+)
+@click.option(
+    '-n',
+    '--no-isolation',
+    is_flag=True,
+    default=None
+)
+@click.option(
+    '-C', '--config-setting', 'config_settings',
+    multiple=True,
+    type=NAME_EQ_VALUE,
+    help="settings to pass to the backend. Multiple settings can be provided."
+)
+@click.option(
+    "--installer",
+    default=None,
+    type=str,
+    help="Python package installer to use (defaults to pip)"
+)
+@click.option(
+    "-o", "--outdir",
+    default=None,
+    type=click.Path(),
+    help="The directory for the artifacts of every project [default: ROOT/dist].",
+)
+@click.option(
+    '-f',
+    '--force',
+    is_flag=True,
+    default=None,
+    help="Build even if the build cache has artifacts for unchanged inputs."
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=None,
+    type=click.IntRange(min=1),
+    help="The number of projects to build at once [default: the number of CPUs].",
+)
+def workspace_build(
+    root: str,
+    sdist: Optional[bool],
+    wheel: Optional[bool],
+    skip_dependency_check: Optional[bool],
+    no_isolation: Optional[bool],
+    config_settings: Sequence[Tuple[str, str]],
+    outdir: Optional[str],
+    installer: Optional[str],
+    force: Optional[bool],
+    jobs: Optional[int]
+) -> None:
+    """Build every project in dependency order."""
+    from psycho.workspaces import build_workspace
+    click.echo("Building workspace")
+    config_vars = {
+        name: value
+        for name, value in config_settings
+    }
+    build_workspace(
+        Path(root),
+        sdist,
+        wheel,
+        skip_dependency_check,
+        no_isolation,
+        config_vars,
+        outdir,
+        installer,
+        force,
+        jobs
     )
 
 
@@ -317,6 +848,20 @@ def build(
     default=None,
     help="Disable the progress bar."
 )
+@click.option(
+    '-j',
+    '--jobs',
+    default=4,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="The number of files to upload at the same time."
+)
+@click.option(
+    "--index-url",
+    default=None,
+    type=str,
+    help="The simple index of the repository, used with --skip-existing to skip files it already has without uploading them. Known for PyPI and TestPyPI."
+)
 def upload(
         files: Sequence[str],
         repository: Optional[str],
@@ -334,8 +879,11 @@ def upload(
         client_cert: Optional[str],
         verbose: Optional[bool],
         disable_progress_bar: Optional[bool],
+        jobs: int,
+        index_url: Optional[str],
 ) -> None:
     """Build the project."""
+    from psycho.uploading import upload_project
     upload_project(
         repository,
         repository_url,
@@ -352,7 +900,9 @@ def upload(
         client_cert,
         verbose,
         disable_progress_bar,
-        *files
+        *files,
+        jobs=jobs,
+        index_url=index_url
     )
 
 
@@ -487,6 +1037,32 @@ def upload(
     default=None,
     help="Disable the progress bar."
 )
+@click.option(
+    '--parallel',
+    is_flag=True,
+    default=None,
+    help="Build the sdist and the wheel from the source tree in parallel."
+)
+@click.option(
+    '-j',
+    '--jobs',
+    default=4,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="The number of files to upload at the same time."
+)
+@click.option(
+    "--index-url",
+    default=None,
+    type=str,
+    help="The simple index of the repository, used with --skip-existing to skip files it already has without uploading them. Known for PyPI and TestPyPI."
+)
+@click.option(
+    '--reproducible',
+    is_flag=True,
+    default=None,
+    help="Set SOURCE_DATE_EPOCH from the last git commit, and normalize the order, timestamps and permissions of the archive members."
+)
 def publish(
         sdist: Optional[bool],
         wheel: Optional[bool],
@@ -509,8 +1085,13 @@ def publish(
         client_cert: Optional[str],
         verbose: Optional[bool],
         disable_progress_bar: Optional[bool],
+        parallel: Optional[bool],
+        jobs: int,
+        index_url: Optional[str],
+        reproducible: Optional[bool],
 ) -> None:
     """Build the project."""
+    from psycho.publishing import publish_project
     click.echo("Publishing")
     config_vars = {
         name: value
@@ -538,6 +1119,10 @@ def publish(
         client_cert,
         verbose,
         disable_progress_bar,
+        parallel,
+        jobs,
+        index_url,
+        reproducible,
     )
 
 
@@ -547,7 +1132,7 @@ def publish(
     type=str,
     required=True,
     prompt=True,
-    default=init_get_name,
+    default=_init_get_name,
     help="Name"
 )
 @click.option(
@@ -569,14 +1154,14 @@ def publish(
     "--author",
     type=str,
     prompt=True,
-    default=init_get_author,
+    default=_init_get_author,
     help="Author"
 )
 @click.option(
     "--email",
     type=str,
     prompt=True,
-    default=init_get_email,
+    default=_init_get_email,
     help="Author"
 )
 @click.option(
@@ -596,6 +1181,7 @@ def init(
         create: Optional[Literal['local-venv']]
 ) -> None:
     """Remove a package from the project."""
+    from psycho.initializing import initialize
     click.echo(f"Initializing {name}")
     project_file: Path = ctx.obj["PROJECT_FILE"]
     initialize(
@@ -612,6 +1198,7 @@ def init(
 @cli.command(help="Show the environment variables.")
 def env() -> None:
     """Remove a package from the project."""
+    from psycho.environment import environment
     dct = environment()
     for name, value in dct.items():
         click.echo(f"{name}='{value}'")
@@ -621,6 +1208,7 @@ def env() -> None:
 @click.argument("exe", required=True)
 def which(exe: str) -> None:
     """Remove a package from the project."""
+    from psycho.environment import location
     path = location(exe)
     if path is None:
         click.echo(f"{exe} not found")
@@ -628,5 +1216,22 @@ def which(exe: str) -> None:
         click.echo(f"{exe}: {path}")
 
 
+@cli.command(help="Run commands in a long lived process, which other psycho commands forward to.")
+@click.option(
+    '--stop',
+    is_flag=True,
+    default=None,
+    help="Stop the running daemon."
+)
+def daemon(stop: Optional[bool]) -> None:
+    """Run the psycho daemon."""
+    from psycho import daemon as psycho_daemon
+    if stop:
+        if not psycho_daemon.stop():
+            click.echo("The daemon is not running")
+        return
+    psycho_daemon.serve()
+
+
 if __name__ == "__main__":
     cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,277 @@
+"""Code for the psycho daemon.
+
+The daemon runs commands for clients in a long lived process, so the imports,
+the pip workers and the in-memory caches are kept warm between commands. A
+client sends its stdin, stdout and stderr over a Unix socket, followed by its
+arguments, environment and working directory, and the daemon runs the command
+with them and replies with the exit code. Commands are run one at a time.
+When the client is interrupted it tells the daemon, which interrupts the
+command and the processes it started.
+
+This module is imported by every command, so it only imports the standard
+library modules it needs to forward a command.
+"""
+
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+# True in the daemon, which runs commands rather than forwarding them.
+serving = False
+
+# Sent by a client to interrupt its command.
+_INTERRUPT = b'\x03'
+
+# True while the daemon runs a command.
+_running = False
+
+# The interrupts sent to the daemon for clients, which are ignored if their
+# command has already finished.
+_client_interrupts = 0
+
+
+def socket_path() -> Path:
+    """Return the path of the daemon socket.
+
+    This can be set with the PSYCHO_DAEMON_SOCKET environment variable.
+    """
+    if 'PSYCHO_DAEMON_SOCKET' in os.environ:
+        return Path(os.environ['PSYCHO_DAEMON_SOCKET'])
+    if 'XDG_RUNTIME_DIR' in os.environ:
+        return Path(os.environ['XDG_RUNTIME_DIR']) / 'psycho.sock'
+    from .paths import user_cache_dir
+    return user_cache_dir() / 'daemon.sock'
+
+
+def is_supported() -> bool:
+    """Return True if the platform can pass file descriptors over a socket."""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def _connect() -> Optional[socket.socket]:
+    path = socket_path()
+    if not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        # The daemon is not running, and left its socket behind.
+        sock.close()
+        return None
+    return sock
+
+
+def _request(sock: socket.socket, request: Dict[str, Any]) -> int:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    socket.send_fds(sock, [b'\0'], [0, 1, 2])
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    with sock.makefile('rb') as fp:
+        while True:
+            try:
+                reply = fp.readline()
+                break
+            except KeyboardInterrupt:
+                # Interrupt the command, and wait for it to stop.
+                sock.sendall(_INTERRUPT)
+    if not reply:
+        raise ConnectionError("The psycho daemon closed the connection")
+    return int(json.loads(reply))
+
+
+def forward(argv: Sequence[str]) -> Optional[int]:
+    """Run a command in the daemon, if it is running.
+
+    Returns the exit code of the command, or None if it was not forwarded.
+    """
+    if serving or not is_supported() or os.environ.get('PSYCHO_NO_DAEMON'):
+        return None
+    sock = _connect()
+    if sock is None:
+        return None
+    with sock:
+        return _request(sock, {
+            'argv': list(argv),
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+        })
+
+
+def stop() -> bool:
+    """Stop the daemon. Returns False if it was not running."""
+    sock = _connect()
+    if sock is None:
+        return False
+    with sock:
+        _request(sock, {'argv': None})
+    return True
+
+
+def _run(argv: List[str]) -> int:
+    import click
+
+    from .commands import cli
+
+    try:
+        cli.main(argv, prog_name='psycho', standalone_mode=False)
+    except click.exceptions.Exit as error:
+        return error.exit_code
+    except click.ClickException as error:
+        error.show()
+        return error.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except SystemExit as error:
+        code = error.code
+        return code if isinstance(code, int) else int(bool(code))
+    except Exception:  # pylint: disable=broad-except
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def _on_interrupt(signum: int, frame: Any) -> None:
+    global _client_interrupts  # pylint: disable=global-statement
+    if _client_interrupts:
+        _client_interrupts -= 1
+        if not _running:
+            return
+    raise KeyboardInterrupt
+
+
+def _watch(conn: socket.socket) -> None:
+    # Interrupt the daemon's process group, which has the processes the
+    # command started, when the client is interrupted.
+    global _client_interrupts  # pylint: disable=global-statement
+    while True:
+        try:
+            data = conn.recv(1)
+        except OSError:
+            return
+        if data != _INTERRUPT:
+            return
+        if _running:
+            _client_interrupts += 1
+            os.killpg(os.getpgrp(), signal.SIGINT)
+
+
+def _handle(conn: socket.socket) -> bool:
+    # Run one command. Returns False if the daemon should stop.
+    global _running  # pylint: disable=global-statement
+    import threading
+
+    from . import running
+
+    _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+    try:
+        with conn.makefile('rb') as fp:
+            request = json.loads(fp.readline())
+        if request['argv'] is None:
+            conn.sendall(b'0\n')
+            return False
+
+        saved_fds = [os.dup(fd) for fd in range(3)]
+        saved_env = dict(os.environ)
+        saved_cwd = os.getcwd()
+        try:
+            for fd, client_fd in enumerate(fds):
+                os.dup2(client_fd, fd)
+            os.environ.clear()
+            os.environ.update(request['env'])
+            os.chdir(request['cwd'])
+            running.redirect_pip_workers()
+            watcher = threading.Thread(target=_watch, args=(conn,))
+            _running = True
+            watcher.start()
+            try:
+                code = _run(request['argv'])
+            finally:
+                _running = False
+                conn.shutdown(socket.SHUT_RD)
+                watcher.join()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, saved_fd in enumerate(saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(saved_cwd)
+            running.redirect_pip_workers()
+        conn.sendall(json.dumps(code).encode('utf-8') + b'\n')
+        return True
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def _preload() -> None:
+    # Import the modules the commands use, so the first command is fast.
+    import packaging.requirements  # noqa: F401
+    import tomlkit  # noqa: F401
+
+    from . import (  # noqa: F401
+        building,
+        dependencies,
+        locking,
+        syncing,
+        uploading,
+        workspaces,
+    )
+
+
+def serve() -> None:
+    """Run commands for clients until the daemon is stopped."""
+    global serving  # pylint: disable=global-statement
+
+    if not is_supported():
+        raise RuntimeError("The daemon needs Unix sockets which can pass files")
+
+    path = socket_path()
+    if _connect() is not None:
+        raise RuntimeError(f"The psycho daemon is already running on {path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+
+    _preload()
+    serving = True
+
+    import click
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, _on_interrupt)
+    if os.getpgrp() != os.getpid():
+        # Lead a process group, so a command can be interrupted with the
+        # processes it started, without the processes which started the
+        # daemon.
+        os.setpgrp()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        umask = os.umask(0o077)
+        try:
+            server.bind(str(path))
+        finally:
+            os.umask(umask)
+        server.listen()
+        click.echo(f"Listening on {path}")
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    try:
+                        if not _handle(conn):
+                            break
+                    except (OSError, ValueError) as error:
+                        click.echo(f"Request failed: {error}", err=True)
+        finally:
+            path.unlink(missing_ok=True)
+            serving = False
@@ -1,36 +1,69 @@
 """Code for adding packages"""
 
 from pathlib import Path
-import subprocess
-import sys
-from typing import cast, Dict, List, Literal, Optional, Sequence
-
+import tempfile
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    TYPE_CHECKING,
+)
+
+import click
 from packaging.requirements import Requirement
-from tomlkit import table, array
-from tomlkit.items import Table, Array
-
-from .projects import read_pyproject, write_pyproject, ensure_project
+from packaging.utils import canonicalize_name
+
+from . import running
+from .building import build_wheels
+from .environment import installed_distributions, marker_environment
+from .locking import install_locked, install_pinned
+from .projects import (
+    ensure_project,
+    load_pyproject,
+    read_dependencies,
+    read_pyproject,
+    write_pyproject,
+)
+from .resolving import (
+    cached_resolution,
+    pins,
+    resolve,
+    resolve_and_cache,
+    sdists,
+)
+from .store import link_requirements
+from .syncing import PROTECTED, check_requirements
+from .wheelhouse import wheelhouse_args
+from .writing import locked
+
+if TYPE_CHECKING:
+    from tomlkit.items import Table
 
 
 def _pip(
         command: Literal['install', 'uninstall'],
-        requirement: Requirement,
+        requirements: Sequence[Requirement],
         *args: str
 ) -> None:
-    subprocess.check_call([
-        'python', "-m", "pip", command, *args, str(requirement)
-    ])
+    running.pip(command, *args, *map(str, requirements))
 
 
 def _pip_install_project(args: List[str]) -> None:
-    subprocess.check_call([
-        'python', "-m", "pip", 'install', '--editable', '.', *args
-    ])
+    running.pip('install', '--editable', '.', *args)
 
 
 def _read_required_dependency_requirements(
-        project: Table
+        project: 'Table'
 ) -> Dict[str, Requirement]:
+    from tomlkit import array
+    from tomlkit.items import Array
+
     if 'dependencies' not in project:
         project['dependencies'] = array()
     dependencies = project["dependencies"]
@@ -41,15 +74,17 @@ def _read_required_dependency_requirements(
         for dep in dependencies
     ]
     return {
-        req.name: req
+        canonicalize_name(req.name): req
         for req in requirements
     }
 
 
 def _recreate_required_dependency_requirements(
-        project: Table,
+        project: 'Table',
         requirements: Dict[str, Requirement]
 ) -> None:
+    from tomlkit import array
+
     dependencies = array()
     for req in requirements.values():
         dependencies.append(str(req))
@@ -57,9 +92,12 @@ def _recreate_required_dependency_requirements(
 
 
 def _read_optional_dependency_requirements(
-        project: Table,
+        project: 'Table',
         group: str
 ) -> Dict[str, Requirement]:
+    from tomlkit import array, table
+    from tomlkit.items import Array, Table
+
     if 'optional-dependencies' not in project:
         project['optional-dependencies'] = table()
     optional_dependencies = project["optional-dependencies"]
@@ -75,20 +113,22 @@ def _read_optional_dependency_requirements(
         for dep in dependencies
     ]
     return {
-        req.name: req
+        canonicalize_name(req.name): req
         for req in requirements
     }
 
 
 def _recreate_optional_dependency_requirements(
-        project: Table,
+        project: 'Table',
         group: str,
         requirements: Dict[str, Requirement]
 ) -> None:
+    from tomlkit import array
+
     dependencies = array()
     for req in requirements.values():
         dependencies.append(str(req))
-    optional_dependencies = cast(Table, project['optional-dependencies'])
+    optional_dependencies = cast('Table', project['optional-dependencies'])
     if len(dependencies) > 0:
         optional_dependencies[group] = dependencies.multiline(True)
     else:
@@ -97,6 +137,64 @@ def _recreate_optional_dependency_requirements(
             del project['optional-dependencies']
 
 
+def _declared_requirements(
+        project_path: Path,
+        group: Optional[str]
+) -> List[str]:
+    dependencies, optional_dependencies = read_dependencies(
+        load_pyproject(project_path)
+    )
+    if group is None:
+        return dependencies
+    if group not in optional_dependencies:
+        raise KeyError(f"Optional dependency group {group} does not exist")
+    return dependencies + optional_dependencies[group]
+
+
+def _resolve_args(
+        project_path: Path,
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool] = None,
+) -> List[str]:
+    args: List[str] = []
+    if allow_prerelease:
+        args += ['--pre']
+    return args + wheelhouse_args(
+        project_path,
+        index_url,
+        extra_index_url,
+        offline
+    )
+
+
+def resolve_project(
+        project_path: Path,
+        group: Optional[str],
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool] = None,
+) -> int:
+    """Resolve the project requirements, and cache the result for install.
+
+    Returns the number of distributions resolved.
+    """
+    installs = resolve_and_cache(
+        project_path,
+        _declared_requirements(project_path, group),
+        _resolve_args(
+            project_path,
+            allow_prerelease,
+            index_url,
+            extra_index_url,
+            offline
+        )
+    )
+    return len(installs)
+
+
 def add_packages(
         project_path: Path,
         packages: Sequence[str],
@@ -106,6 +204,10 @@ def add_packages(
         upgrade: Optional[bool],
         index_url: Optional[str],
         extra_index_url: Optional[str],
+        locked: Optional[bool] = None,
+        prebuild_wheels: Optional[bool] = None,
+        store: Optional[bool] = None,
+        offline: Optional[bool] = None,
 ) -> None:
     args: List[str] = []
     if allow_prerelease:
@@ -114,81 +216,201 @@ def add_packages(
         args += ['--dry-run']
     if upgrade:
         args += ['--upgrade']
-    if index_url:
-        args += ['--index-url', index_url]
-    if extra_index_url:
-        args += ['--extra-index-url', extra_index_url]
+    args += wheelhouse_args(project_path, index_url, extra_index_url, offline)
+
+    if locked:
+        if len(packages) > 0:
+            raise ValueError("Packages cannot be added from the lock file")
+        install_locked(project_path, group, args)
+        return
 
+    if len(packages) == 0 and not (
+            dry_run or upgrade or prebuild_wheels or store
+    ):
+        # Install what a previous psycho resolve pinned, without resolving.
+        installs = cached_resolution(
+            project_path,
+            _declared_requirements(project_path, group),
+            _resolve_args(
+                project_path,
+                allow_prerelease,
+                index_url,
+                extra_index_url,
+                offline
+            )
+        )
+        if installs is not None:
+            install_pinned(project_path, pins(installs), args)
+            return
+
+    if prebuild_wheels:
+        # Build the wheels of any dependencies which only have sdists in
+        # parallel, and let pip find them instead of building them in turn.
+        with tempfile.TemporaryDirectory() as wheel_dir:
+            installs = resolve(
+                list(packages) or ['--editable', '.'],
+                *args,
+                ignore_installed=False
+            )
+            build_wheels(
+                sdists(installs),
+                wheel_dir,
+                wheelhouse_args(
+                    project_path,
+                    index_url,
+                    extra_index_url,
+                    offline
+                )
+            )
+            _add_packages(
+                project_path,
+                packages,
+                group,
+                [*args, '--find-links', wheel_dir],
+                store
+            )
+    else:
+        _add_packages(project_path, packages, group, args, store)
+
+
+def _add_packages(
+        project_path: Path,
+        packages: Sequence[str],
+        group: Optional[str],
+        args: List[str],
+        store: Optional[bool] = None
+) -> None:
     # Special case for no packages - install the project as editable.
     if len(packages) == 0:
+        if store:
+            link_requirements(['--editable', '.'], args)
         _pip_install_project(args)
         return
 
-    pyproject = read_pyproject(project_path)
-    project = ensure_project(pyproject)
-    current_requirements = _read_required_dependency_requirements(
-        project
-    ) if not group else _read_optional_dependency_requirements(
-        project,
-        group
-    )
+    # Fail on an invalid project file before anything is installed.
+    load_pyproject(project_path)
 
     requirements = [Requirement(pkg) for pkg in packages]
 
-    for req in requirements:
-        if req.name in current_requirements:
-            _pip('uninstall', req, '-y')
+    # Resolve and install the whole set at once. Requirements which are
+    # already declared are replaced in place, so pip sees the new specifier
+    # and changes the installed version only when it must. Wheels linked from
+    # the store are already installed when pip runs.
+    if store:
+        link_requirements([str(req) for req in requirements], args)
+    _pip('install', requirements, *args)
 
-        _pip('install', req, *args)
+    def add(current_requirements: Dict[str, Requirement]) -> None:
+        for req in requirements:
+            current_requirements[canonicalize_name(req.name)] = req
 
-        current_requirements[req.name] = req
+    _update_requirements(project_path, group, add)
 
-    if group is None:
-        _recreate_required_dependency_requirements(
-            project,
-            current_requirements
-        )
-    else:
-        _recreate_optional_dependency_requirements(
+
+def _update_requirements(
+        project_path: Path,
+        group: Optional[str],
+        update: Callable[[Dict[str, Requirement]], None]
+) -> None:
+    # The file is read again while it is locked, so changes made by another
+    # process while pip was running are kept.
+    with locked(project_path):
+        pyproject = read_pyproject(project_path)
+        project = ensure_project(pyproject)
+        current_requirements = _read_required_dependency_requirements(
+            project
+        ) if not group else _read_optional_dependency_requirements(
             project,
-            group,
-            current_requirements
+            group
         )
 
-    write_pyproject(project_path, pyproject)
+        update(current_requirements)
+
+        if group is None:
+            _recreate_required_dependency_requirements(
+                project,
+                current_requirements
+            )
+        else:
+            _recreate_optional_dependency_requirements(
+                project,
+                group,
+                current_requirements
+            )
+
+        write_pyproject(project_path, pyproject)
 
 
 def remove_packages(
         project_path: Path,
         group: Optional[str],
-        packages: Sequence[str]
+        packages: Sequence[str],
+        prune: Optional[bool] = None
 ) -> None:
-    pyproject = read_pyproject(project_path)
-    project = ensure_project(pyproject)
-    current_requirements = _read_required_dependency_requirements(
-        project
-    ) if not group else _read_optional_dependency_requirements(
-        project,
-        group
-    )
+    """Remove packages from the project, and uninstall them in one pip call.
+
+    With prune, the distributions which were only needed by the removed
+    packages are uninstalled too.
+    """
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    declared = {
+        canonicalize_name(Requirement(dep).name)
+        for dep in (
+            dependencies if not group
+            else optional_dependencies.get(group, [])
+        )
+    }
 
     requirements = [Requirement(pkg) for pkg in packages]
 
     for req in requirements:
-        if req.name not in current_requirements:
+        if canonicalize_name(req.name) not in declared:
             raise KeyError(f"Dependency {req} does not exist")
 
-        _pip('uninstall', req, '-y')
-        del current_requirements[req.name]
+    to_uninstall = list(requirements)
+    if prune:
+        orphans = _orphans(pyproject, group, requirements)
+        if orphans:
+            click.echo(f"Pruning {', '.join(orphans)}")
+        to_uninstall += [Requirement(name) for name in orphans]
 
-    if group is None:
-        _recreate_required_dependency_requirements(
-            project, current_requirements)
-    else:
-        _recreate_optional_dependency_requirements(
-            project,
-            group,
-            current_requirements
-        )
+    _pip('uninstall', to_uninstall, '-y')
+
+    def remove(current_requirements: Dict[str, Requirement]) -> None:
+        for req in requirements:
+            current_requirements.pop(canonicalize_name(req.name), None)
+
+    _update_requirements(project_path, group, remove)
 
-    write_pyproject(project_path, pyproject)
+
+def _orphans(
+        pyproject: Mapping[str, Any],
+        group: Optional[str],
+        removed: Sequence[Requirement]
+) -> List[str]:
+    # The installed distributions the removed requirements need, which are
+    # not needed by the requirements which remain in any group. The installed
+    # project is not used, as its metadata still has the removed requirements.
+    removed_names = {canonicalize_name(req.name) for req in removed}
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    groups = {None: dependencies, **optional_dependencies}
+    remaining = [
+        Requirement(dep)
+        for name, deps in groups.items()
+        for dep in deps
+        if name != group or
+        canonicalize_name(Requirement(dep).name) not in removed_names
+    ]
+    distributions = installed_distributions()
+    env = marker_environment()
+    _, needed_by_removed = check_requirements(removed, distributions, env)
+    _, still_needed = check_requirements(remaining, distributions, env)
+    return sorted(
+        name
+        for name in needed_by_removed
+        if name in distributions and
+        name not in still_needed and
+        name not in removed_names and
+        name not in PROTECTED
+    )
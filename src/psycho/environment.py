@@ -1,6 +1,14 @@
+import json
 import os
+from pathlib import Path
 import shutil
-from typing import Dict, Optional
+import subprocess
+import sys
+import sysconfig
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from importlib.metadata import Distribution
 
 
 def location(name: str) -> Optional[str]:
@@ -14,3 +22,126 @@ def environment() -> Dict[str, str]:
         name: value
         for name, value in os.environ.items()
     }
+
+
+# Describes an interpreter with the values of packaging's default_environment,
+# using only the standard library, as packaging may not be installed.
+_DESCRIBE_INTERPRETER = """
+import json, os, platform, sys, sysconfig
+
+info = sys.implementation.version
+version = f"{info.major}.{info.minor}.{info.micro}"
+if info.releaselevel != 'final':
+    version += info.releaselevel[0] + str(info.serial)
+print(json.dumps({
+    'markers': {
+        'implementation_name': sys.implementation.name,
+        'implementation_version': version,
+        'os_name': os.name,
+        'platform_machine': platform.machine(),
+        'platform_release': platform.release(),
+        'platform_system': platform.system(),
+        'platform_version': platform.version(),
+        'python_full_version': platform.python_version(),
+        'platform_python_implementation': platform.python_implementation(),
+        'python_version': '.'.join(platform.python_version_tuple()[:2]),
+        'sys_platform': sys.platform,
+    },
+    'platform': sysconfig.get_platform(),
+}))
+"""
+
+# The descriptions of the interpreters, keyed by their real paths.
+_interpreters: Dict[str, Dict[str, Any]] = {}
+
+
+def _describe_interpreter() -> Dict[str, Any]:
+    # Describe the interpreter of the active environment, which is only
+    # started once for each interpreter.
+    from .running import find_python
+
+    python = os.path.realpath(find_python())
+    if python in _interpreters:
+        return _interpreters[python]
+
+    if python == os.path.realpath(sys.executable):
+        from packaging.markers import default_environment
+        description: Dict[str, Any] = {
+            'markers': dict(default_environment()),
+            'platform': sysconfig.get_platform(),
+        }
+    else:
+        description = json.loads(subprocess.check_output(
+            [python, '-I', '-c', _DESCRIBE_INTERPRETER],
+            encoding='utf-8'
+        ))
+    _interpreters[python] = description
+    return description
+
+
+def python_version() -> str:
+    """Return the full version of the interpreter for the active environment."""
+    return _describe_interpreter()['markers']['python_full_version']
+
+
+def site_packages() -> List[str]:
+    """Return the paths searched for distributions in the active environment."""
+    if 'VIRTUAL_ENV' in os.environ:
+        venv = Path(os.environ['VIRTUAL_ENV'])
+        paths = [
+            *venv.glob('lib/python*/site-packages'),
+            *venv.glob('lib64/python*/site-packages'),
+            *venv.glob('Lib/site-packages'),
+        ]
+        if paths:
+            return [str(path) for path in paths]
+
+    from .running import find_python
+    python = find_python()
+    if os.path.realpath(python) == os.path.realpath(sys.executable):
+        return list(sys.path)
+    return json.loads(subprocess.check_output(
+        [python, '-c', 'import json, sys; print(json.dumps(sys.path))'],
+        encoding='utf-8'
+    ))
+
+
+def marker_environment() -> Dict[str, str]:
+    """Return the environment markers for the active environment."""
+    return dict(_describe_interpreter()['markers'])
+
+
+def environment_tag() -> str:
+    """Return the interpreter and platform tag of the active environment.
+
+    For example "cp312-linux_x86_64".
+    """
+    from packaging.tags import INTERPRETER_SHORT_NAMES
+
+    description = _describe_interpreter()
+    markers = description['markers']
+    name = INTERPRETER_SHORT_NAMES.get(
+        markers['implementation_name'],
+        markers['implementation_name']
+    )
+    version = markers['python_version'].replace('.', '')
+    platform = description['platform'].replace('-', '_').replace('.', '_')
+    return f"{name}{version}-{platform}"
+
+
+def installed_distributions() -> Dict[str, 'Distribution']:
+    """Return the distributions installed in the active environment.
+
+    The distributions are keyed by their canonical names.
+    """
+    from importlib.metadata import distributions
+    from packaging.utils import canonicalize_name
+
+    installed: Dict[str, 'Distribution'] = {}
+    for dist in distributions(path=site_packages()):
+        name = dist.metadata['Name']
+        if name is None:
+            continue
+        # The first distribution on the path is the one which is imported.
+        installed.setdefault(canonicalize_name(name), dist)
+    return installed
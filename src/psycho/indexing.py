@@ -0,0 +1,151 @@
+"""Code for querying package indexes"""
+
+from hashlib import sha256
+from html.parser import HTMLParser
+import json
+import os
+from pathlib import Path
+import ssl
+import tempfile
+from typing import Dict, List, Optional, Tuple
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from packaging.utils import canonicalize_name
+
+from .paths import user_cache_dir
+
+# The simple indexes of the well known upload URLs.
+KNOWN_INDEXES = {
+    'https://upload.pypi.org/legacy/': 'https://pypi.org/simple/',
+    'https://test.pypi.org/legacy/': 'https://test.pypi.org/simple/',
+}
+
+_SIMPLE_JSON = 'application/vnd.pypi.simple.v1+json'
+
+# Responses already fetched by this process, keyed by URL.
+_responses: Dict[str, Dict[str, str]] = {}
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 digest of a file."""
+    digest = sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_url_for(repository_url: str) -> Optional[str]:
+    """Return the simple index URL for a known upload URL."""
+    return KNOWN_INDEXES.get(repository_url.rstrip('/') + '/')
+
+
+class _LinkParser(HTMLParser):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.links: List[str] = []
+
+    def handle_starttag(
+            self,
+            tag: str,
+            attrs: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+def _parse_files(content_type: str, body: str) -> Dict[str, str]:
+    files: Dict[str, str] = {}
+    if content_type.startswith(_SIMPLE_JSON):
+        for file in json.loads(body).get('files', []):
+            digest = file.get('hashes', {}).get('sha256')
+            if digest:
+                files[file['filename']] = digest
+        return files
+
+    parser = _LinkParser()
+    parser.feed(body)
+    for link in parser.links:
+        url, _, fragment = link.partition('#')
+        algorithm, _, digest = fragment.partition('=')
+        if algorithm == 'sha256' and digest:
+            filename = urllib.parse.unquote(url.rsplit('/', 1)[-1])
+            files[filename] = digest
+    return files
+
+
+def _cache_path(url: str) -> Path:
+    key = sha256(url.encode('utf-8')).hexdigest()
+    return user_cache_dir() / 'index-cache' / f"{key}.json"
+
+
+def _read_cached(url: str) -> Optional[Dict[str, str]]:
+    if url in _responses:
+        return _responses[url]
+    try:
+        with open(_cache_path(url), 'rt', encoding='utf-8') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached(url: str, response: Dict[str, str]) -> None:
+    _responses[url] = response
+    path = _cache_path(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, 'wt', encoding='utf-8') as fp:
+        json.dump(response, fp)
+    os.replace(tmp, path)
+
+
+def project_files(
+        index_url: str,
+        name: str,
+        cert: Optional[str] = None
+) -> Dict[str, str]:
+    """Return the sha256 digests of the files an index has for a project.
+
+    The simple API is used, preferring JSON to HTML. Responses are cached, and
+    revalidated with their ETag or Last-Modified header.
+    """
+    url = index_url.rstrip('/') + '/' + canonicalize_name(name) + '/'
+    cached = _read_cached(url)
+
+    request = urllib.request.Request(url, headers={
+        'Accept': f"{_SIMPLE_JSON}, text/html;q=0.1"
+    })
+    if cached is not None:
+        if cached.get('etag'):
+            request.add_header('If-None-Match', cached['etag'])
+        if cached.get('last_modified'):
+            request.add_header('If-Modified-Since', cached['last_modified'])
+
+    context = ssl.create_default_context(cafile=cert) if cert else None
+    try:
+        with urllib.request.urlopen(request, context=context) as response:
+            fetched = {
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+                'content_type': response.headers.get('Content-Type', ''),
+                'body': response.read().decode('utf-8'),
+            }
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and cached is not None:
+            fetched = cached
+        elif error.code == 404:
+            return {}
+        else:
+            raise
+
+    if fetched is not cached:
+        _write_cached(url, fetched)
+    else:
+        _responses[url] = cached
+
+    return _parse_files(fetched['content_type'], fetched['body'])
@@ -1,15 +1,18 @@
 import getpass
+from importlib.resources import files
 from pathlib import Path
 import shutil
 import socket
 import subprocess
 from typing import Literal, Optional
 
-import pkg_resources
 from tomlkit import document, table, array, inline_table
 
+from . import timings
 from .paths import make_venv_bin
+from .running import find_python
 from .projects import write_pyproject
+from .venvs import create_venv
 
 
 def init_get_name() -> str:
@@ -46,17 +49,16 @@ def _create_src(name: str) -> None:
         init_file.touch()
 
 
+def _read_template(name: str) -> str:
+    return files('psycho').joinpath('data').joinpath(name).read_text(encoding='utf-8')
+
+
 def _create_gitignore() -> None:
     gitignore = Path('.gitignore')
     if not gitignore.exists():
         # Add a .gitignore file
-        infile = pkg_resources.resource_filename(
-            'psycho',
-            'data/gitignore.txt'
-        )
         with gitignore.open('wt', encoding='utf-8') as fout:
-            with open(infile, 'rt', encoding='utf-8') as fin:
-                fout.write(fin.read())
+            fout.write(_read_template('gitignore.txt'))
 
 
 def _initialize_git() -> None:
@@ -69,42 +71,35 @@ def _initialize_git() -> None:
 
 
 def _create_venv() -> Path:
-    # Create a virtual environment
+    # Create a virtual environment from a template with the latest pip, or
+    # upgrade pip in an existing one.
     venv = Path('.') / '.venv'
+    venv_python = make_venv_bin(venv) / 'python'
     if not venv.exists():
-        subprocess.run(['python', '-m', 'venv', str(venv)], check=True)
-    venv_bin = make_venv_bin(venv)
-    venv_python = venv_bin / 'python'
-    # Upgrade pip
-    subprocess.run(
-        [str(venv_python), '-m', 'pip', 'install', '--upgrade', 'pip'],
-        check=True
-    )
+        create_venv(venv, find_python())
+    else:
+        timings.check_call(
+            [str(venv_python), '-m', 'pip', 'install', '--upgrade', 'pip']
+        )
     return venv_python
 
 
 def _create_readme(name: str, description: str) -> Path:
     readme = Path('README.md')
     if not readme.exists():
-        infile = pkg_resources.resource_filename(
-            'psycho',
-            'data/README.md'
-        )
         with readme.open('wt', encoding='utf-8') as fout:
-            with open(infile, 'rt', encoding='utf-8') as fin:
-                fout.write(
-                    fin.read().format(
-                        name=name,
-                        description=description
-                    )
+            fout.write(
+                _read_template('README.md').format(
+                    name=name,
+                    description=description
                 )
+            )
     return readme
 
 
 def _install_project(venv_python: Path) -> None:
-    subprocess.run(
-        [str(venv_python), '-m', 'pip', 'install', '-e', '.'],
-        check=True
+    timings.check_call(
+        [str(venv_python), '-m', 'pip', 'install', '-e', '.']
     )
 
 
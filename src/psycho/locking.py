@@ -0,0 +1,226 @@
+"""Code for locking the project dependencies"""
+
+import hashlib
+import json
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from packaging.utils import canonicalize_name
+
+from . import running
+from .environment import (
+    environment_tag,
+    installed_distributions,
+    python_version,
+)
+from .projects import load_pyproject, read_dependencies, tomllib
+from .resolving import resolve
+from .wheelhouse import wheelhouse_path
+from .writing import locked, write_file
+
+if TYPE_CHECKING:
+    from tomlkit.items import AoT
+
+LOCK_FILE_NAME = 'psycho.lock'
+LOCK_FILE_VERSION = 2
+
+MAIN_GROUP = 'main'
+
+
+def lock_file_path(project_path: Path) -> Path:
+    """Return the path of the lock file for a project file."""
+    return project_path.with_name(LOCK_FILE_NAME)
+
+
+def _content_hash(
+        dependencies: Sequence[str],
+        optional_dependencies: Dict[str, List[str]]
+) -> str:
+    content = {
+        'dependencies': sorted(dependencies),
+        'optional-dependencies': {
+            group: sorted(deps)
+            for group, deps in optional_dependencies.items()
+        }
+    }
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def _lock_group(installs: List[Dict[str, Any]]) -> 'AoT':
+    from tomlkit import aot, table
+
+    packages = aot()
+    for install in sorted(
+            installs,
+            key=lambda item: canonicalize_name(item['metadata']['name'])
+    ):
+        name = canonicalize_name(install['metadata']['name'])
+        download_info = install['download_info']
+        hashes = download_info.get('archive_info', {}).get('hashes', {})
+        if 'sha256' not in hashes:
+            raise ValueError(
+                f"Cannot lock {name}: no sha256 hash for {download_info['url']}"
+            )
+        package = table()
+        package.add('name', name)
+        package.add('version', install['metadata']['version'])
+        package.add('url', download_info['url'])
+        package.add('sha256', hashes['sha256'])
+        packages.append(package)
+    return packages
+
+
+def lock_project(
+        project_path: Path,
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+) -> Path:
+    """Resolve the project dependencies and write the lock file.
+
+    The required dependencies are locked as the "main" group, and each
+    optional group is locked together with the required dependencies. The
+    dependencies are resolved for the active interpreter and platform, which
+    are recorded in the lock file.
+    """
+    args: List[str] = []
+    if allow_prerelease:
+        args += ['--pre']
+    if index_url:
+        args += ['--index-url', index_url]
+    if extra_index_url:
+        args += ['--extra-index-url', extra_index_url]
+
+    from tomlkit import comment, document, dumps, table
+
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+
+    lock = document()
+    lock.add(comment("This file is generated by psycho lock. Do not edit."))
+    lock.add('version', LOCK_FILE_VERSION)
+    lock.add(
+        'content-hash',
+        _content_hash(dependencies, optional_dependencies)
+    )
+    lock.add('environment', environment_tag())
+    lock.add('python', python_version())
+    groups = table()
+    groups.add(MAIN_GROUP, _lock_group(resolve(dependencies, *args)))
+    for group, deps in optional_dependencies.items():
+        groups.add(group, _lock_group(resolve(dependencies + deps, *args)))
+    lock.add('groups', groups)
+
+    lock_path = lock_file_path(project_path)
+    with locked(lock_path):
+        write_file(lock_path, dumps(lock))
+    return lock_path
+
+
+def install_locked(
+        project_path: Path,
+        group: Optional[str],
+        args: Sequence[str]
+) -> None:
+    """Install the locked dependencies, then the project as editable.
+
+    Nothing is resolved: the locked artifacts are installed by URL, and every
+    hash must match. The active interpreter and platform must be the ones the
+    dependencies were locked for, though the patch release may differ.
+    """
+    lock_path = lock_file_path(project_path)
+    with open(lock_path, 'rb') as fp:
+        lock = tomllib.load(fp)
+
+    if lock.get('version') != LOCK_FILE_VERSION:
+        raise ValueError(
+            f"{lock_path} was written by another version of psycho, "
+            "run psycho lock"
+        )
+    if lock['environment'] != environment_tag():
+        raise ValueError(
+            f"{lock_path} was locked for {lock['environment']} "
+            f"(Python {lock['python']}), but the active environment is "
+            f"{environment_tag()} (Python {python_version()}), "
+            "run psycho lock"
+        )
+
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    if lock.get('content-hash') != _content_hash(
+            dependencies,
+            optional_dependencies
+    ):
+        raise ValueError(
+            f"{lock_path} is out of date with {project_path}, run psycho lock"
+        )
+
+    groups = lock['groups']
+    if (group or MAIN_GROUP) not in groups:
+        raise KeyError(f"Group {group} is not in {lock_path}")
+    packages = groups[group or MAIN_GROUP]
+
+    install_pinned(
+        project_path,
+        [
+            (
+                str(package['name']),
+                str(package['version']),
+                str(package['url']),
+                str(package['sha256'])
+            )
+            for package in packages
+        ],
+        args
+    )
+
+
+def install_pinned(
+        project_path: Path,
+        pins: Sequence[Tuple[str, str, str, Optional[str]]],
+        args: Sequence[str]
+) -> None:
+    """Install pinned artifacts without resolving, then the project as editable.
+
+    Each pin is a name, version, URL and sha256. Distributions which are
+    installed at the pinned version are skipped. When every pin has a hash,
+    every hash must match.
+    """
+    installed = installed_distributions()
+    pins = [
+        (name, version, url, digest)
+        for name, version, url, digest in pins
+        if canonicalize_name(name) not in installed or
+        installed[canonicalize_name(name)].version != version
+    ]
+
+    if len(pins) == 0:
+        running.pip('install', '--no-deps', '--editable', '.', *args)
+        return
+
+    hashed = all(digest for _, _, _, digest in pins)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        requirements_file = Path(tmpdir) / 'requirements.txt'
+        wheelhouse = wheelhouse_path(project_path)
+        with open(requirements_file, 'wt', encoding='utf-8') as fp:
+            for name, _, url, digest in pins:
+                # Prefer the copy in the wheelhouse. The hash still applies.
+                local_file = wheelhouse / url.rsplit('/', 1)[-1]
+                if local_file.is_file():
+                    url = local_file.resolve().as_uri()
+                fp.write(
+                    f"{name} @ {url}"
+                    f"{f' --hash=sha256:{digest}' if hashed else ''}\n"
+                )
+        running.pip(
+            'install',
+            '--no-deps',
+            *(['--require-hashes'] if hashed else []),
+            '--requirement', str(requirements_file),
+            *args
+        )
+
+    running.pip('install', '--no-deps', '--editable', '.', *args)
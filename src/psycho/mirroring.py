@@ -0,0 +1,278 @@
+"""Code for mirroring the project dependencies as a package index.
+
+The mirror is a static PEP 503 simple index. The distribution files are kept
+in `files`, with a manifest of their digests, and the index pages in `simple`
+link to them with their sha256 hashes. Files are only downloaded when they are
+not already in the mirror, and files from earlier runs are kept, so a mirror
+can be updated as the dependencies change and serve every version it has
+held.
+"""
+
+import html
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import urllib.parse
+
+import click
+from packaging.utils import (
+    InvalidSdistFilename,
+    InvalidWheelFilename,
+    parse_sdist_filename,
+    parse_wheel_filename,
+)
+
+from . import running, timings
+from .indexing import file_digest
+from .projects import load_pyproject, read_dependencies
+from .resolving import resolve
+from .writing import locked, make_dir, write_file
+
+MIRROR_DIR = Path('.psycho') / 'mirror'
+
+
+def mirror_path(project_path: Path) -> Path:
+    """Return the default mirror directory for a project."""
+    return project_path.parent / MIRROR_DIR
+
+
+def _project_name(filename: str) -> Optional[str]:
+    try:
+        if filename.endswith('.whl'):
+            return parse_wheel_filename(filename)[0]
+        return parse_sdist_filename(filename)[0]
+    except (InvalidSdistFilename, InvalidWheelFilename):
+        return None
+
+
+def _download(
+        files: Sequence[Tuple[str, str, str, Optional[str]]],
+        files_dir: Path,
+        args: Sequence[str]
+) -> None:
+    # pip downloads with the configured credentials, proxies and certificates,
+    # and checks the hash in each URL. The files are moved into the mirror
+    # once they are all downloaded, so an interrupted download is never
+    # mistaken for a complete one.
+    with tempfile.TemporaryDirectory(dir=files_dir.parent) as tmpdir:
+        running.pip(
+            'download',
+            '--no-deps',
+            '--quiet',
+            '--dest', tmpdir,
+            *args,
+            *(
+                f"{url.split('#', 1)[0]}#sha256={digest}"
+                for _, url, digest, _ in files
+            )
+        )
+        for filename, _, digest, _ in files:
+            path = os.path.join(tmpdir, filename)
+            if file_digest(path) != digest:
+                raise ValueError(f"The sha256 digest of {filename} is wrong")
+            os.replace(path, files_dir / filename)
+
+
+def _files_to_mirror(
+        installs: Sequence[Dict[str, Any]]
+) -> Tuple[List[Tuple[str, str, str, Optional[str]]], List[str]]:
+    # Returns the filename, URL, sha256 and requires-python of each archive,
+    # and the names of the distributions which are not archives.
+    found: List[Tuple[str, str, str, Optional[str]]] = []
+    skipped: List[str] = []
+    for install in installs:
+        download_info = install['download_info']
+        hashes = download_info.get('archive_info', {}).get('hashes', {})
+        if 'sha256' not in hashes:
+            # A local directory, VCS checkout or unhashed archive.
+            skipped.append(install['metadata']['name'])
+            continue
+        url: str = download_info['url']
+        filename = urllib.parse.unquote(
+            url.split('#', 1)[0].rsplit('/', 1)[-1]
+        )
+        found.append((
+            filename,
+            url,
+            hashes['sha256'],
+            install['metadata'].get('requires_python')
+        ))
+    return found, skipped
+
+
+def _page(
+        title: str,
+        links: Sequence[Tuple[str, str, Dict[str, str]]]
+) -> str:
+    lines = [
+        '<!DOCTYPE html>',
+        '<html>',
+        '  <head>',
+        '    <meta name="pypi:repository-version" content="1.0">',
+        f"    <title>{html.escape(title)}</title>",
+        '  </head>',
+        '  <body>',
+    ]
+    for href, text, attrs in links:
+        attributes = ''.join(
+            f' {name}="{html.escape(value)}"' for name, value in attrs.items()
+        )
+        lines.append(
+            f'    <a href="{html.escape(href)}"{attributes}>'
+            f"{html.escape(text)}</a><br>"
+        )
+    lines += ['  </body>', '</html>', '']
+    return '\n'.join(lines)
+
+
+def write_index(
+        directory: Path,
+        manifest: Dict[str, Dict[str, Optional[str]]]
+) -> None:
+    """Write the simple index pages for the files in a mirror.
+
+    Pages which are unchanged are not rewritten.
+    """
+    projects: Dict[str, List[str]] = {}
+    for filename in manifest:
+        name = _project_name(filename)
+        if name is not None:
+            projects.setdefault(name, []).append(filename)
+
+    simple = directory / 'simple'
+    for name, filenames in projects.items():
+        links = []
+        for filename in sorted(filenames):
+            entry = manifest[filename]
+            attrs: Dict[str, str] = {}
+            if entry.get('requires_python'):
+                attrs['data-requires-python'] = str(entry['requires_python'])
+            links.append((
+                f"../../files/{urllib.parse.quote(filename)}"
+                f"#sha256={entry['sha256']}",
+                filename,
+                attrs
+            ))
+        make_dir(simple / name)
+        write_file(
+            simple / name / 'index.html',
+            _page(f"Links for {name}", links)
+        )
+
+    make_dir(simple)
+    write_file(
+        simple / 'index.html',
+        _page(
+            'Simple index',
+            [(f"{name}/", name, {}) for name in sorted(projects)]
+        )
+    )
+
+
+def _read_manifest(path: Path) -> Dict[str, Dict[str, Optional[str]]]:
+    try:
+        with open(path, 'rt', encoding='utf-8') as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def mirror_project(
+        project_path: Path,
+        directory: Optional[Path],
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+) -> Path:
+    """Mirror the resolved closure of every project requirement.
+
+    This includes every optional group, and the build system requirements,
+    resolved for the active interpreter and platform. Returns the mirror
+    directory.
+    """
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    requirements = [
+        *dependencies,
+        *(dep for deps in optional_dependencies.values() for dep in deps),
+        *(str(req) for req in pyproject.get(
+            'build-system', {}).get('requires', []))
+    ]
+
+    args: List[str] = []
+    if allow_prerelease:
+        args += ['--pre']
+    if index_url:
+        args += ['--index-url', index_url]
+    if extra_index_url:
+        args += ['--extra-index-url', extra_index_url]
+
+    directory = directory or mirror_path(project_path)
+    files, skipped = _files_to_mirror(resolve(requirements, *args))
+    for name in skipped:
+        click.echo(f"Skipping {name}, which is not a hashed archive")
+
+    files_dir = directory / 'files'
+    make_dir(files_dir)
+    manifest_path = directory / 'files.json'
+    with locked(manifest_path):
+        manifest = _read_manifest(manifest_path)
+        missing = [
+            (filename, url, digest, requires_python)
+            for filename, url, digest, requires_python in files
+            if manifest.get(filename, {}).get('sha256') != digest or
+            not (files_dir / filename).is_file()
+        ]
+
+        if missing:
+            with timings.span('download files', files=len(missing)):
+                _download(missing, files_dir, args)
+        for filename, _, digest, requires_python in missing:
+            click.echo(f"Downloaded {filename}")
+            manifest[filename] = {
+                'sha256': digest,
+                'requires_python': requires_python,
+            }
+
+        # Files added to the directory by hand are indexed too, and files
+        # removed by hand are dropped.
+        on_disk = {
+            path.name
+            for path in files_dir.iterdir()
+            if path.is_file() and not path.name.startswith('.')
+        }
+        for filename in on_disk - manifest.keys():
+            manifest[filename] = {
+                'sha256': file_digest(str(files_dir / filename)),
+                'requires_python': None,
+            }
+        for filename in manifest.keys() - on_disk:
+            del manifest[filename]
+
+        write_file(
+            manifest_path,
+            json.dumps(manifest, indent=1, sort_keys=True)
+        )
+        write_index(directory, manifest)
+
+    click.echo(
+        f"Mirrored {len(files)} distributions "
+        f"({len(missing)} downloaded) to {directory / 'simple'}"
+    )
+    return directory
+
+
+def serve_mirror(directory: Path, host: str, port: int) -> None:
+    """Serve a mirror over HTTP until interrupted."""
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    handler = partial(SimpleHTTPRequestHandler, directory=str(directory))
+    with ThreadingHTTPServer((host, port), handler) as server:
+        click.echo(f"Serving http://{host}:{server.server_address[1]}/simple/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
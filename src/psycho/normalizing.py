@@ -0,0 +1,120 @@
+"""Code for making built distributions reproducible.
+
+Build backends honour SOURCE_DATE_EPOCH to differing degrees, so the archives
+are rewritten afterwards with their members in a fixed order, every timestamp
+set to the epoch, and the owners and permissions normalised. The member
+contents are unchanged, so a wheel's RECORD stays valid.
+"""
+
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import time
+from typing import List, Tuple
+import zipfile
+
+# The earliest timestamp a zip file can hold, 1980-01-01.
+_ZIP_EPOCH = 315532800
+
+# The PAX headers which are replaced by the normalised values.
+_PAX_IGNORED = frozenset((
+    'atime', 'ctime', 'mtime', 'uid', 'gid', 'uname', 'gname'
+))
+
+
+def _replace(path: str, content: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=f".{os.path.basename(path)}."
+    )
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _mode(mode: int, is_dir: bool) -> int:
+    # Keep only whether the file is executable.
+    return 0o755 if is_dir or mode & 0o111 else 0o644
+
+
+def normalize_sdist(path: str, epoch: int) -> None:
+    """Rewrite a gzipped tar sdist reproducibly."""
+    members: List[Tuple[tarfile.TarInfo, bytes]] = []
+    with tarfile.open(path, 'r:gz') as tar:
+        tar_format = tar.format
+        for member in tar.getmembers():
+            data = b''
+            if member.isfile():
+                extracted = tar.extractfile(member)
+                assert extracted is not None
+                data = extracted.read()
+            members.append((member, data))
+
+    buffer = io.BytesIO()
+    # The gzip header has a timestamp and, by default, the file name.
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buffer, mtime=epoch) \
+            as archive:
+        with tarfile.open(fileobj=archive, mode='w', format=tar_format) as tar:
+            for member, data in sorted(members, key=lambda item: item[0].name):
+                member.mtime = epoch
+                member.uid = member.gid = 0
+                member.uname = member.gname = ''
+                member.mode = _mode(member.mode, member.isdir())
+                member.pax_headers = {
+                    name: value
+                    for name, value in member.pax_headers.items()
+                    if name not in _PAX_IGNORED
+                }
+                tar.addfile(
+                    member,
+                    io.BytesIO(data) if member.isfile() else None
+                )
+    _replace(path, buffer.getvalue())
+
+
+def _wheel_order(name: str) -> Tuple[int, str]:
+    # The package files come first, then the metadata, with RECORD last.
+    top = name.split('/', 1)[0]
+    if top.endswith('.dist-info'):
+        return (2 if name.endswith('/RECORD') else 1, name)
+    return (0, name)
+
+
+def normalize_wheel(path: str, epoch: int) -> None:
+    """Rewrite a wheel reproducibly."""
+    date_time = time.gmtime(max(epoch, _ZIP_EPOCH))[:6]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(path) as source, \
+            zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in sorted(
+                source.infolist(),
+                key=lambda info: _wheel_order(info.filename)
+        ):
+            normalized = zipfile.ZipInfo(info.filename, date_time)
+            normalized.compress_type = zipfile.ZIP_DEFLATED
+            normalized.create_system = 3
+            is_dir = info.is_dir()
+            file_type = 0o040000 if is_dir else 0o100000
+            normalized.external_attr = (
+                file_type | _mode(info.external_attr >> 16, is_dir)
+            ) << 16
+            target.writestr(normalized, source.read(info))
+    _replace(path, buffer.getvalue())
+
+
+def normalize(path: str, epoch: int) -> None:
+    """Rewrite a built distribution reproducibly.
+
+    Only wheels and gzipped tar sdists are rewritten.
+    """
+    if path.endswith('.whl'):
+        normalize_wheel(path, epoch)
+    elif path.endswith('.tar.gz'):
+        normalize_sdist(path, epoch)
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import platform
 
@@ -6,3 +7,20 @@ def make_venv_bin(venv: Path) -> Path:
     """Create a venv binary path for the current platform."""
     bin = 'Scripts' if platform.system() == 'Windows' else 'bin'
     return venv / bin
+
+
+def user_cache_dir() -> Path:
+    """Return the directory for caches shared by every project.
+
+    This can be set with the PSYCHO_CACHE_DIR environment variable.
+    """
+    if 'PSYCHO_CACHE_DIR' in os.environ:
+        return Path(os.environ['PSYCHO_CACHE_DIR'])
+    system = platform.system()
+    if system == 'Windows':
+        base = Path(os.environ.get('LOCALAPPDATA', Path.home()))
+        return base / 'psycho' / 'Cache'
+    if system == 'Darwin':
+        return Path.home() / 'Library' / 'Caches' / 'psycho'
+    base = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache'))
+    return base / 'psycho'
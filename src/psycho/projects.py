@@ -1,29 +1,82 @@
+import os
 from pathlib import Path
-from typing import cast
-from tomlkit import load, dump, table, TOMLDocument
-from tomlkit.items import Table
+import sys
+from typing import Any, cast, Dict, List, Mapping, Tuple, TYPE_CHECKING
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+from . import timings
+from .writing import locked, write_file
+
+if TYPE_CHECKING:
+    from tomlkit import TOMLDocument
+    from tomlkit.items import Table
+
+# The most files load_pyproject keeps parsed.
+PARSED_CACHE_SIZE = 128
+
+# Parsed files, keyed by path, with the mtime and size they were parsed at.
+_parsed: Dict[str, Tuple[int, int, Mapping[str, Any]]] = {}
+
+
+def load_pyproject(project_path: Path) -> Mapping[str, Any]:
+    """Return a read-only view of a pyproject.toml file.
+
+    This is parsed with tomllib, which is much faster than tomlkit but does not
+    keep the formatting, and is cached until the file's mtime or size change.
+    The result must not be modified; use read_pyproject to edit the file.
+    """
+    key = os.path.abspath(project_path)
+    stat = os.stat(key)
+    cached = _parsed.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    with timings.span('parse pyproject.toml'), open(key, 'rb') as fp:
+        pyproject = tomllib.load(fp)
+    _parsed.pop(key, None)
+    _parsed[key] = (stat.st_mtime_ns, stat.st_size, pyproject)
+    while len(_parsed) > PARSED_CACHE_SIZE:
+        del _parsed[next(iter(_parsed))]
+    return pyproject
 
 
 def read_pyproject(
     project_path: Path,
-) -> TOMLDocument:
-    """Open a pyproject.toml file and ensure the project and dependencies exist."""
-    with open(project_path, "rt", encoding="utf-8") as fp:
-        pyproject = load(fp)
+) -> 'TOMLDocument':
+    """Open a pyproject.toml file for editing, keeping its formatting."""
+    from tomlkit import load
+
+    with timings.span('read pyproject.toml'):
+        with open(project_path, "rt", encoding="utf-8") as fp:
+            pyproject = load(fp)
 
     return pyproject
 
 
 def write_pyproject(
     project_path: Path,
-    pyproject: TOMLDocument,
-) -> None:
-    """Save the pyproject.toml file."""
-    with open(project_path, "wt", encoding="utf-8") as fp:
-        dump(pyproject, fp)
+    pyproject: 'TOMLDocument',
+) -> bool:
+    """Save the pyproject.toml file, if it has changed.
+
+    The file is replaced atomically while holding the project lock. Returns
+    True if the file was written.
+    """
+    from tomlkit import dumps
 
+    _parsed.pop(os.path.abspath(project_path), None)
+    with timings.span('write pyproject.toml'), locked(project_path):
+        return write_file(project_path, dumps(pyproject))
+
+
+def ensure_project(pyproject: 'TOMLDocument') -> 'Table':
+    from tomlkit import table
+    from tomlkit.items import Table
 
-def ensure_project(pyproject: TOMLDocument) -> Table:
     if "project" not in pyproject:
         pyproject["project"] = table()
     project = pyproject["project"]
@@ -31,3 +84,16 @@ def ensure_project(pyproject: TOMLDocument) -> Table:
         raise TypeError(f"Invalid project type {type(project)}")
 
     return cast(Table, project)
+
+
+def read_dependencies(
+        pyproject: Mapping[str, Any]
+) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Return the required and optional dependencies of a pyproject.toml."""
+    project = pyproject.get("project", {})
+    dependencies = [str(dep) for dep in project.get("dependencies", [])]
+    optional_dependencies = {
+        str(group): [str(dep) for dep in deps]
+        for group, deps in project.get("optional-dependencies", {}).items()
+    }
+    return dependencies, optional_dependencies
@@ -1,9 +1,368 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager, nullcontext
+import os
+import queue
+import signal
+import sys
 import tempfile
+import threading
 from pathlib import Path
-from typing import Dict, Optional
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
 
-from .building import build_project
-from .uploading import upload_project
+import click
+
+from . import running, timings
+from .building import (
+    build_cache_entry,
+    build_project,
+    can_build_in_process,
+    check_file_lists,
+    source_copy,
+    source_date_epoch,
+    source_date_epoch_set,
+    store_in_cache,
+)
+from .indexing import file_digest
+from .normalizing import normalize
+from .uploading import (
+    find_index_url,
+    is_uploaded,
+    upload_file,
+    upload_project,
+    upload_settings,
+)
+
+if TYPE_CHECKING:
+    from twine.package import PackageFile
+    from twine.repository import Repository
+
+
+@contextmanager
+def _prefixed_output(prefix: str) -> Iterator[None]:
+    # Prefix each line this process, and the processes it starts, write to
+    # stdout and stderr. Each is pointed at a pipe, which a thread copies to
+    # the original with the prefix.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    streams: List[Tuple[int, int, threading.Thread]] = []
+    for fd in (1, 2):
+        original = os.dup(fd)
+        read, write = os.pipe()
+        os.dup2(write, fd)
+        os.close(write)
+
+        def copy(read: int = read, original: int = original) -> None:
+            with open(read, 'rb') as pipe, \
+                    open(original, 'wb', closefd=False) as output:
+                for line in pipe:
+                    output.write(prefix.encode('utf-8') + line)
+                    output.flush()
+
+        thread = threading.Thread(target=copy, daemon=True)
+        thread.start()
+        streams.append((fd, original, thread))
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, original, thread in streams:
+            # Closing the last write end of the pipe stops the thread.
+            os.dup2(original, fd)
+            thread.join()
+            os.close(original)
+
+
+def _build(
+        distribution: str,
+        sdist: Optional[str],
+        outdir: str,
+        config_settings: Dict[str, str],
+        isolation: bool,
+        skip_dependency_check: bool,
+        installer: Optional[str],
+        epoch: Optional[int],
+        from_copy: bool
+) -> str:
+    # Build a distribution from the source tree, a copy of it, or an sdist.
+    with _prefixed_output(f"[{distribution}] "), \
+            tempfile.TemporaryDirectory() as tmpdir, \
+            source_date_epoch_set(epoch), \
+            source_copy('.') if from_copy else nullcontext('.') as srcdir:
+        built = running.build(
+            running.unpack_sdist(sdist, tmpdir) if sdist is not None
+            else srcdir,
+            outdir,
+            [distribution],
+            config_settings,
+            isolation,
+            skip_dependency_check,
+            installer
+        )[0]
+    if epoch is not None:
+        normalize(built, epoch)
+    return built
+
+
+def _check(
+        file: str,
+        index_url: Optional[str],
+        cert: Optional[str]
+) -> Optional[str]:
+    # Check the metadata and description render, as twine check does.
+    # Returns the digest of the file, or None if the index already has it.
+    from twine.commands.check import check
+
+    with timings.span('twine check', file=os.path.basename(file)):
+        if check([file]):
+            raise ValueError(f"{os.path.basename(file)} failed twine check")
+    digest = file_digest(file)
+    if index_url is not None and is_uploaded(file, digest, index_url, cert):
+        return None
+    return digest
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    # Cancel the builds which have not started, and stop the ones which have,
+    # with the processes they started.
+    processes = list(
+        (executor._processes or {}).values()  # pylint: disable=protected-access
+    )
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        try:
+            if os.name == 'nt':
+                process.terminate()
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def _report(name: str, message: str) -> None:
+    click.echo(f"[{name}] {message}")
+
+
+def _publish_pipeline(
+        sdist: Optional[bool],
+        wheel: Optional[bool],
+        skip_dependency_check: Optional[bool],
+        no_isolation: Optional[bool],
+        config_settings: Dict[str, str],
+        installer: Optional[str],
+        settings: Dict[str, Any],
+        index_url: Optional[str],
+        parallel: Optional[bool],
+        jobs: int,
+        reproducible: Optional[bool],
+        verbose: Optional[bool],
+) -> None:
+    # Each distribution is checked as soon as it is built. Without the
+    # parallel option the wheel is built from the sdist, so the sdist is
+    # checked while the wheel builds. Nothing is uploaded until every
+    # distribution has been built and checked, and with the parallel option
+    # the files of the wheel have been checked against the sdist, so a failure
+    # never leaves part of a release on the index.
+    from twine import cli
+    from twine.settings import Settings
+
+    parallel = parallel and bool(sdist) == bool(wheel)
+    distributions = [
+        distribution
+        for distribution, wanted in (('sdist', sdist), ('wheel', wheel))
+        if wanted
+    ] or ['sdist', 'wheel']
+    from_sdist = len(distributions) == 2 and not parallel
+    backend_settings = {
+        name: value if value is not None else ''
+        for name, value in config_settings.items()
+    }
+    isolation = not no_isolation
+    epoch = source_date_epoch('.') if reproducible else None
+
+    cli.configure_output()
+    twine_settings = Settings(**{
+        **settings,
+        'verbose': bool(verbose),
+        'disable_progress_bar': True
+    })
+    twine_settings.check_repository_url()
+    twine_settings.verify_feature_capability()
+    entry = build_cache_entry(
+        sdist,
+        wheel,
+        no_isolation,
+        config_settings,
+        parallel,
+        epoch
+    )
+    cached = sorted(entry.iterdir()) if entry.is_dir() else None
+
+    # Create the repositories up front, so any credentials prompt happens once
+    # and on this thread.
+    created = [
+        twine_settings.create_repository()
+        for _ in range(max(1, min(jobs, len(distributions))))
+    ]
+    repositories: 'queue.Queue[Repository]' = queue.Queue()
+    for repository in created:
+        repositories.put(repository)
+
+    def upload(file: str) -> Optional['PackageFile']:
+        repository = repositories.get()
+        try:
+            return upload_file(repository, twine_settings, file)
+        finally:
+            repositories.put(repository)
+
+    built: Dict[str, str] = {}
+    checked: Dict[str, str] = {}
+    skipped: Set[str] = set()
+    packages: List['PackageFile'] = []
+    stages: Dict['Future[Any]', Tuple[str, str]] = {}
+
+    try:
+        with tempfile.TemporaryDirectory() as outdir, \
+                ProcessPoolExecutor(
+                    max_workers=2,
+                    # Each builder leads a process group, so it can be stopped
+                    # with the processes it starts.
+                    initializer=os.setpgrp if os.name != 'nt' else None
+                ) as builders, \
+                ThreadPoolExecutor(max_workers=len(created) + 2) as workers:
+
+            def start_build(distribution: str) -> None:
+                future = builders.submit(
+                    timings.recorded,
+                    timings.is_enabled(),
+                    _build,
+                    distribution,
+                    built['sdist'] if distribution == 'wheel' and from_sdist
+                    else None,
+                    outdir,
+                    backend_settings,
+                    isolation,
+                    bool(skip_dependency_check),
+                    installer,
+                    epoch,
+                    bool(parallel) and distribution == 'wheel'
+                )
+                stages[future] = ('build', distribution)
+                if verbose:
+                    _report(distribution, "Building")
+
+            def start_check(distribution: str) -> None:
+                future = workers.submit(
+                    _check,
+                    built[distribution],
+                    index_url,
+                    settings['cacert']
+                )
+                stages[future] = ('check', distribution)
+
+            def start_uploads() -> None:
+                # A distribution is only checked once it is built, and the
+                # files of a wheel built in parallel are checked against the
+                # sdist when the last build finishes.
+                if len(checked) + len(skipped) < len(distributions):
+                    return
+                for distribution in checked:
+                    future = workers.submit(upload, built[distribution])
+                    stages[future] = ('upload', distribution)
+                    if verbose:
+                        _report(distribution, "Uploading")
+
+            try:
+                if cached is not None:
+                    for file in cached:
+                        distribution = (
+                            'wheel' if file.suffix == '.whl' else 'sdist'
+                        )
+                        built[distribution] = str(file)
+                        _report(distribution, f"Using cached {file.name}")
+                        start_check(distribution)
+                else:
+                    for distribution in distributions:
+                        if distribution != 'wheel' or not from_sdist:
+                            start_build(distribution)
+
+                while stages:
+                    done, _ = wait(stages, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, distribution = stages.pop(future)
+                        result = (
+                            timings.worker_result(future) if stage == 'build'
+                            else future.result()
+                        )
+                        if stage == 'build':
+                            built[distribution] = result
+                            _report(
+                                distribution,
+                                f"Built {os.path.basename(result)}"
+                            )
+                            if distribution == 'sdist' and from_sdist:
+                                start_build('wheel')
+                            start_check(distribution)
+                            if len(built) == len(distributions):
+                                if parallel:
+                                    check_file_lists(
+                                        built['sdist'],
+                                        built['wheel']
+                                    )
+                                store_in_cache(
+                                    entry,
+                                    [Path(path) for path in built.values()]
+                                )
+                        elif stage == 'check':
+                            if result is None:
+                                _report(
+                                    distribution,
+                                    "Skipping, because the index already "
+                                    "has it"
+                                )
+                                skipped.add(distribution)
+                            else:
+                                checked[distribution] = result
+                                _report(
+                                    distribution,
+                                    f"Checked, sha256 {result}"
+                                )
+                            start_uploads()
+                        elif result is not None:
+                            packages.append(result)
+            except BaseException:
+                # Cancel the stages which have not started, stop the builds,
+                # and wait for any checks and uploads to finish.
+                for future in stages:
+                    future.cancel()
+                _terminate(builders)
+                workers.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        release_urls = created[0].release_urls(packages)
+    finally:
+        for repository in created:
+            repository.close()
+
+    if release_urls:
+        click.echo("View at:")
+        for url in release_urls:
+            click.echo(url)
 
 
 def publish_project(
@@ -28,7 +387,67 @@ def publish_project(
         client_cert: Optional[str],
         verbose: Optional[bool],
         disable_progress_bar: Optional[bool],
+        parallel: Optional[bool] = None,
+        jobs: int = 1,
+        index_url: Optional[str] = None,
+        reproducible: Optional[bool] = None,
 ) -> None:
+    """Build and upload the project.
+
+    With the in-process backend each distribution is checked as soon as it is
+    built, while the others are still building, and the uploads start once
+    every distribution has passed. Signed uploads, attestations and the
+    subprocess backend build everything first.
+    """
+    if (
+            running.get_backend() == 'in-process' and
+            not sign and
+            not attestations and
+            can_build_in_process(
+                False,
+                skip_dependency_check,
+                no_isolation,
+                installer
+            )
+    ):
+        settings = upload_settings(
+            repository,
+            repository_url,
+            attestations,
+            sign,
+            sign_with,
+            identity,
+            username,
+            password,
+            non_interactive,
+            comment,
+            skip_existing,
+            cert,
+            client_cert,
+            verbose,
+            disable_progress_bar,
+        )
+        if skip_existing:
+            index_url = index_url or find_index_url(
+                settings['repository_name'],
+                settings['repository_url']
+            )
+        _publish_pipeline(
+            sdist,
+            wheel,
+            skip_dependency_check,
+            no_isolation,
+            config_settings,
+            installer,
+            settings,
+            index_url if skip_existing else None,
+            parallel,
+            jobs,
+            reproducible,
+            verbose
+        )
+        return
+
     with tempfile.TemporaryDirectory() as outdir:
         build_project(
             False,
@@ -39,7 +458,9 @@ def publish_project(
             no_isolation,
             config_settings,
             outdir,
-            installer
+            installer,
+            parallel=parallel,
+            reproducible=reproducible
         )
         files = [str(f) for f in Path(outdir).glob('*')]
         if len(files) == 0:
@@ -60,5 +481,7 @@ def publish_project(
             client_cert,
             verbose,
             disable_progress_bar,
-            *files
+            *files,
+            jobs=jobs,
+            index_url=index_url
         )
@@ -0,0 +1,163 @@
+"""Resolving requirements with pip."""
+
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from packaging.requirements import Requirement
+
+from . import running
+from .environment import environment_tag, python_version
+from .writing import make_dir, write_file
+
+RESOLVE_CACHE = Path('.psycho') / 'resolve-cache'
+RESOLVE_CACHE_SIZE = 20
+
+# The pip settings from the environment which change what is resolved.
+_PIP_SETTINGS = (
+    'PIP_INDEX_URL', 'PIP_EXTRA_INDEX_URL', 'PIP_FIND_LINKS', 'PIP_NO_INDEX',
+    'PIP_PRE', 'PIP_CONSTRAINT',
+)
+
+
+def resolve(
+        requirements: Sequence[str],
+        *args: str,
+        ignore_installed: bool = True
+) -> List[Dict[str, Any]]:
+    """Resolve requirements to the distributions pip would install.
+
+    By default installed distributions are ignored, so the result is the
+    complete closure. The "install" entries of pip's installation report are
+    returned.
+    """
+    if len(requirements) == 0:
+        return []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        report_file = os.path.join(tmpdir, 'report.json')
+        running.pip(
+            'install',
+            '--dry-run',
+            *(['--ignore-installed'] if ignore_installed else []),
+            '--quiet',
+            '--report', report_file,
+            *args,
+            *requirements
+        )
+        with open(report_file, 'rt', encoding='utf-8') as fp:
+            report = json.load(fp)
+
+    return report['install']
+
+
+def sdists(installs: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Return the URL and sha256 of the resolved distributions which are sdists.
+
+    Local directories and VCS checkouts are not included.
+    """
+    found: List[Tuple[str, str]] = []
+    for install in installs:
+        download_info = install['download_info']
+        hashes = download_info.get('archive_info', {}).get('hashes', {})
+        url: str = download_info['url']
+        filename = url.split('#', 1)[0].rsplit('/', 1)[-1]
+        if 'sha256' in hashes and not filename.endswith('.whl'):
+            found.append((url, hashes['sha256']))
+    return found
+
+
+def _cache_path(
+        project_path: Path,
+        requirements: Sequence[str],
+        args: Sequence[str]
+) -> Path:
+    key = {
+        'requirements': sorted(str(Requirement(req)) for req in requirements),
+        'args': list(args),
+        'pip': {
+            name: os.environ[name]
+            for name in _PIP_SETTINGS
+            if name in os.environ
+        },
+        'python': python_version(),
+        'environment': environment_tag(),
+    }
+    digest = sha256(json.dumps(key, sort_keys=True).encode('utf-8'))
+    return project_path.parent / RESOLVE_CACHE / f"{digest.hexdigest()}.json"
+
+
+def resolve_and_cache(
+        project_path: Path,
+        requirements: Sequence[str],
+        args: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """Resolve the requirements, and cache the result.
+
+    The cache is keyed by the requirements, the pip arguments and settings,
+    and the interpreter and platform. Only the download information, name and
+    version of each resolved distribution are kept.
+    """
+    installs = [
+        {
+            'download_info': install['download_info'],
+            'requested': install.get('requested', False),
+            'metadata': {
+                'name': install['metadata']['name'],
+                'version': install['metadata']['version'],
+            },
+        }
+        for install in resolve(requirements, *args)
+    ]
+
+    path = _cache_path(project_path, requirements, args)
+    make_dir(path.parent)
+    write_file(path, json.dumps({'install': installs}, indent=1))
+
+    entries = sorted(
+        path.parent.glob('*.json'),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for old in entries[RESOLVE_CACHE_SIZE:]:
+        old.unlink()
+
+    return installs
+
+
+def cached_resolution(
+        project_path: Path,
+        requirements: Sequence[str],
+        args: Sequence[str]
+) -> Optional[List[Dict[str, Any]]]:
+    """Return the cached resolution of the requirements, if there is one."""
+    path = _cache_path(project_path, requirements, args)
+    try:
+        with open(path, 'rt', encoding='utf-8') as fp:
+            return json.load(fp)['install']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def pins(
+        installs: List[Dict[str, Any]]
+) -> List[Tuple[str, str, str, Optional[str]]]:
+    """Return the name, version, URL and sha256 of resolved distributions."""
+    found: List[Tuple[str, str, str, Optional[str]]] = []
+    for install in installs:
+        download_info = install['download_info']
+        url: str = download_info['url']
+        vcs_info = download_info.get('vcs_info')
+        if vcs_info is not None:
+            url = f"{vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+        hashes = download_info.get('archive_info', {}).get('hashes', {})
+        found.append((
+            install['metadata']['name'],
+            install['metadata']['version'],
+            url,
+            hashes.get('sha256')
+        ))
+    return found
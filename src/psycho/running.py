@@ -0,0 +1,350 @@
+"""Backends for running pip, build and twine.
+
+The in-process backend drives build and twine through their Python APIs, and
+keeps a persistent pip worker per target interpreter, so a command which makes
+several calls only pays the interpreter and import cost once. The subprocess
+backend runs each tool with `python -m <tool>`.
+"""
+
+import atexit
+import json
+import os
+from pathlib import Path
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import zipfile
+from typing import Dict, List, Literal, Mapping, Optional, Sequence
+
+import click
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from . import timings
+from .paths import make_venv_bin
+
+Backend = Literal['in-process', 'subprocess']
+
+
+def get_backend() -> Backend:
+    """Return the backend used to run pip, build and twine.
+
+    This is chosen with the `PSYCHO_BACKEND` environment variable, which the
+    `--backend` option sets, so child processes use the same backend.
+    """
+    backend = os.environ.get('PSYCHO_BACKEND', 'in-process')
+    return 'subprocess' if backend == 'subprocess' else 'in-process'
+
+
+def find_python() -> str:
+    """Return the path of the interpreter for the active environment."""
+    if 'VIRTUAL_ENV' in os.environ:
+        venv_bin = make_venv_bin(Path(os.environ['VIRTUAL_ENV']))
+        python = shutil.which('python', path=str(venv_bin))
+        if python is not None:
+            return python
+    return shutil.which('python') or sys.executable
+
+
+# The worker reports the exit code of each pip command on a duplicate of its
+# original stdout. Everything pip (or its children) write to stdout goes to
+# stderr, so it can never be mistaken for a reply. A null command means a new
+# stderr is being sent over the stdio socket, if there is one.
+_PIP_WORKER = """
+import json
+import os
+import socket
+import sys
+
+control = os.fdopen(os.dup(1), 'w')
+os.dup2(2, 1)
+
+if 'PSYCHO_STDIO_FD' in os.environ:
+    stdio = socket.socket(fileno=int(os.environ.pop('PSYCHO_STDIO_FD')))
+
+from pip._internal.cli.main import main
+
+for line in sys.stdin:
+    args = json.loads(line)
+    if args is None:
+        _, fds, _, _ = socket.recv_fds(stdio, 1, 1)
+        os.dup2(fds[0], 2)
+        os.dup2(2, 1)
+        os.close(fds[0])
+        continue
+    try:
+        code = main(args)
+    except SystemExit as error:
+        code = error.code if isinstance(error.code, int) else int(bool(error.code))
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    control.write(json.dumps(code) + '\\n')
+    control.flush()
+"""
+
+
+class _PipWorker:
+    """A long lived interpreter with pip imported, which runs pip commands."""
+
+    def __init__(self, python: str) -> None:
+        # Where file descriptors can be passed, the worker can be given a new
+        # stderr, so it can outlive the stderr it was started with.
+        self.stdio: Optional[socket.socket] = None
+        if not hasattr(socket, 'send_fds'):
+            self.process = subprocess.Popen(
+                [python, '-c', _PIP_WORKER],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                encoding='utf-8'
+            )
+            return
+
+        self.stdio, child = socket.socketpair()
+        with child:
+            self.process = subprocess.Popen(
+                [python, '-c', _PIP_WORKER],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                encoding='utf-8',
+                pass_fds=[child.fileno()],
+                env={**os.environ, 'PSYCHO_STDIO_FD': str(child.fileno())}
+            )
+
+    def redirect_stderr(self) -> bool:
+        """Send the current stderr to the worker.
+
+        Returns False if the worker cannot be given a new stderr.
+        """
+        if self.stdio is None or self.process.stdin is None:
+            return False
+        self.process.stdin.write('null\n')
+        self.process.stdin.flush()
+        socket.send_fds(self.stdio, [b'\0'], [sys.stderr.fileno()])
+        return True
+
+    def run(self, args: Sequence[str]) -> int:
+        stdin, stdout = self.process.stdin, self.process.stdout
+        assert stdin is not None and stdout is not None
+        stdin.write(json.dumps(list(args)) + '\n')
+        stdin.flush()
+        reply = stdout.readline()
+        if not reply:
+            # The worker has died.
+            return self.process.wait() or 1
+        return int(json.loads(reply))
+
+    def close(self) -> None:
+        if self.process.stdin is not None:
+            self.process.stdin.close()
+        self.process.wait()
+        if self.stdio is not None:
+            self.stdio.close()
+
+
+_pip_workers: Dict[str, _PipWorker] = {}
+
+
+def _get_pip_worker(python: str) -> _PipWorker:
+    worker = _pip_workers.get(python)
+    if worker is None or worker.process.poll() is not None:
+        worker = _pip_workers[python] = _PipWorker(python)
+    return worker
+
+
+def close_pip_workers() -> None:
+    """Stop any running pip workers."""
+    while _pip_workers:
+        _, worker = _pip_workers.popitem()
+        worker.close()
+
+
+atexit.register(close_pip_workers)
+
+
+def redirect_pip_workers() -> None:
+    """Send the current stderr to the running pip workers.
+
+    Workers which cannot be given a new stderr are stopped.
+    """
+    for python, worker in list(_pip_workers.items()):
+        if worker.process.poll() is not None or not worker.redirect_stderr():
+            _pip_workers.pop(python).close()
+
+
+def _changes_pip(args: Sequence[str]) -> bool:
+    # A worker cannot safely keep running after it has replaced its own pip.
+    for arg in args:
+        try:
+            if canonicalize_name(Requirement(arg).name) == 'pip':
+                return True
+        except InvalidRequirement:
+            pass
+    return False
+
+
+def pip(*args: str) -> None:
+    """Run pip for the interpreter of the active environment."""
+    python = find_python()
+    command = [python, '-m', 'pip', *args]
+    if get_backend() == 'subprocess':
+        timings.check_call(command)
+        return
+
+    worker = _get_pip_worker(python)
+    try:
+        with timings.span(
+                ' '.join(['pip', *args[:1]]),
+                command=command
+        ) as span:
+            code = worker.run(args)
+            if timings.is_enabled():
+                # The worker's peak memory covers every command it has run.
+                span['max_rss_bytes'] = timings.peak_rss(worker.process.pid)
+    except BaseException:
+        # An interrupted worker may still send a reply, which would be read
+        # as the reply to the next command.
+        _pip_workers.pop(python, None)
+        worker.process.kill()
+        worker.close()
+        raise
+    if _changes_pip(args):
+        _pip_workers.pop(python).close()
+    if code != 0:
+        raise subprocess.CalledProcessError(code, command)
+
+
+def _build_distribution(
+        srcdir: str,
+        outdir: str,
+        distribution: str,
+        config_settings: Mapping[str, str],
+        isolation: bool,
+        skip_dependency_check: bool,
+        installer: Optional[str],
+) -> str:
+    from build import BuildBackendException, BuildException, ProjectBuilder
+
+    try:
+        if isolation:
+            from .buildenvs import isolated_builder
+            with isolated_builder(
+                    srcdir,
+                    distribution,
+                    config_settings,
+                    installer
+            ) as builder:
+                with timings.span(f"build {distribution}"):
+                    return builder.build(distribution, outdir, config_settings)
+
+        builder = ProjectBuilder(srcdir, python_executable=find_python())
+        if not skip_dependency_check:
+            missing = builder.check_dependencies(distribution, config_settings)
+            if missing:
+                dependencies = ', '.join(
+                    ' -> '.join(chain) for chain in sorted(missing)
+                )
+                raise BuildException(f"Missing dependencies: {dependencies}")
+        with timings.span(f"build {distribution}"):
+            return builder.build(distribution, outdir, config_settings)
+    except BuildBackendException as error:
+        # The exception cannot be pickled, so it would break the process pool
+        # of a parallel build.
+        raise BuildException(str(error)) from error
+
+
+def unpack_sdist(sdist: str, directory: str) -> str:
+    """Unpack an sdist, returning the path of its source tree."""
+    if sdist.endswith('.zip'):
+        with zipfile.ZipFile(sdist) as archive:
+            archive.extractall(directory)
+    else:
+        with tarfile.open(sdist) as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(directory, filter='data')
+            else:
+                tar.extractall(directory)
+    entries = os.listdir(directory)
+    if len(entries) == 1 and os.path.isdir(os.path.join(directory, entries[0])):
+        return os.path.join(directory, entries[0])
+    return directory
+
+
+def build(
+        srcdir: str,
+        outdir: str,
+        distributions: Sequence[str],
+        config_settings: Mapping[str, str],
+        isolation: bool,
+        skip_dependency_check: bool,
+        installer: Optional[str],
+) -> List[str]:
+    """Build distributions with the build API.
+
+    When no distributions are given, an sdist is built, and the wheel is built
+    from the unpacked sdist, as `python -m build` does.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    if distributions:
+        built = [
+            _build_distribution(
+                srcdir,
+                outdir,
+                distribution,
+                config_settings,
+                isolation,
+                skip_dependency_check,
+                installer
+            )
+            for distribution in distributions
+        ]
+    else:
+        sdist = _build_distribution(
+            srcdir,
+            outdir,
+            'sdist',
+            config_settings,
+            isolation,
+            skip_dependency_check,
+            installer
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wheel = _build_distribution(
+                unpack_sdist(sdist, tmpdir),
+                outdir,
+                'wheel',
+                config_settings,
+                isolation,
+                skip_dependency_check,
+                installer
+            )
+        built = [sdist, wheel]
+
+    click.echo(
+        "Successfully built " +
+        " and ".join(os.path.basename(path) for path in built)
+    )
+    return built
+
+
+def twine_upload(
+        files: Sequence[str],
+        **settings: object
+) -> None:
+    """Upload files with the twine API.
+
+    The keyword arguments are passed to `twine.settings.Settings`.
+    """
+    from twine import cli
+    from twine.commands.upload import upload
+    from twine.settings import Settings
+
+    cli.configure_output()
+    with timings.span('twine upload', files=len(files)):
+        upload(Settings(**settings), list(files))  # type: ignore[arg-type]
@@ -0,0 +1,338 @@
+"""Code for installing from a content-addressed store of unpacked wheels"""
+
+from base64 import urlsafe_b64encode
+from configparser import ConfigParser
+import csv
+from hashlib import sha256
+import io
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import urllib.parse
+import urllib.request
+import zipfile
+
+import click
+from packaging.utils import canonicalize_name
+
+from . import running
+from .environment import installed_distributions, python_version, site_packages
+from .indexing import file_digest
+from .paths import make_venv_bin, user_cache_dir
+from .resolving import resolve
+
+INSTALLER = 'psycho'
+
+# The directories a wheel's .data directory may install into.
+SCHEMES = ('purelib', 'platlib', 'headers', 'scripts', 'data')
+
+
+def store_path() -> Path:
+    """Return the directory of the store.
+
+    This can be set with the PSYCHO_STORE_DIR environment variable.
+    """
+    if 'PSYCHO_STORE_DIR' in os.environ:
+        return Path(os.environ['PSYCHO_STORE_DIR'])
+    return user_cache_dir() / 'store'
+
+
+def _entry_path(digest: str) -> Path:
+    return store_path() / digest[:2] / digest
+
+
+def _record_hash(data: bytes) -> str:
+    digest = urlsafe_b64encode(sha256(data).digest()).rstrip(b'=')
+    return 'sha256=' + digest.decode('ascii')
+
+
+def _destination(root: Path, path: str) -> Path:
+    # Resolve a path from a wheel against the directory it installs into,
+    # refusing any which would land outside it.
+    base = os.path.abspath(root)
+    target = os.path.normpath(os.path.join(base, path))
+    if os.path.commonpath([base, target]) != base:
+        raise ValueError(
+            f"The wheel file {path} would be installed outside {root}"
+        )
+    return Path(target)
+
+
+def add_to_store(wheel: str, digest: str) -> Path:
+    """Unpack a wheel into the store, unless it is already there."""
+    entry = _entry_path(digest)
+    if entry.is_dir():
+        return entry
+
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmpdir = Path(tempfile.mkdtemp(dir=entry.parent))
+    try:
+        with zipfile.ZipFile(wheel) as archive:
+            for info in archive.infolist():
+                path = _destination(tmpdir, info.filename)
+                if info.is_dir():
+                    path.mkdir(parents=True, exist_ok=True)
+                    continue
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with archive.open(info) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                if (info.external_attr >> 16) & 0o111:
+                    path.chmod(0o755)
+                else:
+                    path.chmod(0o644)
+        try:
+            os.replace(tmpdir, entry)
+        except OSError:
+            # Another process stored the wheel first.
+            if not entry.is_dir():
+                raise
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return entry
+
+
+def _read_record(dist_info: Path) -> Dict[str, Tuple[str, str]]:
+    with open(dist_info / 'RECORD', 'rt', encoding='utf-8', newline='') as fp:
+        return {
+            row[0]: (row[1], row[2])
+            for row in csv.reader(fp)
+            if row
+        }
+
+
+def _script(module: str, attribute: str) -> str:
+    name = attribute.split('.', 1)[0]
+    return (
+        "# -*- coding: utf-8 -*-\n"
+        "import re\n"
+        "import sys\n"
+        f"from {module} import {name}\n"
+        "if __name__ == '__main__':\n"
+        "    sys.argv[0] = re.sub(r'(-script\\.pyw|\\.exe)?$', '', sys.argv[0])\n"
+        f"    sys.exit({attribute}())\n"
+    )
+
+
+def _entry_point_scripts(dist_info: Path) -> Dict[str, str]:
+    path = dist_info / 'entry_points.txt'
+    if not path.exists():
+        return {}
+    parser = ConfigParser(delimiters=('=',))
+    parser.optionxform = str  # type: ignore
+    parser.read(path, encoding='utf-8')
+    scripts: Dict[str, str] = {}
+    for section in ('console_scripts', 'gui_scripts'):
+        if not parser.has_section(section):
+            continue
+        for name, value in parser.items(section):
+            module, _, attribute = value.partition(':')
+            attribute = attribute.split('[', 1)[0].strip()
+            scripts[name] = _script(module.strip(), attribute)
+    return scripts
+
+
+def _fix_shebang(content: bytes, python: str) -> bytes:
+    # Wheels mark the scripts to run with the installing interpreter.
+    first, sep, rest = content.partition(b'\n')
+    for marker in (b'#!pythonw', b'#!python'):
+        if first.startswith(marker):
+            first = b'#!' + os.fsencode(python) + first[len(marker):]
+            break
+    return first + sep + rest
+
+
+def _link(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _write(target: Path, content: bytes, mode: int) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    target.write_bytes(content)
+    target.chmod(mode)
+
+
+def link_distribution(
+        entry: Path,
+        venv: Path,
+        purelib: Path,
+        requested: bool
+) -> None:
+    """Install an unpacked wheel from the store into a venv.
+
+    The files are hard linked into the venv, except for the scripts, which
+    have their shebangs rewritten, and the INSTALLER and RECORD files, which
+    are written for the installation.
+    """
+    dist_info = next(entry.glob('*.dist-info'))
+    data = dist_info.name[:-len('.dist-info')] + '.data'
+    name = dist_info.name.split('-', 1)[0]
+    record = _read_record(dist_info)
+    bin_dir = make_venv_bin(venv)
+    python = str(bin_dir / 'python')
+    version = '.'.join(python_version().split('.')[:2])
+    schemes: Dict[str, Path] = {
+        'purelib': purelib,
+        'platlib': purelib,
+        'scripts': bin_dir,
+        'headers': venv / 'include' / 'site' / f"python{version}" / name,
+        'data': venv,
+    }
+
+    installed: List[Tuple[str, str, str]] = []
+
+    def add(target: Path, digest: str, size: str) -> None:
+        installed.append(
+            (os.path.relpath(target, purelib).replace(os.sep, '/'), digest, size)
+        )
+
+    for directory, _, files in os.walk(entry):
+        for filename in files:
+            source = Path(directory) / filename
+            rel = source.relative_to(entry).as_posix()
+            if rel in (f"{dist_info.name}/RECORD", f"{dist_info.name}/INSTALLER"):
+                continue
+            parts = rel.split('/')
+            if parts[0] == data:
+                if len(parts) < 3 or parts[1] not in schemes:
+                    raise ValueError(
+                        f"Unknown scheme {parts[1]} in {dist_info.name} for "
+                        f"{rel}, which must be in one of {', '.join(SCHEMES)}"
+                    )
+                target = _destination(schemes[parts[1]], '/'.join(parts[2:]))
+            else:
+                target = _destination(purelib, rel)
+            if parts[0] == data and parts[1] == 'scripts':
+                content = _fix_shebang(source.read_bytes(), python)
+                _write(target, content, 0o755)
+                add(target, _record_hash(content), str(len(content)))
+                continue
+            _link(source, target)
+            digest, size = record.get(rel, ('', ''))
+            add(target, digest, size)
+
+    for script_name, script in _entry_point_scripts(dist_info).items():
+        content = f"#!{python}\n{script}".encode('utf-8')
+        target = bin_dir / script_name
+        _write(target, content, 0o755)
+        add(target, _record_hash(content), str(len(content)))
+
+    target_dist_info = purelib / dist_info.name
+    metadata = {'INSTALLER': f"{INSTALLER}\n".encode('utf-8')}
+    if requested:
+        metadata['REQUESTED'] = b''
+    for filename, content in metadata.items():
+        target = target_dist_info / filename
+        _write(target, content, 0o644)
+        add(target, _record_hash(content), str(len(content)))
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerows(installed)
+    writer.writerow([f"{dist_info.name}/RECORD", '', ''])
+    _write(target_dist_info / 'RECORD', buf.getvalue().encode('utf-8'), 0o644)
+
+
+def _wheel_url(install: Dict[str, Any]) -> Optional[Tuple[str, Optional[str]]]:
+    # The URL and sha256 of a resolved wheel, or None if it is not a wheel.
+    download_info = install['download_info']
+    if 'archive_info' not in download_info:
+        return None
+    url: str = download_info['url']
+    if not urllib.parse.urlsplit(url).path.endswith('.whl'):
+        return None
+    hashes = download_info['archive_info'].get('hashes', {})
+    return url, hashes.get('sha256')
+
+
+def _fetch(
+        wheels: Sequence[Tuple[str, Optional[str]]],
+        directory: str
+) -> List[Tuple[str, str]]:
+    # Return the local path and sha256 of each wheel. The path is empty when
+    # the wheel is already stored.
+    local: List[Tuple[str, str]] = []
+    remote: List[Tuple[int, str, Optional[str]]] = []
+    for url, digest in wheels:
+        if digest is not None and _entry_path(digest).is_dir():
+            local.append(('', digest))
+        elif url.startswith('file:'):
+            path = urllib.request.url2pathname(urllib.parse.urlsplit(url).path)
+            local.append((path, digest or file_digest(path)))
+        else:
+            remote.append((len(local), url, digest))
+            local.append(('', ''))
+
+    if remote:
+        # pip downloads with the configured credentials, proxies and cache.
+        running.pip(
+            'download',
+            '--no-deps',
+            '--quiet',
+            '--dest', directory,
+            *(url for _, url, _ in remote)
+        )
+        for index, url, digest in remote:
+            filename = urllib.parse.unquote(
+                urllib.parse.urlsplit(url).path.rsplit('/', 1)[-1]
+            )
+            path = os.path.join(directory, filename)
+            actual = file_digest(path)
+            if digest is not None and actual != digest:
+                raise ValueError(f"The sha256 digest of {filename} is wrong")
+            local[index] = (path, actual)
+    return local
+
+
+def link_requirements(requirements: Sequence[str], args: Sequence[str]) -> None:
+    """Install the wheels a set of requirements resolve to from the store.
+
+    Wheels which are not in the store are added to it first. Distributions
+    which are sdists, directories or VCS checkouts are left for pip, as are
+    any requirements when the active environment is not a virtual environment.
+    """
+    if 'VIRTUAL_ENV' not in os.environ or os.name == 'nt':
+        return
+    if '--dry-run' in args:
+        return
+
+    installs = resolve(requirements, *args, ignore_installed=False)
+    wheels: List[Tuple[Dict[str, Any], Tuple[str, Optional[str]]]] = []
+    for install in installs:
+        wheel = _wheel_url(install)
+        if wheel is not None:
+            wheels.append((install, wheel))
+    if not wheels:
+        return
+
+    venv = Path(os.environ['VIRTUAL_ENV']).absolute()
+    purelib = Path(site_packages()[0])
+
+    # Remove the versions being replaced.
+    installed = installed_distributions()
+    replaced = [
+        install['metadata']['name']
+        for install, _ in wheels
+        if canonicalize_name(install['metadata']['name']) in installed
+    ]
+    if replaced:
+        running.pip('uninstall', '-y', *replaced)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetched = _fetch([wheel for _, wheel in wheels], tmpdir)
+        for (install, _), (path, digest) in zip(wheels, fetched):
+            entry = _entry_path(digest) if not path else add_to_store(path, digest)
+            link_distribution(entry, venv, purelib, install.get('requested', False))
+            click.echo(
+                f"Linked {install['metadata']['name']}-"
+                f"{install['metadata']['version']} from the store"
+            )
@@ -0,0 +1,151 @@
+"""Code for synchronizing the environment with the project"""
+
+from importlib.metadata import Distribution
+from pathlib import Path
+from typing import List, Mapping, Optional, Sequence, Set, Tuple
+
+import click
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+
+from . import running
+from .environment import installed_distributions, marker_environment
+from .projects import load_pyproject, read_dependencies
+from .wheelhouse import wheelhouse_args
+
+# Distributions which are never removed from the environment, along with the
+# distributions they need. This includes psycho, which may be installed in it.
+PROTECTED = frozenset(('pip', 'setuptools', 'wheel', 'psycho'))
+
+
+def _applies(
+        req: Requirement,
+        env: Mapping[str, str],
+        extras: Set[str]
+) -> bool:
+    if req.marker is None:
+        return True
+    return any(
+        req.marker.evaluate({**env, 'extra': extra})
+        for extra in (extras or {''})
+    )
+
+
+def _without_marker(req: Requirement) -> str:
+    req = Requirement(str(req))
+    req.marker = None
+    return str(req)
+
+
+def check_requirements(
+        requirements: Sequence[Requirement],
+        distributions: Mapping[str, Distribution],
+        env: Mapping[str, str]
+) -> Tuple[List[Requirement], Set[str]]:
+    """Check the requirements, and their dependencies, are installed.
+
+    Returns the unsatisfied requirements, and the canonical names of every
+    distribution the requirements need.
+    """
+    unsatisfied: List[Requirement] = []
+    needed: Set[str] = set()
+    seen: Set[Tuple[str, frozenset]] = set()
+    stack = [(req, set()) for req in requirements]
+    while stack:
+        req, parent_extras = stack.pop()
+        if not _applies(req, env, parent_extras):
+            continue
+        name = canonicalize_name(req.name)
+        key = (name, frozenset(req.extras))
+        if key in seen:
+            continue
+        seen.add(key)
+        needed.add(name)
+
+        dist = distributions.get(name)
+        if dist is None or (
+                req.url is None and
+                not req.specifier.contains(dist.version, prereleases=True)
+        ):
+            unsatisfied.append(req)
+            if dist is None:
+                continue
+
+        for dep in dist.requires or []:
+            stack.append((Requirement(dep), set(req.extras)))
+
+    return unsatisfied, needed
+
+
+def sync_project(
+        project_path: Path,
+        groups: Sequence[str],
+        exact: Optional[bool],
+        dry_run: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool] = None,
+) -> bool:
+    """Install the project dependencies which are missing or out of range.
+
+    With exact, distributions which are not needed by the selected
+    dependencies are uninstalled. Returns False if the environment was
+    already in sync, in which case pip is not run.
+    """
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    declared = list(dependencies)
+    for group in groups:
+        if group not in optional_dependencies:
+            raise KeyError(f"Optional dependency group {group} does not exist")
+        declared += optional_dependencies[group]
+
+    distributions = installed_distributions()
+    env = marker_environment()
+    unsatisfied, needed = check_requirements(
+        [Requirement(dep) for dep in declared],
+        distributions,
+        env
+    )
+
+    extraneous: List[str] = []
+    if exact:
+        project_name = pyproject.get('project', {}).get('name')
+        if project_name is not None:
+            needed.add(canonicalize_name(str(project_name)))
+        _, protected = check_requirements(
+            [Requirement(name) for name in PROTECTED],
+            distributions,
+            env
+        )
+        extraneous = sorted(
+            name
+            for name in distributions
+            if name not in needed and name not in protected
+        )
+
+    if not unsatisfied and not extraneous:
+        return False
+
+    to_install = sorted(_without_marker(req) for req in unsatisfied)
+    if dry_run:
+        for req in to_install:
+            click.echo(f"Would install {req}")
+        for name in extraneous:
+            click.echo(f"Would uninstall {name}")
+        return True
+
+    if extraneous:
+        running.pip('uninstall', '-y', *extraneous)
+    if to_install:
+        running.pip(
+            'install',
+            *wheelhouse_args(
+                project_path,
+                index_url,
+                extra_index_url,
+                offline
+            ),
+            *to_install
+        )
+    return True
@@ -0,0 +1,253 @@
+"""Code for timing commands.
+
+When timings are enabled, a span is recorded for each phase of a command and
+each process it runs. Process spans include the wall time, CPU time and peak
+memory of the process, and the processes it waited for. The spans can be
+written as a Chrome trace, which can be opened with chrome://tracing or
+Perfetto, or summarised as a table. Calls made in a process pool with
+`recorded` return the spans of the worker, which `worker_result` adds to the
+spans of the parent.
+
+When timings are disabled, a span costs a single check.
+"""
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None  # type: ignore[assignment]
+
+T = TypeVar('T')
+
+# The recorded spans, or None if timings are disabled.
+_spans: Optional[List[Dict[str, Any]]] = None
+_spans_lock = threading.Lock()
+
+
+def enable() -> None:
+    """Start recording spans, discarding any already recorded."""
+    global _spans  # pylint: disable=global-statement
+    _spans = []
+
+
+def disable() -> List[Dict[str, Any]]:
+    """Stop recording spans, returning the spans which were recorded."""
+    global _spans  # pylint: disable=global-statement
+    spans, _spans = _spans or [], None
+    return spans
+
+
+def is_enabled() -> bool:
+    """Return True if spans are being recorded."""
+    return _spans is not None
+
+
+def recorded(
+        enabled: bool,
+        function: Callable[..., T],
+        *args: Any
+) -> Tuple[T, List[Dict[str, Any]]]:
+    """Call a function in a worker process, recording spans if enabled.
+
+    Returns the result, and the spans recorded by the call. Submit this to a
+    process pool with `is_enabled()`, and pass the future to `worker_result`.
+    The spans of a call which raises are lost.
+    """
+    # A forked worker starts with a copy of the parent's spans.
+    if enabled:
+        enable()
+    else:
+        disable()
+    try:
+        result = function(*args)
+    finally:
+        spans = disable()
+    return result, spans
+
+
+def worker_result(future: 'Future[Tuple[T, List[Dict[str, Any]]]]') -> T:
+    """Return the result of a call to `recorded`, keeping its spans."""
+    result, spans = future.result()
+    if spans:
+        with _spans_lock:
+            if _spans is not None:
+                _spans.extend(spans)
+    return result
+
+
+def _child_cpu_seconds() -> float:
+    # The CPU time of the processes which have been waited for, including
+    # those run by libraries.
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _record(
+        name: str,
+        category: str,
+        start: int,
+        args: Dict[str, Any]
+) -> None:
+    end = time.perf_counter_ns()
+    with _spans_lock:
+        if _spans is None:
+            return
+        _spans.append({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'ts': start / 1000,
+            'dur': (end - start) / 1000,
+            'args': args,
+        })
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """Record a span for a phase of a command.
+
+    The keyword arguments are recorded with the span, and the dictionary
+    yielded can be used to add more.
+    """
+    if _spans is None:
+        yield {}
+        return
+    child_cpu_seconds = _child_cpu_seconds()
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        child_cpu_seconds = _child_cpu_seconds() - child_cpu_seconds
+        if child_cpu_seconds:
+            args['child_cpu_seconds'] = child_cpu_seconds
+        _record(name, 'phase', start, args)
+
+
+def peak_rss(pid: int) -> Optional[int]:
+    """Return the peak memory of a running process in bytes, if it is known.
+
+    This is only available on Linux.
+    """
+    try:
+        with open(f"/proc/{pid}/status", 'rt', encoding='ascii') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _process_name(command: Sequence[str]) -> str:
+    # "python -m pip install ..." is named "pip install", and
+    # "python -m build --sdist" is named "build".
+    args = [os.path.basename(str(arg)) for arg in command]
+    if len(args) > 2 and args[1] == '-m':
+        args = args[2:]
+    if len(args) > 1 and not args[1].startswith('-'):
+        return ' '.join(args[:2])
+    return args[0]
+
+
+def wait(process: 'subprocess.Popen[Any]') -> int:
+    """Wait for a process, recording a span for it if timings are enabled.
+
+    The span starts when this is called, so it should be called as soon as
+    the process is started.
+    """
+    if _spans is None or not hasattr(os, 'wait4'):
+        return process.wait()
+
+    start = time.perf_counter_ns()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    args = process.args if isinstance(process.args, list) else [process.args]
+    _record(
+        _process_name(args),
+        'process',
+        start,
+        {
+            'command': [str(arg) for arg in args],
+            'exit_code': process.returncode,
+            'user_seconds': usage.ru_utime,
+            'system_seconds': usage.ru_stime,
+            'max_rss_bytes': usage.ru_maxrss * scale,
+        }
+    )
+    return process.returncode
+
+
+def check_call(command: Sequence[str], **kwargs: Any) -> None:
+    """Run a process, as subprocess.check_call, recording a span for it."""
+    if _spans is None:
+        subprocess.check_call(command, **kwargs)
+        return
+    with subprocess.Popen(list(command), **kwargs) as process:
+        code = wait(process)
+    if code != 0:
+        raise subprocess.CalledProcessError(code, command)
+
+
+def write_trace(path: Path, spans: Sequence[Dict[str, Any]]) -> None:
+    """Write spans as a Chrome trace."""
+    with open(path, 'wt', encoding='utf-8') as fp:
+        json.dump({'traceEvents': list(spans), 'displayTimeUnit': 'ms'}, fp)
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return ''
+    return f"{value / (1024 * 1024):.1f}M"
+
+
+def write_summary(fp: TextIO, spans: Sequence[Dict[str, Any]]) -> None:
+    """Write a table of the total time and peak memory of each kind of span."""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for event in sorted(spans, key=lambda event: event['ts']):
+        total = totals.setdefault(
+            event['name'],
+            {'calls': 0, 'seconds': 0.0, 'max_rss_bytes': None}
+        )
+        total['calls'] += 1
+        total['seconds'] += event['dur'] / 1_000_000
+        rss = event['args'].get('max_rss_bytes')
+        if rss is not None:
+            total['max_rss_bytes'] = max(total['max_rss_bytes'] or 0, rss)
+
+    width = max((len(name) for name in totals), default=4)
+    fp.write(
+        f"{'span':<{width}}  {'calls':>5}  {'seconds':>9}  {'peak rss':>8}\n"
+    )
+    for name, total in totals.items():
+        fp.write(
+            f"{name:<{width}}  {total['calls']:>5}  {total['seconds']:>9.3f}  "
+            f"{_format_bytes(total['max_rss_bytes']):>8}\n"
+        )
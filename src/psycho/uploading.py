@@ -1,16 +1,275 @@
-import subprocess
-from typing import List, Literal, Optional
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import os
+import queue
+import time
+from typing import Any, Dict, List, Literal, Optional, Sequence, TYPE_CHECKING
+
+import click
+from packaging.utils import (
+    InvalidSdistFilename,
+    InvalidWheelFilename,
+    parse_sdist_filename,
+    parse_wheel_filename,
+)
+
+from . import running, timings
+from .indexing import file_digest, index_url_for, project_files
+
+if TYPE_CHECKING:
+    from twine.package import PackageFile
+    from twine.repository import Repository
+    from twine.settings import Settings
+
+UPLOAD_RETRIES = 3
+
+# The suffixes of the files twine uploads with a distribution.
+_COMPANION_SUFFIXES = ('.asc', '.attestation')
 
 
 def _twine(
         operation: Literal['upload'],
         *args: str,
 ) -> None:
-    subprocess.check_call([
-        'python', "-m", "twine", operation, *args
+    timings.check_call([
+        running.find_python(), "-m", "twine", operation, *args
     ])
 
 
+def upload_file(
+        repository: 'Repository',
+        upload_settings: 'Settings',
+        filename: str,
+        retries: int = UPLOAD_RETRIES,
+) -> Optional['PackageFile']:
+    """Upload a file with twine, retrying connection and server errors.
+
+    Returns None if the file was skipped because it already exists.
+    """
+    import requests
+    from twine import exceptions, utils
+    from twine.commands.upload import skip_upload
+    from twine.package import PackageFile
+
+    package = PackageFile.from_filename(filename, upload_settings.comment)
+    skip_message = (
+        f"Skipping {package.basefilename} because it appears to already exist"
+    )
+    if (
+            upload_settings.skip_existing and
+            repository.package_is_uploaded(package)
+    ):
+        click.echo(skip_message)
+        return None
+
+    for attempt in range(retries + 1):
+        try:
+            with timings.span(f"upload {package.basefilename}"):
+                response = repository.upload(package)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code < 500 or attempt == retries:
+                break
+        time.sleep(2 ** attempt)
+
+    if response.is_redirect:
+        raise exceptions.RedirectDetected.from_args(
+            utils.sanitize_url(repository.url),
+            utils.sanitize_url(response.headers["location"]),
+        )
+    if skip_upload(response, upload_settings.skip_existing, package):
+        click.echo(skip_message)
+        return None
+    utils.check_status_code(response, upload_settings.verbose)
+    click.echo(f"Uploaded {package.basefilename}")
+    return package
+
+
+def upload_files(
+        files: Sequence[str],
+        jobs: int,
+        **settings: Any
+) -> None:
+    """Upload files concurrently with a bounded number of workers.
+
+    Each worker has its own repository session, so connections are reused
+    from file to file. The first failure cancels the uploads not yet started.
+    The keyword arguments are passed to `twine.settings.Settings`.
+    """
+    from twine import cli
+    from twine.settings import Settings
+
+    cli.configure_output()
+    # Concurrent progress bars would overwrite each other.
+    upload_settings = Settings(**{**settings, 'disable_progress_bar': True})
+    upload_settings.check_repository_url()
+    upload_settings.verify_feature_capability()
+
+    # Create the repositories up front, so any credentials prompt happens once
+    # and on this thread.
+    workers = max(1, min(jobs, len(files)))
+    created = [upload_settings.create_repository() for _ in range(workers)]
+    repositories: 'queue.Queue[Repository]' = queue.Queue()
+    for repository in created:
+        repositories.put(repository)
+
+    def upload(filename: str) -> Optional['PackageFile']:
+        repository = repositories.get()
+        try:
+            return upload_file(repository, upload_settings, filename)
+        finally:
+            repositories.put(repository)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload, filename) for filename in files]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            packages = [
+                package
+                for package in (future.result() for future in futures)
+                if package is not None
+            ]
+        release_urls = created[0].release_urls(packages)
+        if release_urls:
+            click.echo("View at:")
+            for url in release_urls:
+                click.echo(url)
+    finally:
+        for repository in created:
+            repository.close()
+
+
+def find_dists(files: Sequence[str]) -> List[str]:
+    """Expand any globs in the files to upload, as twine does.
+
+    Wheels come before sdists.
+    """
+    from twine import commands
+
+    return commands._find_dists(list(files))  # pylint: disable=protected-access
+
+
+def find_index_url(
+        repository: Optional[str],
+        repository_url: Optional[str]
+) -> Optional[str]:
+    """Return the simple index of a repository, if it is known."""
+    if repository_url is None:
+        from twine.exceptions import InvalidConfiguration
+        from twine.utils import get_repository_from_config
+        try:
+            config = get_repository_from_config(
+                '~/.pypirc',
+                repository or 'pypi'
+            )
+        except InvalidConfiguration:
+            return None
+        repository_url = config['repository']
+    return index_url_for(repository_url) if repository_url else None
+
+
+def is_uploaded(
+        file: str,
+        digest: str,
+        index_url: str,
+        cert: Optional[str]
+) -> bool:
+    """Return True if the index has a file with the same name and digest."""
+    filename = os.path.basename(file)
+    try:
+        if filename.endswith('.whl'):
+            name = parse_wheel_filename(filename)[0]
+        else:
+            name = parse_sdist_filename(filename)[0]
+    except (InvalidSdistFilename, InvalidWheelFilename):
+        return False
+
+    with timings.span('fetch index', project=name):
+        existing = project_files(index_url, name, cert)
+    return existing.get(filename) == digest
+
+
+def _skip_uploaded(
+        files: Sequence[str],
+        index_url: Optional[str],
+        cert: Optional[str]
+) -> List[str]:
+    # Check the digests of the files against the index, so files it already
+    # has are never sent. The files must already be expanded. Signatures and
+    # attestations are skipped with their distributions.
+    if index_url is None:
+        return list(files)
+
+    skipped: List[str] = []
+    for file in files:
+        if file.endswith(_COMPANION_SUFFIXES):
+            continue
+        if is_uploaded(file, file_digest(file), index_url, cert):
+            click.echo(
+                f"Skipping {os.path.basename(file)} because the index "
+                "already has it"
+            )
+            skipped.append(file)
+    return [
+        file
+        for file in files
+        if not any(
+            file == dist or (
+                file.startswith(dist + '.') and
+                file.endswith(_COMPANION_SUFFIXES)
+            )
+            for dist in skipped
+        )
+    ]
+
+
+def upload_settings(
+        repository: Optional[str],
+        repository_url: Optional[str],
+        attestations: Optional[bool],
+        sign: Optional[bool],
+        sign_with: Optional[str],
+        identity: Optional[str],
+        username: Optional[str],
+        password: Optional[str],
+        non_interactive: Optional[bool],
+        comment: Optional[str],
+        skip_existing: Optional[bool],
+        cert: Optional[str],
+        client_cert: Optional[str],
+        verbose: Optional[bool],
+        disable_progress_bar: Optional[bool],
+) -> Dict[str, Any]:
+    """Return the keyword arguments for `twine.settings.Settings`."""
+    # The twine command line takes these from the environment, but its API
+    # does not.
+    repository = repository or os.environ.get('TWINE_REPOSITORY')
+    return dict(
+        repository_name=repository or 'pypi',
+        repository_url=(
+            repository_url or os.environ.get('TWINE_REPOSITORY_URL')
+        ),
+        attestations=bool(attestations),
+        sign=bool(sign),
+        sign_with=sign_with or 'gpg',
+        identity=identity,
+        username=username or os.environ.get('TWINE_USERNAME'),
+        password=password or os.environ.get('TWINE_PASSWORD'),
+        non_interactive=bool(
+            non_interactive or os.environ.get('TWINE_NON_INTERACTIVE')
+        ),
+        comment=comment,
+        skip_existing=bool(skip_existing),
+        cacert=cert or os.environ.get('TWINE_CERT'),
+        client_cert=client_cert,
+        verbose=bool(verbose),
+        disable_progress_bar=bool(disable_progress_bar),
+    )
+
+
 def upload_project(
         repository: Optional[str],
         repository_url: Optional[str],
@@ -28,8 +287,56 @@ def upload_project(
         verbose: Optional[bool],
         disable_progress_bar: Optional[bool],
         *files: str,
+        jobs: int = 1,
+        index_url: Optional[str] = None,
 ) -> None:
-    """Build the project."""
+    """Upload the files, which may be globs."""
+    files = tuple(find_dists(files))
+    settings = upload_settings(
+        repository,
+        repository_url,
+        attestations,
+        sign,
+        sign_with,
+        identity,
+        username,
+        password,
+        non_interactive,
+        comment,
+        skip_existing,
+        cert,
+        client_cert,
+        verbose,
+        disable_progress_bar,
+    )
+
+    if skip_existing:
+        files = tuple(_skip_uploaded(
+            files,
+            index_url or find_index_url(
+                settings['repository_name'],
+                settings['repository_url']
+            ),
+            settings['cacert']
+        ))
+        if len(files) == 0:
+            click.echo("Nothing to upload")
+            return
+
+    if running.get_backend() == 'in-process':
+        # Signatures and attestations are matched to their files by twine.
+        if (
+                jobs > 1 and
+                len(files) > 1 and
+                not sign and
+                not attestations and
+                not any(file.endswith(_COMPANION_SUFFIXES) for file in files)
+        ):
+            upload_files(files, jobs, **settings)
+        else:
+            running.twine_upload(files, **settings)
+        return
+
     args: List[str] = []
     if repository is not None:
         args += ["--repository", repository]
@@ -0,0 +1,182 @@
+"""Code for creating virtual environments from cached templates"""
+
+from hashlib import sha256
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from . import timings
+from .paths import make_venv_bin, user_cache_dir
+
+# How often a template is refreshed with the latest pip.
+TEMPLATE_MAX_AGE = 24 * 60 * 60
+
+# Written to a template when it is complete.
+_MARKER = '.psycho-template'
+
+
+def _templates_dir(python: str) -> Path:
+    python = os.path.realpath(shutil.which(python) or python)
+    stat = os.stat(python)
+    key = sha256(
+        f"{python}:{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8')
+    ).hexdigest()[:16]
+    return user_cache_dir() / 'venv-templates' / key
+
+
+def _generations(templates: Path) -> List[Path]:
+    # The complete templates, newest first.
+    if not templates.is_dir():
+        return []
+    return sorted(
+        (
+            path
+            for path in templates.iterdir()
+            if (path / '.venv' / _MARKER).exists()
+        ),
+        key=lambda path: path.name,
+        reverse=True
+    )
+
+
+def create_template(python: str, quiet: bool = False) -> Path:
+    """Create a new template venv for the interpreter, with the latest pip.
+
+    Older templates for the interpreter are removed.
+    """
+    templates = _templates_dir(python)
+    generation = templates / f"{time.time_ns()}-{os.getpid()}"
+    # The venv is called ".venv" so its prompt matches the clones.
+    template = generation / '.venv'
+    output = subprocess.DEVNULL if quiet else None
+    try:
+        timings.check_call(
+            [python, '-m', 'venv', str(template)],
+            stdout=output,
+            stderr=output
+        )
+        timings.check_call(
+            [
+                str(make_venv_bin(template) / 'python'),
+                '-m', 'pip', 'install', '--upgrade', 'pip'
+            ],
+            stdout=output,
+            stderr=output
+        )
+    except BaseException:
+        shutil.rmtree(generation, ignore_errors=True)
+        raise
+    (template / _MARKER).write_text(str(time.time()), encoding='utf-8')
+
+    for old in templates.iterdir():
+        if old != generation:
+            shutil.rmtree(old, ignore_errors=True)
+    return template
+
+
+def _refresh_in_background(python: str, template: Path) -> None:
+    # Claim the refresh, so other processes do not start one.
+    os.utime(template / _MARKER)
+    subprocess.Popen(
+        [
+            sys.executable,
+            '-c',
+            'import sys; from psycho.venvs import create_template; '
+            'create_template(sys.argv[1], quiet=True)',
+            python
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def find_template(python: str) -> Optional[Path]:
+    """Return the newest template venv for the interpreter.
+
+    A template which is more than a day old is refreshed in the background.
+    """
+    generations = _generations(_templates_dir(python))
+    if not generations:
+        return None
+    template = generations[0] / '.venv'
+    age = time.time() - os.path.getmtime(template / _MARKER)
+    if age > TEMPLATE_MAX_AGE:
+        _refresh_in_background(python, template)
+    return template
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _fix_up(source: str, target: str, old: bytes, new: bytes) -> bool:
+    # Copy a text file with the template path replaced.
+    with open(source, 'rb') as fp:
+        content = fp.read()
+    if old not in content:
+        return False
+    try:
+        content.decode('utf-8')
+    except UnicodeDecodeError:
+        # A binary launcher cannot be fixed up, so it is left out.
+        return True
+    with open(target, 'wb') as fp:
+        fp.write(content.replace(old, new))
+    shutil.copymode(source, target)
+    return True
+
+
+def clone_venv(template: Path, venv: Path) -> None:
+    """Clone a template venv.
+
+    Files are hard linked where possible. The activation scripts, the script
+    shebangs and pyvenv.cfg are rewritten with the path of the new venv.
+    """
+    old = os.fsencode(str(template))
+    new = os.fsencode(str(venv.absolute()))
+    fixed = {str(make_venv_bin(template)), str(template)}
+    for directory, dirs, files in os.walk(template):
+        target_dir = os.path.join(venv, os.path.relpath(directory, template))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in dirs + files:
+            source = os.path.join(directory, name)
+            target = os.path.join(target_dir, name)
+            if os.path.islink(source):
+                os.symlink(os.readlink(source), target)
+                if name in dirs:
+                    dirs.remove(name)
+            elif name in files and name != _MARKER:
+                if directory in fixed and _fix_up(source, target, old, new):
+                    continue
+                _link_or_copy(source, target)
+
+
+def create_venv(venv: Path, python: str) -> None:
+    """Create a venv with the latest pip by cloning a cached template.
+
+    If a clone fails, for example while the template is being replaced, the
+    venv is created from scratch.
+    """
+    template = find_template(python)
+    if template is None:
+        template = create_template(python)
+    try:
+        clone_venv(template, venv)
+    except OSError:
+        shutil.rmtree(venv, ignore_errors=True)
+        timings.check_call([python, '-m', 'venv', str(venv)])
+        timings.check_call(
+            [
+                str(make_venv_bin(venv) / 'python'),
+                '-m', 'pip', 'install', '--upgrade', 'pip'
+            ]
+        )
@@ -0,0 +1,86 @@
+"""Code for the project wheelhouse"""
+
+from pathlib import Path
+from typing import List, Optional
+
+from . import running
+from .environment import environment_tag
+from .projects import load_pyproject, read_dependencies
+from .writing import make_dir
+
+
+def wheelhouse_path(project_path: Path) -> Path:
+    """Return the wheelhouse directory for the active environment.
+
+    Wheels are kept in the project directory, keyed by the interpreter and
+    platform tag.
+    """
+    return project_path.parent / '.psycho' / 'wheelhouse' / environment_tag()
+
+
+def wheelhouse_args(
+        project_path: Path,
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+        offline: Optional[bool] = None,
+) -> List[str]:
+    """Return the pip arguments for the package index.
+
+    When the project has a wheelhouse, pip finds wheels in it as well as the
+    index. Offline, pip only installs from the wheelhouse.
+    """
+    args: List[str] = []
+    if offline:
+        args += ['--no-index']
+    else:
+        if index_url:
+            args += ['--index-url', index_url]
+        if extra_index_url:
+            args += ['--extra-index-url', extra_index_url]
+
+    wheelhouse = wheelhouse_path(project_path)
+    if wheelhouse.is_dir():
+        args += ['--find-links', str(wheelhouse)]
+    return args
+
+
+def fill_wheelhouse(
+        project_path: Path,
+        allow_prerelease: Optional[bool],
+        index_url: Optional[str],
+        extra_index_url: Optional[str],
+) -> Path:
+    """Download or build wheels for every project requirement.
+
+    This includes every optional group, and the build system requirements,
+    so the project can be installed as editable without an index.
+    """
+    pyproject = load_pyproject(project_path)
+    dependencies, optional_dependencies = read_dependencies(pyproject)
+    requirements = [
+        *dependencies,
+        *(dep for deps in optional_dependencies.values() for dep in deps),
+        *(str(req) for req in pyproject.get(
+            'build-system', {}).get('requires', []))
+    ]
+
+    wheelhouse = wheelhouse_path(project_path)
+    if len(requirements) == 0:
+        return wheelhouse
+
+    args: List[str] = []
+    if allow_prerelease:
+        args += ['--pre']
+    if index_url:
+        args += ['--index-url', index_url]
+    if extra_index_url:
+        args += ['--extra-index-url', extra_index_url]
+
+    make_dir(wheelhouse)
+    running.pip(
+        'wheel',
+        '--wheel-dir', str(wheelhouse),
+        *args,
+        *requirements
+    )
+    return wheelhouse
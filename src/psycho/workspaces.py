@@ -0,0 +1,184 @@
+"""Code for workspaces of many projects"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import click
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+from . import timings
+from .building import build_project
+from .projects import load_pyproject, read_dependencies
+
+# Directories which are never searched for projects.
+_IGNORED_DIRS = frozenset((
+    'build', 'dist', 'node_modules', '__pycache__', 'venv', 'env'
+))
+
+
+def discover_projects(root: Path) -> Dict[str, Path]:
+    """Find the projects under a root directory, keyed by canonical name."""
+    projects: Dict[str, Path] = {}
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(
+            name
+            for name in dirs
+            if not name.startswith('.') and
+            name not in _IGNORED_DIRS and
+            not os.path.exists(os.path.join(directory, name, 'pyvenv.cfg'))
+        )
+        if 'pyproject.toml' not in files:
+            continue
+        pyproject = load_pyproject(Path(directory) / 'pyproject.toml')
+        name = pyproject.get('project', {}).get('name')
+        if name is None:
+            continue
+        name = canonicalize_name(str(name))
+        if name in projects:
+            raise ValueError(
+                f"Project {name} is in {projects[name]} and {directory}"
+            )
+        projects[name] = Path(directory)
+    return projects
+
+
+def _names(requirements: List[str]) -> Set[str]:
+    names: Set[str] = set()
+    for requirement in requirements:
+        try:
+            names.add(canonicalize_name(Requirement(requirement).name))
+        except InvalidRequirement:
+            pass
+    return names
+
+
+def dependency_graph(projects: Dict[str, Path]) -> Dict[str, Set[str]]:
+    """Return the workspace projects each project depends on.
+
+    Both the required dependencies and the build system requirements count.
+    """
+    graph: Dict[str, Set[str]] = {}
+    for name, directory in projects.items():
+        pyproject = load_pyproject(directory / 'pyproject.toml')
+        dependencies, _ = read_dependencies(pyproject)
+        requires = [
+            str(req)
+            for req in pyproject.get('build-system', {}).get('requires', [])
+        ]
+        graph[name] = (_names(dependencies) | _names(requires)) & set(projects)
+        graph[name].discard(name)
+    return graph
+
+
+def build_order(graph: Dict[str, Set[str]]) -> List[str]:
+    """Return the projects in an order where dependencies come first."""
+    order: List[str] = []
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(
+                f"Dependency cycle between {', '.join(sorted(remaining))}"
+            )
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        order += ready
+    return order
+
+
+def _build_member(
+        directory: str,
+        sdist: Optional[bool],
+        wheel: Optional[bool],
+        skip_dependency_check: Optional[bool],
+        no_isolation: Optional[bool],
+        config_settings: Dict[str, str],
+        outdir: str,
+        installer: Optional[str],
+        force: Optional[bool],
+) -> None:
+    # Each worker is its own process, so it can change directory.
+    os.chdir(directory)
+    build_project(
+        False,
+        None,
+        sdist,
+        wheel,
+        skip_dependency_check,
+        no_isolation,
+        config_settings,
+        outdir,
+        installer,
+        force
+    )
+
+
+def build_workspace(
+        root: Path,
+        sdist: Optional[bool],
+        wheel: Optional[bool],
+        skip_dependency_check: Optional[bool],
+        no_isolation: Optional[bool],
+        config_settings: Dict[str, str],
+        outdir: Optional[str],
+        installer: Optional[str],
+        force: Optional[bool],
+        jobs: Optional[int],
+) -> None:
+    """Build every project in the workspace.
+
+    Projects are built concurrently, each as soon as the workspace projects it
+    depends on are built. Artifacts go to a shared directory, which pip can
+    find packages in, so build requirements can come from the workspace.
+    """
+    projects = discover_projects(root)
+    graph = dependency_graph(projects)
+    build_order(graph)  # Fail early on a cycle.
+
+    artifacts = Path(outdir) if outdir is not None else root / 'dist'
+    artifacts = artifacts.resolve()
+    artifacts.mkdir(parents=True, exist_ok=True)
+    find_links = os.environ.get('PIP_FIND_LINKS')
+    os.environ['PIP_FIND_LINKS'] = ' '.join(
+        filter(None, (find_links, str(artifacts)))
+    )
+
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    running: Dict['Future[None]', str] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while remaining or running:
+            ready = sorted(
+                name
+                for name, deps in remaining.items()
+                if not deps
+            )
+            for name in ready:
+                del remaining[name]
+                future = executor.submit(
+                    timings.recorded,
+                    timings.is_enabled(),
+                    _build_member,
+                    str(projects[name].resolve()),
+                    sdist,
+                    wheel,
+                    skip_dependency_check,
+                    no_isolation,
+                    config_settings,
+                    str(artifacts),
+                    installer,
+                    force
+                )
+                running[future] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                timings.worker_result(future)
+                click.echo(f"Built {name}")
+                for deps in remaining.values():
+                    deps.discard(name)
@@ -0,0 +1,145 @@
+"""Code for writing project files safely"""
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Dict, Iterator, Tuple
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# The locks held by this process, keyed by lock file, with their depth.
+_held: Dict[str, Tuple[int, int]] = {}
+_held_lock = threading.RLock()
+
+
+def lock_path(path: Path) -> Path:
+    """Return the lock file which guards a project file."""
+    return path.parent / '.psycho' / f"{path.name}.lock"
+
+
+def make_dir(path: Path) -> None:
+    """Create a directory and its parents.
+
+    Any `.psycho` directory in the path ignores itself, so git never picks up
+    the locks and caches kept in it, whatever the project's .gitignore says.
+    """
+    os.makedirs(path, exist_ok=True)
+    for directory in (path, *path.parents):
+        if directory.name != '.psycho':
+            continue
+        gitignore = directory / '.gitignore'
+        if not gitignore.exists():
+            with open(gitignore, 'wt', encoding='utf-8') as fp:
+                fp.write('# Created by psycho\n*\n')
+
+
+def _acquire(fd: int, shared: bool) -> None:
+    if os.name == 'nt':
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds, so try again.
+                pass
+    else:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def _release(fd: int) -> None:
+    if os.name == 'nt':
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked(path: Path, shared: bool = False) -> Iterator[None]:
+    """Hold an exclusive lock on a project file, across processes.
+
+    The lock is reentrant within a process, so functions which take it can
+    call each other. A shared lock only excludes exclusive locks, and is not
+    reentrant. Windows has no shared locks, so there it is exclusive.
+    """
+    key = os.path.abspath(lock_path(path))
+    if shared:
+        make_dir(Path(key).parent)
+        fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _acquire(fd, True)
+            try:
+                yield
+            finally:
+                _release(fd)
+        finally:
+            os.close(fd)
+        return
+
+    with _held_lock:
+        if key in _held:
+            fd, depth = _held[key]
+            _held[key] = (fd, depth + 1)
+        else:
+            make_dir(Path(key).parent)
+            fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _acquire(fd, False)
+            except BaseException:
+                os.close(fd)
+                raise
+            _held[key] = (fd, 1)
+    try:
+        yield
+    finally:
+        with _held_lock:
+            fd, depth = _held[key]
+            if depth > 1:
+                _held[key] = (fd, depth - 1)
+            else:
+                del _held[key]
+                _release(fd)
+                os.close(fd)
+
+
+def write_file(path: Path, content: str) -> bool:
+    """Replace a text file atomically, unless it already has the content.
+
+    The content is written to a temporary file in the same directory, which
+    then replaces the file, so readers see either the old or new file. If the
+    content is unchanged the file is not touched, and its mtime is kept.
+    Returns True if the file was written.
+    """
+    try:
+        with open(path, 'rt', encoding='utf-8') as fp:
+            if fp.read() == content:
+                return False
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        # A new file gets the usual permissions, rather than mkstemp's.
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=f".{path.name}.",
+        suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wt', encoding='utf-8') as fp:
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
@@ -0,0 +1,163 @@
+"""Fixtures for projects which install from local wheels, without an index."""
+
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import Dict, Optional, Sequence
+import zipfile
+
+import pytest
+
+# A backend with no requirements, so pip needs no index to install the
+# project. The editable wheel only has the metadata.
+BACKEND = '''
+import os
+import zipfile
+
+
+def _wheel(directory):
+    name = 'demo-0.1-py3-none-any.whl'
+    with zipfile.ZipFile(os.path.join(directory, name), 'w') as archive:
+        archive.writestr(
+            'demo-0.1.dist-info/METADATA',
+            'Metadata-Version: 2.1\\nName: demo\\nVersion: 0.1\\n'
+        )
+        archive.writestr(
+            'demo-0.1.dist-info/WHEEL',
+            'Wheel-Version: 1.0\\nRoot-Is-Purelib: true\\nTag: py3-none-any\\n'
+        )
+        archive.writestr('demo-0.1.dist-info/RECORD', '')
+    return name
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    return _wheel(wheel_directory)
+
+
+def build_editable(wheel_directory, config_settings=None, metadata_directory=None):
+    return _wheel(wheel_directory)
+'''
+
+
+def _record_hash(data: bytes) -> str:
+    digest = urlsafe_b64encode(sha256(data).digest()).rstrip(b'=')
+    return 'sha256=' + digest.decode('ascii')
+
+
+def make_wheel(
+        directory: Path,
+        name: str,
+        version: str,
+        requires: Sequence[str] = (),
+        files: Optional[Dict[str, str]] = None,
+) -> Path:
+    """Write a pure Python wheel with a module named after the distribution."""
+    module = name.replace('-', '_')
+    dist_info = f"{module}-{version}.dist-info"
+    members = {
+        f"{module}.py": f"VERSION = {version!r}\n".encode('utf-8'),
+        **{
+            path: content.encode('utf-8')
+            for path, content in (files or {}).items()
+        },
+        f"{dist_info}/METADATA": (
+            "Metadata-Version: 2.1\n"
+            f"Name: {name}\n"
+            f"Version: {version}\n" +
+            ''.join(f"Requires-Dist: {req}\n" for req in requires)
+        ).encode('utf-8'),
+        f"{dist_info}/WHEEL": (
+            "Wheel-Version: 1.0\n"
+            "Root-Is-Purelib: true\n"
+            "Tag: py3-none-any\n"
+        ).encode('utf-8'),
+    }
+    record = ''.join(
+        f"{path},{_record_hash(data)},{len(data)}\n"
+        for path, data in members.items()
+    ) + f"{dist_info}/RECORD,,\n"
+    members[f"{dist_info}/RECORD"] = record.encode('utf-8')
+
+    wheel = directory / f"{module}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, 'w') as archive:
+        for path, data in members.items():
+            archive.writestr(path, data)
+    return wheel
+
+
+@pytest.fixture
+def wheels(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A directory of wheels which pip finds instead of an index.
+
+    alpha requires beta, and gamma requires nothing.
+    """
+    path = tmp_path / 'wheels'
+    path.mkdir()
+    make_wheel(path, 'alpha', '1.0', ['beta'])
+    make_wheel(path, 'beta', '1.0')
+    make_wheel(path, 'gamma', '1.0')
+    monkeypatch.setenv('PIP_NO_INDEX', '1')
+    monkeypatch.setenv('PIP_FIND_LINKS', str(path))
+    monkeypatch.setenv('PIP_DISABLE_PIP_VERSION_CHECK', '1')
+    return path
+
+
+def write_project(path: Path, dependencies: Sequence[str]) -> Path:
+    """Write a project with an in-tree backend, returning its project file."""
+    path.mkdir(parents=True, exist_ok=True)
+    (path / 'backend.py').write_text(BACKEND, encoding='utf-8')
+    project_file = path / 'pyproject.toml'
+    project_file.write_text(
+        '[build-system]\n'
+        'requires = []\n'
+        'build-backend = "backend"\n'
+        'backend-path = ["."]\n'
+        '\n'
+        '[project]\n'
+        'name = "demo"\n'
+        'version = "0.1"\n'
+        f"dependencies = [{', '.join(repr(dep) for dep in dependencies)}]\n",
+        encoding='utf-8'
+    )
+    return project_file
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """The project file of a project which depends on alpha."""
+    path = tmp_path / 'demo'
+    project_file = write_project(path, ['alpha'])
+    monkeypatch.chdir(path)
+    monkeypatch.setenv('PSYCHO_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.delenv('PSYCHO_BACKEND', raising=False)
+    return project_file
+
+
+@pytest.fixture
+def venv(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """An active virtual environment with pip."""
+    path = tmp_path / 'venv'
+    subprocess.check_call(
+        [sys.executable, '-m', 'venv', str(path)],
+        stdout=subprocess.DEVNULL
+    )
+    monkeypatch.setenv('VIRTUAL_ENV', str(path))
+    return path
+
+
+def installed(venv: Path) -> Dict[str, str]:
+    """Return the versions of the distributions installed in a venv."""
+    output = subprocess.check_output(
+        [
+            str(venv / 'bin' / 'python'), '-c',
+            'import importlib.metadata as m\n'
+            'for d in m.distributions():\n'
+            '    print(d.metadata["Name"], d.version)\n'
+        ],
+        encoding='utf-8',
+        env={**os.environ, 'PYTHONPATH': ''}
+    )
+    return dict(line.split() for line in output.splitlines())
@@ -0,0 +1,78 @@
+"""Tests for building projects."""
+
+from pathlib import Path
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from psycho import building
+
+# A backend with no requirements, so building needs no index. The wheel
+# records the interpreter it was built with.
+BACKEND = '''
+import os
+import sys
+import zipfile
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    name = 'demo-0.1-py3-none-any.whl'
+    with zipfile.ZipFile(os.path.join(wheel_directory, name), 'w') as archive:
+        archive.writestr('demo.py', sys.executable)
+        archive.writestr(
+            'demo-0.1.dist-info/METADATA',
+            'Metadata-Version: 2.1\\nName: demo\\nVersion: 0.1\\n'
+        )
+        archive.writestr('demo-0.1.dist-info/WHEEL', 'Wheel-Version: 1.0\\n')
+        archive.writestr('demo-0.1.dist-info/RECORD', '')
+    return name
+'''
+
+PYPROJECT = '''
+[build-system]
+requires = []
+build-backend = "backend"
+backend-path = ["."]
+
+[project]
+name = "demo"
+version = "0.1"
+'''
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A project with an in-tree backend, and the caches in the test."""
+    path = tmp_path / 'demo'
+    path.mkdir()
+    (path / 'pyproject.toml').write_text(PYPROJECT, encoding='utf-8')
+    (path / 'backend.py').write_text(BACKEND, encoding='utf-8')
+    monkeypatch.chdir(path)
+    monkeypatch.setenv('PSYCHO_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('PIP_NO_INDEX', '1')
+    monkeypatch.delenv('PSYCHO_BACKEND', raising=False)
+    return path
+
+
+def test_isolated_build_for_another_interpreter(
+        project: Path,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # The venv has no build package, so the build must run in process, in a
+    # build environment created from the venv's interpreter.
+    venv = tmp_path / 'venv'
+    subprocess.check_call([sys.executable, '-m', 'venv', '--without-pip', venv])
+    monkeypatch.setenv('VIRTUAL_ENV', str(venv))
+    assert building.can_build_in_process(False, False, False)
+
+    building.build_project(
+        False, None, None, True, None, None, {}, 'dist', None, force=True
+    )
+
+    wheel = project / 'dist' / 'demo-0.1-py3-none-any.whl'
+    with zipfile.ZipFile(wheel) as archive:
+        python = archive.read('demo.py').decode('utf-8')
+    assert python.startswith(str(tmp_path / 'cache' / 'build-envs'))
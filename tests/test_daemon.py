@@ -0,0 +1,26 @@
+"""Tests for forwarding commands to the daemon."""
+
+from typing import List, Optional, Sequence
+import sys
+
+import pytest
+
+from psycho import daemon
+from psycho.commands import cli
+
+
+def test_forward_the_arguments_given(monkeypatch: pytest.MonkeyPatch) -> None:
+    forwarded: List[List[str]] = []
+
+    def forward(argv: Sequence[str]) -> Optional[int]:
+        forwarded.append(list(argv))
+        return 0
+
+    monkeypatch.setattr(daemon, 'forward', forward)
+    monkeypatch.setattr(sys, 'argv', ['pytest', '--unrelated'])
+
+    with pytest.raises(SystemExit) as error:
+        cli.main(['--timings', 'sync', '--exact'], prog_name='psycho')
+
+    assert error.value.code == 0
+    assert forwarded == [['--timings', 'sync', '--exact']]
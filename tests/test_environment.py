@@ -0,0 +1,47 @@
+"""Tests for describing the active environment."""
+
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+from psycho import environment
+
+# The description an interpreter for another version and platform gives.
+DESCRIPTION = {
+    'markers': {
+        'implementation_name': 'cpython',
+        'implementation_version': '3.99.1',
+        'os_name': 'posix',
+        'platform_machine': 'riscv64',
+        'platform_release': '',
+        'platform_system': 'Linux',
+        'platform_version': '',
+        'python_full_version': '3.99.1',
+        'platform_python_implementation': 'CPython',
+        'python_version': '3.99',
+        'sys_platform': 'linux',
+    },
+    'platform': 'linux-riscv64',
+}
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="uses a shell script")
+def test_describe_the_active_interpreter(
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    venv = tmp_path / 'venv'
+    python = venv / 'bin' / 'python'
+    python.parent.mkdir(parents=True)
+    python.write_text(
+        f"#!/bin/sh\necho '{json.dumps(DESCRIPTION)}'\n",
+        encoding='utf-8'
+    )
+    python.chmod(0o755)
+    monkeypatch.setenv('VIRTUAL_ENV', str(venv))
+
+    assert environment.python_version() == '3.99.1'
+    assert environment.marker_environment()['platform_machine'] == 'riscv64'
+    assert environment.environment_tag() == 'cp399-linux_riscv64'
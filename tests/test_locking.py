@@ -0,0 +1,38 @@
+"""Tests for locking the project dependencies."""
+
+from pathlib import Path
+
+import pytest
+
+from psycho import locking
+
+from conftest import installed, make_wheel
+
+
+def test_refuse_a_lock_for_another_environment(
+        project: Path,
+        wheels: Path,
+        venv: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    locking.lock_project(project, None, None, None)
+    monkeypatch.setattr(locking, 'environment_tag', lambda: 'cp27-win32')
+
+    with pytest.raises(ValueError, match='locked for cp3.* cp27-win32'):
+        locking.install_locked(project, None, [])
+
+
+def test_install_what_was_locked(
+        project: Path,
+        wheels: Path,
+        venv: Path
+) -> None:
+    locking.lock_project(project, None, None, None)
+    make_wheel(wheels, 'beta', '2.0')
+
+    locking.install_locked(project, None, [])
+
+    versions = installed(venv)
+    assert versions['alpha'] == '1.0'
+    assert versions['beta'] == '1.0'
+    assert versions['demo'] == '0.1'
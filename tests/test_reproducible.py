@@ -0,0 +1,105 @@
+"""Tests for reproducible builds."""
+
+from pathlib import Path
+
+import pytest
+
+from psycho import building
+from psycho.indexing import file_digest
+
+# A backend whose archives differ on every build: the members are shuffled,
+# and stamped with the time of the build.
+BACKEND = '''
+import io
+import os
+import random
+import tarfile
+import time
+import zipfile
+
+METADATA = 'Metadata-Version: 2.1\\nName: demo\\nVersion: 0.1\\n'
+
+
+def build_sdist(sdist_directory, config_settings=None):
+    name = 'demo-0.1.tar.gz'
+    members = {
+        'PKG-INFO': METADATA,
+        'pyproject.toml': open('pyproject.toml').read(),
+        'backend.py': open('backend.py').read(),
+        'demo.py': '',
+    }
+    items = list(members.items())
+    random.shuffle(items)
+    path = os.path.join(sdist_directory, name)
+    with tarfile.open(path, 'w:gz') as archive:
+        for member, content in items:
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(f'demo-0.1/{member}')
+            info.size = len(data)
+            info.mtime = time.time() - random.randint(0, 10000)
+            info.uid = random.randint(1000, 2000)
+            archive.addfile(info, io.BytesIO(data))
+    return name
+
+
+def build_wheel(wheel_directory, config_settings=None, metadata_directory=None):
+    name = 'demo-0.1-py3-none-any.whl'
+    members = {
+        'demo.py': '',
+        'demo-0.1.dist-info/METADATA': METADATA,
+        'demo-0.1.dist-info/WHEEL': 'Wheel-Version: 1.0\\n',
+    }
+    items = list(members.items())
+    random.shuffle(items)
+    with zipfile.ZipFile(os.path.join(wheel_directory, name), 'w') as archive:
+        for member, content in items:
+            stamp = time.localtime(time.time() - random.randint(0, 10000))
+            archive.writestr(zipfile.ZipInfo(member, stamp[:6]), content)
+        archive.writestr('demo-0.1.dist-info/RECORD', '')
+    return name
+'''
+
+PYPROJECT = '''
+[build-system]
+requires = []
+build-backend = "backend"
+backend-path = ["."]
+
+[project]
+name = "demo"
+version = "0.1"
+'''
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A project with an in-tree backend, and the caches in the test."""
+    path = tmp_path / 'demo'
+    path.mkdir()
+    (path / 'pyproject.toml').write_text(PYPROJECT, encoding='utf-8')
+    (path / 'backend.py').write_text(BACKEND, encoding='utf-8')
+    monkeypatch.chdir(path)
+    monkeypatch.setenv('PSYCHO_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('PIP_NO_INDEX', '1')
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    monkeypatch.delenv('PSYCHO_BACKEND', raising=False)
+    return path
+
+
+def test_rebuilds_are_identical(project: Path) -> None:
+    digests = []
+    for outdir in ('first', 'second'):
+        building.build_project(
+            False, None, None, None, None, None, {}, outdir, None,
+            force=True,
+            reproducible=True
+        )
+        digests.append({
+            file.name: file_digest(str(file))
+            for file in (project / outdir).iterdir()
+        })
+
+    assert sorted(digests[0]) == [
+        'demo-0.1-py3-none-any.whl', 'demo-0.1.tar.gz'
+    ]
+    assert digests[0] == digests[1]
@@ -0,0 +1,86 @@
+"""Tests for the startup time of the command line."""
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+import pytest
+
+import psycho
+
+# The most time `psycho --help` may take beyond starting the interpreter, in
+# seconds.
+STARTUP_BUDGET = 0.1
+
+# The number of times each command is timed, taking the fastest.
+REPEATS = 5
+
+# Modules which must only be imported by the commands which use them.
+LAZY_MODULES = ('pkg_resources', 'build', 'twine', 'tomlkit', 'packaging')
+
+# Modules for commands which only read the project file, so must not import
+# tomlkit, which is only needed to write it.
+READ_ONLY_MODULES = (
+    'psycho.dependencies',
+    'psycho.locking',
+    'psycho.resolving',
+    'psycho.syncing',
+)
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    src = str(Path(psycho.__file__).parent.parent)
+    pythonpath = os.environ.get('PYTHONPATH')
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([src, pythonpath]) if pythonpath else src
+    }
+    return subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    )
+
+
+def _fastest(*args: str) -> float:
+    elapsed = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        _run(*args)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def test_help_within_budget() -> None:
+    """psycho --help takes little longer than starting the interpreter."""
+    _run('-c', 'import psycho')  # Warm the bytecode cache.
+    baseline = _fastest('-c', 'pass')
+    elapsed = _fastest('-c', 'from psycho import cli; cli()', '--help')
+    assert elapsed - baseline < STARTUP_BUDGET, \
+        f"psycho --help took {elapsed - baseline:.3f}s more than python"
+
+
+def test_commands_are_lazy() -> None:
+    """Importing the command line does not import the command modules."""
+    result = _run(
+        '-c',
+        'import sys, psycho; print("\\n".join(sys.modules))'
+    )
+    imported = set(result.stdout.split())
+    for name in LAZY_MODULES:
+        assert name not in imported, f"{name} is imported at startup"
+
+
+@pytest.mark.parametrize('module', READ_ONLY_MODULES)
+def test_reading_does_not_import_tomlkit(module: str) -> None:
+    """The modules which read the project file do not import tomlkit."""
+    result = _run(
+        '-c',
+        f'import sys, {module}; print("\\n".join(sys.modules))'
+    )
+    assert 'tomlkit' not in result.stdout.split(), \
+        f"{module} imports tomlkit"
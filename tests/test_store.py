@@ -0,0 +1,86 @@
+"""Tests for installing wheels from the store."""
+
+import os
+from pathlib import Path
+from typing import Dict
+import zipfile
+
+import pytest
+
+from psycho import running, store
+from psycho.indexing import file_digest
+
+from conftest import installed
+
+DIST_INFO = 'demo-0.1.dist-info'
+
+
+def make_wheel(path: Path, members: Dict[str, str]) -> str:
+    """Write a wheel with the members, and the metadata it needs."""
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr(
+            f"{DIST_INFO}/METADATA",
+            "Metadata-Version: 2.1\nName: demo\nVersion: 0.1\n"
+        )
+        archive.writestr(f"{DIST_INFO}/WHEEL", "Wheel-Version: 1.0\n")
+        archive.writestr(f"{DIST_INFO}/RECORD", "")
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep the store in the test directory."""
+    path = tmp_path / 'store'
+    monkeypatch.setenv('PSYCHO_STORE_DIR', str(path))
+    return path
+
+
+@pytest.mark.parametrize(
+    'member',
+    ['../../../evil.py', '/tmp/psycho-test-evil.py']
+)
+def test_refuse_members_outside_the_entry(tmp_path: Path, member: str) -> None:
+    wheel = make_wheel(tmp_path / 'demo-0.1-py3-none-any.whl', {
+        'demo.py': '',
+        member: 'evil',
+    })
+
+    with pytest.raises(ValueError, match='outside'):
+        store.add_to_store(wheel, file_digest(wheel))
+
+    assert not list(tmp_path.rglob('*evil.py'))
+    assert not Path('/tmp/psycho-test-evil.py').exists()
+
+
+def test_refuse_unknown_schemes(tmp_path: Path) -> None:
+    wheel = make_wheel(tmp_path / 'demo-0.1-py3-none-any.whl', {
+        'demo-0.1.data/elsewhere/demo.py': '',
+    })
+    entry = store.add_to_store(wheel, file_digest(wheel))
+    purelib = tmp_path / 'venv' / 'lib' / 'site-packages'
+
+    with pytest.raises(ValueError, match='Unknown scheme elsewhere'):
+        store.link_distribution(entry, tmp_path / 'venv', purelib, True)
+
+
+def test_link_requirements_into_the_venv(
+        project: Path,
+        wheels: Path,
+        venv: Path,
+        store_dir: Path
+) -> None:
+    store.link_requirements(['alpha'], [])
+
+    assert installed(venv).get('alpha') == '1.0'
+    assert installed(venv).get('beta') == '1.0'
+    module = next(venv.glob('lib/python*/site-packages/alpha.py'))
+    stored = next(store_dir.rglob('alpha.py'))
+    assert os.path.samefile(module, stored)
+    assert (module.parent / 'alpha-1.0.dist-info' / 'RECORD').is_file()
+
+    running.pip('uninstall', '-y', 'alpha')
+
+    assert not module.exists()
+    assert stored.exists()
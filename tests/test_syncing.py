@@ -0,0 +1,24 @@
+"""Tests for syncing the environment with the project dependencies."""
+
+from pathlib import Path
+
+from psycho import running, syncing
+
+from conftest import installed
+
+
+def test_sync_exact_removes_extraneous_distributions(
+        project: Path,
+        wheels: Path,
+        venv: Path
+) -> None:
+    running.pip('install', 'gamma')
+
+    assert syncing.sync_project(project, [], True, None, None, None)
+
+    versions = installed(venv)
+    assert versions['alpha'] == '1.0'
+    assert versions['beta'] == '1.0'
+    assert 'gamma' not in versions
+    assert 'pip' in versions
+    assert not syncing.sync_project(project, [], True, None, None, None)
@@ -0,0 +1,175 @@
+"""Tests for uploading against a local stand-in for a package repository."""
+
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+from pathlib import Path
+import tarfile
+import threading
+from typing import Dict, Iterator, List
+import zipfile
+
+import pytest
+
+from psycho import uploading
+from psycho.indexing import file_digest
+
+METADATA = "Metadata-Version: 2.1\nName: demo\nVersion: 0.1\n"
+
+
+class Repository:
+    """A stand-in for the legacy upload API."""
+
+    def __init__(self) -> None:
+        self.uploaded: List[str] = []
+        # The sha256 digests of the files the simple index lists.
+        self.index: Dict[str, str] = {}
+        # The number of server errors to return for a file before accepting it.
+        self.failures: Dict[str, int] = {}
+        self.url = ''
+
+    def handle(self, filename: str) -> int:
+        if self.failures.get(filename, 0) > 0:
+            self.failures[filename] -= 1
+            return 503
+        self.uploaded.append(filename)
+        return 200
+
+
+@pytest.fixture
+def repository() -> Iterator[Repository]:
+    """Serve a stand-in repository for the duration of a test."""
+    state = Repository()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n"
+                .encode('ascii') + body
+            )
+            filename = next(
+                part.get_filename()
+                for part in message.iter_parts()
+                if part.get_param('name', header='content-disposition')
+                == 'content'
+            )
+            self.send_response(state.handle(filename))
+            self.end_headers()
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            links = ''.join(
+                f'<a href="/files/{name}#sha256={digest}">{name}</a>'
+                for name, digest in state.index.items()
+            )
+            body = f"<html><body>{links}</body></html>".encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    with ThreadingHTTPServer(('127.0.0.1', 0), Handler) as server:
+        state.url = f"http://127.0.0.1:{server.server_address[1]}/legacy/"
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield state
+        server.shutdown()
+
+
+@pytest.fixture
+def dist(tmp_path: Path) -> Path:
+    """Write an sdist and a wheel to a directory."""
+    directory = tmp_path / 'dist'
+    directory.mkdir()
+    with zipfile.ZipFile(directory / 'demo-0.1-py3-none-any.whl', 'w') as whl:
+        whl.writestr('demo/__init__.py', '')
+        whl.writestr('demo-0.1.dist-info/METADATA', METADATA)
+        whl.writestr(
+            'demo-0.1.dist-info/WHEEL',
+            "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+        )
+        whl.writestr('demo-0.1.dist-info/RECORD', '')
+    with tarfile.open(directory / 'demo-0.1.tar.gz', 'w:gz') as tar:
+        for name, text in (('PKG-INFO', METADATA), ('demo/__init__.py', '')):
+            data = text.encode('utf-8')
+            info = tarfile.TarInfo(f"demo-0.1/{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return directory
+
+
+def _upload(repository: Repository, *files: str, **kwargs: object) -> None:
+    uploading.upload_project(
+        None,
+        repository.url,
+        None,
+        None,
+        None,
+        None,
+        'user',
+        'password',
+        True,
+        None,
+        kwargs.pop('skip_existing', None),
+        None,
+        None,
+        None,
+        True,
+        *files,
+        **kwargs  # type: ignore[arg-type]
+    )
+
+
+def test_upload_glob_concurrently(
+        repository: Repository,
+        dist: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Globs are expanded, and every file is uploaded with several workers."""
+    monkeypatch.setenv('PSYCHO_BACKEND', 'in-process')
+    _upload(repository, str(dist / '*.whl'), str(dist / '*.gz'), jobs=2)
+    assert sorted(repository.uploaded) == [
+        'demo-0.1-py3-none-any.whl',
+        'demo-0.1.tar.gz',
+    ]
+
+
+def test_upload_retries_server_errors(
+        repository: Repository,
+        dist: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A file is uploaded again after a server error."""
+    monkeypatch.setenv('PSYCHO_BACKEND', 'in-process')
+    monkeypatch.setattr(uploading.time, 'sleep', lambda seconds: None)
+    repository.failures['demo-0.1.tar.gz'] = 2
+    _upload(repository, str(dist / '*'), jobs=2)
+    assert sorted(repository.uploaded) == [
+        'demo-0.1-py3-none-any.whl',
+        'demo-0.1.tar.gz',
+    ]
+
+
+def test_skip_files_the_index_has(
+        repository: Repository,
+        dist: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        tmp_path: Path
+) -> None:
+    """Files the index has are skipped, with their signatures."""
+    monkeypatch.setenv('PSYCHO_CACHE_DIR', str(tmp_path / 'cache'))
+    wheel = dist / 'demo-0.1-py3-none-any.whl'
+    (dist / f"{wheel.name}.asc").write_text('signature', encoding='utf-8')
+    repository.index[wheel.name] = file_digest(str(wheel))
+    files = uploading._skip_uploaded(  # pylint: disable=protected-access
+        uploading.find_dists([str(dist / '*')]),
+        repository.url.replace('/legacy/', '/simple/'),
+        None
+    )
+    assert files == [str(dist / 'demo-0.1.tar.gz')]
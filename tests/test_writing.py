@@ -0,0 +1,61 @@
+"""Tests for writing project files safely."""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from pathlib import Path
+import subprocess
+
+import pytest
+
+from psycho import building
+from psycho.writing import locked, write_file
+
+# The number of processes which update a file at once, and their updates.
+WRITERS = 4
+UPDATES = 25
+
+
+def test_psycho_dir_ignores_itself(
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.check_call(['git', 'init', '--quiet', str(tmp_path)])
+    monkeypatch.chdir(tmp_path)
+    artifact = tmp_path / 'demo-0.1.tar.gz'
+    artifact.write_bytes(b'')
+
+    building.store_in_cache(building.BUILD_CACHE / 'entry', [artifact])
+
+    entry = tmp_path / '.psycho' / 'build-cache' / 'entry'
+    assert (entry / artifact.name).exists()
+    status = subprocess.check_output(
+        ['git', 'status', '--porcelain', '--untracked-files=all'],
+        encoding='utf-8'
+    )
+    assert status.splitlines() == ['?? demo-0.1.tar.gz']
+
+
+def _increment(path: Path) -> None:
+    for _ in range(UPDATES):
+        with locked(path):
+            count = int(path.read_text(encoding='utf-8'))
+            write_file(path, f"{count + 1}\n")
+
+
+def test_locked_updates_are_not_lost(tmp_path: Path) -> None:
+    path = tmp_path / 'pyproject.toml'
+    path.write_text("0\n", encoding='utf-8')
+
+    with ProcessPoolExecutor(
+            WRITERS,
+            mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        for future in [
+                executor.submit(_increment, path) for _ in range(WRITERS)
+        ]:
+            future.result()
+
+    assert path.read_text(encoding='utf-8') == f"{WRITERS * UPDATES}\n"
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        '.psycho', 'pyproject.toml'
+    ]